@@ -3,19 +3,26 @@ BiaTrack - Calculadora de Traslados para Colombia
 Aplicación Flask que calcula costos de traslados basándose en datos de base de datos
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
-from datetime import datetime
-import sqlite3
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g, has_app_context
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import atexit
+import base64
 import csv
 import io
 import os
 import json
-from typing import Optional, Dict, List
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Tuple
 from data.contractors import CONTRACTORS
 from data.tolls import TOLLS
 from services.geocoding import geocode_city, buscar_ciudad
-from services.routing import calcular_ruta_con_trafico, calcular_ruta_inversa
-from services.toll_calculator import _calcular_peajes
+from services.routing import calcular_ruta_con_trafico, calcular_ruta_ida_y_regreso, route_cache_stats
+from services.http_client import http_stats
+from services.db import ConnectionPool, default_db_file
+from services.polyline import encode_polyline
+from services.toll_calculator import _calcular_peajes, _calcular_peajes_batch, _calcular_peajes_desde_primer_peaje, PreparedRoute, toll_cache_stats
 
 app = Flask(__name__, 
             template_folder='templates',
@@ -25,41 +32,250 @@ app.config['SECRET_KEY'] = 'biatrack-secret-key-2024'
 
 DEFAULT_KM_PER_GALLON = 30  # Valor por defecto para vehículos livianos (Categoría I)
 
+# Desvío máximo (m) al simplificar la geometría de OSRM antes de buscar peajes
+# (el umbral de detección se amplía con este valor)
+ROUTE_SIMPLIFY_TOLERANCE_M = float(os.environ.get('ROUTE_SIMPLIFY_TOLERANCE_M', '10'))
+
+# Formato compacto de /api/calcular_ruta_supply (format=compact): geometrías como
+# polilíneas codificadas con esta precisión por defecto (5 decimales ~ 1 m)
+GEOMETRY_PRECISION = int(os.environ.get('GEOMETRY_PRECISION', '5'))
+
+# Campos requeridos para guardar un viaje (POST /api/trip y /api/trips/bulk)
+TRIP_REQUIRED_FIELDS = [
+    'contractor_name', 'base_label', 'origin_city', 'destination_text',
+    'fuel_type', 'fuel_price_per_gallon_cop', 'km_per_gallon',
+    'one_way_distance_km', 'one_way_eta_minutes',
+    'toll_count_one_way', 'toll_cost_one_way_cop'
+]
+TRIP_FLOAT_FIELDS = ['fuel_price_per_gallon_cop', 'km_per_gallon', 'one_way_distance_km']
+TRIP_INT_FIELDS = ['one_way_eta_minutes', 'toll_count_one_way', 'toll_cost_one_way_cop']
+MAX_BULK_TRIPS = 10000  # Máximo de viajes por request en /api/trips/bulk
+
+TRIPS_PAGE_SIZE = 50  # Viajes por página en / y /api/trips
+MAX_TRIPS_PAGE_SIZE = 500
+
+MAX_BATCH_ROUTES = 1000  # Máximo de rutas por request en /api/peajes/batch
+
+# Hilos para geocoding/routing en paralelo dentro de /api/calcular_ruta_supply
+ROUTE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('ROUTE_WORKERS', '8')),
+    thread_name_prefix='biatrack-ruta'
+)
+
 # Base de datos
 # En Vercel, usar /tmp para escritura; en local usar archivo normal
-DB_FILE = os.environ.get('DB_FILE') or (os.path.join('/tmp', 'biatrack.db') if os.path.exists('/tmp') else 'biatrack.db')
+DB_FILE = default_db_file()
+
+# Conexiones reutilizadas (WAL): cada request toma una del pool y la devuelve al terminar
+DB_POOL = ConnectionPool(DB_FILE)
+atexit.register(DB_POOL.close_all)
+
+@contextmanager
+def db_connection():
+    """
+    Conexión del request actual (la misma para todas las consultas del request,
+    devuelta al pool en el teardown); fuera de un request, una del pool durante el bloque
+    """
+    if not has_app_context():
+        with DB_POOL.connection() as conn:
+            yield conn
+        return
+    conn = g.get('db_conn')
+    if conn is None:
+        conn = g.db_conn = DB_POOL.acquire()
+    yield conn
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        DB_POOL.release(conn)
 
 def init_db():
     """Inicializa la base de datos SQLite"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS trips (
-            id TEXT PRIMARY KEY,
-            created_at TEXT NOT NULL,
-            contractor_name TEXT NOT NULL,
-            base_label TEXT NOT NULL,
-            origin_city TEXT NOT NULL,
-            destination_text TEXT NOT NULL,
-            fuel_type TEXT NOT NULL,
-            fuel_price_per_gallon_cop REAL NOT NULL,
-            km_per_gallon REAL NOT NULL,
-            one_way_distance_km REAL NOT NULL,
-            round_trip_distance_km REAL NOT NULL,
-            one_way_eta_minutes INTEGER NOT NULL,
-            peak_eta_minutes INTEGER NOT NULL,
-            toll_count_one_way INTEGER NOT NULL,
-            toll_cost_one_way_cop INTEGER NOT NULL,
-            toll_count_round_trip INTEGER NOT NULL,
-            toll_cost_round_trip_cop INTEGER NOT NULL,
-            fuel_gallons_one_way REAL NOT NULL,
-            fuel_gallons_round_trip REAL NOT NULL,
-            fuel_cost_round_trip_cop INTEGER NOT NULL,
-            total_round_trip_cop INTEGER NOT NULL
+    with db_connection() as conn, conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS trips (
+                id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                contractor_name TEXT NOT NULL,
+                base_label TEXT NOT NULL,
+                origin_city TEXT NOT NULL,
+                destination_text TEXT NOT NULL,
+                fuel_type TEXT NOT NULL,
+                fuel_price_per_gallon_cop REAL NOT NULL,
+                km_per_gallon REAL NOT NULL,
+                one_way_distance_km REAL NOT NULL,
+                round_trip_distance_km REAL NOT NULL,
+                one_way_eta_minutes INTEGER NOT NULL,
+                peak_eta_minutes INTEGER NOT NULL,
+                toll_count_one_way INTEGER NOT NULL,
+                toll_cost_one_way_cop INTEGER NOT NULL,
+                toll_count_round_trip INTEGER NOT NULL,
+                toll_cost_round_trip_cop INTEGER NOT NULL,
+                fuel_gallons_one_way REAL NOT NULL,
+                fuel_gallons_round_trip REAL NOT NULL,
+                fuel_cost_round_trip_cop INTEGER NOT NULL,
+                total_round_trip_cop INTEGER NOT NULL,
+                ingest_seq INTEGER
+            )
+        ''')
+        _init_ingest_seq(conn)
+        # Listado paginado por (created_at, id) y filtros por contratista / origen
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_trips_created_at ON trips (created_at, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_trips_contractor ON trips (contractor_name, created_at, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_trips_origin ON trips (origin_city, created_at, id)')
+        # Exportación incremental (since) por orden de ingreso
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_trips_ingest_seq ON trips (ingest_seq)')
+        _init_trip_summary(conn)
+
+# Número de ingreso de cada viaje (ingest_seq): lo asigna el servidor al insertar desde
+# un contador que nunca baja, así la marca de la exportación incremental no depende del
+# created_at que manda el cliente (el bulk acepta fechas viejas) ni se reutiliza al
+# borrar el último viaje, como pasaría con el rowid
+TRIP_INGEST_SEQ_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS trip_ingest_seq (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        value INTEGER NOT NULL
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_trip_ingest_seq AFTER INSERT ON trips
+    WHEN NEW.ingest_seq IS NOT NULL
+    BEGIN
+        UPDATE trip_ingest_seq SET value = NEW.ingest_seq WHERE id = 1 AND value < NEW.ingest_seq;
+    END
+    '''
+]
+
+def _init_ingest_seq(conn):
+    """Agrega ingest_seq a bases anteriores (numerando los viajes existentes por rowid) y crea el contador"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(trips)')}
+    if 'ingest_seq' not in columns:
+        conn.execute('ALTER TABLE trips ADD COLUMN ingest_seq INTEGER')
+        conn.execute('UPDATE trips SET ingest_seq = rowid')
+    for statement in TRIP_INGEST_SEQ_SCHEMA:
+        conn.execute(statement)
+    conn.execute(
+        'INSERT OR IGNORE INTO trip_ingest_seq (id, value) '
+        'SELECT 1, COALESCE(MAX(ingest_seq), 0) FROM trips'
+    )
+
+# Totales por contratista, base y mes (YYYY-MM de created_at), mantenidos por triggers
+# al insertar, eliminar o actualizar viajes: /api/trips/summary no recorre trips
+TRIP_SUMMARY_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS trip_summary (
+        contractor_name TEXT NOT NULL,
+        base_label TEXT NOT NULL,
+        month TEXT NOT NULL,
+        trips INTEGER NOT NULL,
+        distance_km REAL NOT NULL,
+        fuel_cost_cop INTEGER NOT NULL,
+        toll_cost_cop INTEGER NOT NULL,
+        total_cost_cop INTEGER NOT NULL,
+        PRIMARY KEY (contractor_name, base_label, month)
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_trip_summary_insert AFTER INSERT ON trips
+    BEGIN
+        INSERT INTO trip_summary (
+            contractor_name, base_label, month, trips,
+            distance_km, fuel_cost_cop, toll_cost_cop, total_cost_cop
+        ) VALUES (
+            NEW.contractor_name, NEW.base_label, substr(NEW.created_at, 1, 7), 1,
+            NEW.round_trip_distance_km, NEW.fuel_cost_round_trip_cop,
+            NEW.toll_cost_round_trip_cop, NEW.total_round_trip_cop
         )
+        ON CONFLICT (contractor_name, base_label, month) DO UPDATE SET
+            trips = trips + 1,
+            distance_km = distance_km + excluded.distance_km,
+            fuel_cost_cop = fuel_cost_cop + excluded.fuel_cost_cop,
+            toll_cost_cop = toll_cost_cop + excluded.toll_cost_cop,
+            total_cost_cop = total_cost_cop + excluded.total_cost_cop;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_trip_summary_delete AFTER DELETE ON trips
+    BEGIN
+        UPDATE trip_summary SET
+            trips = trips - 1,
+            distance_km = distance_km - OLD.round_trip_distance_km,
+            fuel_cost_cop = fuel_cost_cop - OLD.fuel_cost_round_trip_cop,
+            toll_cost_cop = toll_cost_cop - OLD.toll_cost_round_trip_cop,
+            total_cost_cop = total_cost_cop - OLD.total_round_trip_cop
+        WHERE contractor_name = OLD.contractor_name
+          AND base_label = OLD.base_label
+          AND month = substr(OLD.created_at, 1, 7);
+        DELETE FROM trip_summary
+        WHERE contractor_name = OLD.contractor_name
+          AND base_label = OLD.base_label
+          AND month = substr(OLD.created_at, 1, 7)
+          AND trips <= 0;
+    END
+    ''',
+    # Una actualización = quitar la fila vieja y sumar la nueva
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_trip_summary_update AFTER UPDATE ON trips
+    BEGIN
+        UPDATE trip_summary SET
+            trips = trips - 1,
+            distance_km = distance_km - OLD.round_trip_distance_km,
+            fuel_cost_cop = fuel_cost_cop - OLD.fuel_cost_round_trip_cop,
+            toll_cost_cop = toll_cost_cop - OLD.toll_cost_round_trip_cop,
+            total_cost_cop = total_cost_cop - OLD.total_round_trip_cop
+        WHERE contractor_name = OLD.contractor_name
+          AND base_label = OLD.base_label
+          AND month = substr(OLD.created_at, 1, 7);
+        DELETE FROM trip_summary
+        WHERE contractor_name = OLD.contractor_name
+          AND base_label = OLD.base_label
+          AND month = substr(OLD.created_at, 1, 7)
+          AND trips <= 0;
+        INSERT INTO trip_summary (
+            contractor_name, base_label, month, trips,
+            distance_km, fuel_cost_cop, toll_cost_cop, total_cost_cop
+        ) VALUES (
+            NEW.contractor_name, NEW.base_label, substr(NEW.created_at, 1, 7), 1,
+            NEW.round_trip_distance_km, NEW.fuel_cost_round_trip_cop,
+            NEW.toll_cost_round_trip_cop, NEW.total_round_trip_cop
+        )
+        ON CONFLICT (contractor_name, base_label, month) DO UPDATE SET
+            trips = trips + 1,
+            distance_km = distance_km + excluded.distance_km,
+            fuel_cost_cop = fuel_cost_cop + excluded.fuel_cost_cop,
+            toll_cost_cop = toll_cost_cop + excluded.toll_cost_cop,
+            total_cost_cop = total_cost_cop + excluded.total_cost_cop;
+    END
+    '''
+]
+
+def _init_trip_summary(conn):
+    """Crea la tabla de totales y sus triggers; si la tabla es nueva, la llena desde trips"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trip_summary'"
+    ).fetchone()
+    for statement in TRIP_SUMMARY_SCHEMA:
+        conn.execute(statement)
+    if not exists:
+        rebuild_trip_summary(conn)
+
+def rebuild_trip_summary(conn):
+    """Recalcula trip_summary completa desde trips (una sola vez, o para corregir diferencias)"""
+    conn.execute('DELETE FROM trip_summary')
+    conn.execute('''
+        INSERT INTO trip_summary (
+            contractor_name, base_label, month, trips,
+            distance_km, fuel_cost_cop, toll_cost_cop, total_cost_cop
+        )
+        SELECT contractor_name, base_label, substr(created_at, 1, 7), COUNT(*),
+               SUM(round_trip_distance_km), SUM(fuel_cost_round_trip_cop),
+               SUM(toll_cost_round_trip_cop), SUM(total_round_trip_cop)
+        FROM trips
+        GROUP BY contractor_name, base_label, substr(created_at, 1, 7)
     ''')
-    conn.commit()
-    conn.close()
 
 def compute_trip_result(data: Dict) -> Dict:
     """
@@ -105,22 +321,30 @@ def compute_trip_result(data: Dict) -> Dict:
         'total_round_trip_cop': total_round_trip_cop
     }
 
-def save_trip(trip: Dict):
-    """Guarda un viaje en la base de datos"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO trips (
-            id, created_at, contractor_name, base_label, origin_city, destination_text,
-            fuel_type, fuel_price_per_gallon_cop, km_per_gallon,
-            one_way_distance_km, round_trip_distance_km,
-            one_way_eta_minutes, peak_eta_minutes,
-            toll_count_one_way, toll_cost_one_way_cop,
-            toll_count_round_trip, toll_cost_round_trip_cop,
-            fuel_gallons_one_way, fuel_gallons_round_trip, fuel_cost_round_trip_cop,
-            total_round_trip_cop
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+# Columnas de un viaje (sin ingest_seq, que es interno)
+TRIP_COLUMNS = (
+    'id, created_at, contractor_name, base_label, origin_city, destination_text, '
+    'fuel_type, fuel_price_per_gallon_cop, km_per_gallon, '
+    'one_way_distance_km, round_trip_distance_km, '
+    'one_way_eta_minutes, peak_eta_minutes, '
+    'toll_count_one_way, toll_cost_one_way_cop, '
+    'toll_count_round_trip, toll_cost_round_trip_cop, '
+    'fuel_gallons_one_way, fuel_gallons_round_trip, fuel_cost_round_trip_cop, '
+    'total_round_trip_cop'
+)
+
+# Texto SQL constante: cada conexión reutiliza la sentencia preparada.
+# ingest_seq sale del contador dentro de la misma sentencia (las escrituras en SQLite
+# van de a una, así el número sigue el orden de commit)
+INSERT_TRIP_SQL = f'''
+    INSERT INTO trips ({TRIP_COLUMNS}, ingest_seq)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+            (SELECT value + 1 FROM trip_ingest_seq WHERE id = 1))
+'''
+
+def _trip_params(trip: Dict) -> tuple:
+    """Valores de INSERT_TRIP_SQL para un viaje de compute_trip_result"""
+    return (
         trip['id'], trip['created_at'], trip['contractor_name'], trip['base_label'],
         trip['origin_city'], trip['destination_text'], trip['fuel_type'],
         trip['fuel_price_per_gallon_cop'], trip['km_per_gallon'],
@@ -130,34 +354,140 @@ def save_trip(trip: Dict):
         trip['toll_count_round_trip'], trip['toll_cost_round_trip_cop'],
         trip['fuel_gallons_one_way'], trip['fuel_gallons_round_trip'],
         trip['fuel_cost_round_trip_cop'], trip['total_round_trip_cop']
-    ))
-    conn.commit()
-    conn.close()
-
-def get_all_trips() -> List[Dict]:
-    """Obtiene todos los viajes de la base de datos"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM trips ORDER BY created_at DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    )
+
+def save_trip(trip: Dict):
+    """Guarda un viaje en la base de datos"""
+    with db_connection() as conn, conn:
+        conn.execute(INSERT_TRIP_SQL, _trip_params(trip))
+
+# Carga masiva: un id que ya existe (reintento de la misma carga) no se inserta ni falla
+INSERT_TRIP_IF_NEW_SQL = INSERT_TRIP_SQL + ' ON CONFLICT (id) DO NOTHING'
+SAVE_TRIPS_ID_CHUNK = 500  # Ids por consulta IN (...) al buscar los que ya existen
+
+def save_trips(trips: List[Dict]) -> List[Dict]:
+    """
+    Guarda muchos viajes con un solo executemany y un solo commit. La transacción se abre
+    con BEGIN IMMEDIATE (bloqueo de escritura desde el inicio): los ids existentes se
+    consultan y los nuevos se insertan sin que otra carga concurrente escriba entre medio.
+    ON CONFLICT DO NOTHING queda como resguardo para no fallar con IntegrityError
+    
+    Returns:
+        Viajes que no se guardaron porque su id ya existía
+    """
+    ids = [trip['id'] for trip in trips]
+    existing = set()
+    with db_connection() as conn, conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for start in range(0, len(ids), SAVE_TRIPS_ID_CHUNK):
+            chunk = ids[start:start + SAVE_TRIPS_ID_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            existing.update(
+                row[0] for row in conn.execute(f'SELECT id FROM trips WHERE id IN ({placeholders})', chunk)
+            )
+        conn.executemany(
+            INSERT_TRIP_IF_NEW_SQL,
+            (_trip_params(trip) for trip in trips if trip['id'] not in existing)
+        )
+    return [trip for trip in trips if trip['id'] in existing]
+
+def _trip_filters(
+    contractor: Optional[str] = None,
+    origin: Optional[str] = None,
+    destination: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> Tuple[List[str], List]:
+    """
+    Condiciones WHERE y parámetros de los filtros del listado de viajes
+    
+    Args:
+        contractor: Nombre exacto del contratista
+        origin: Ciudad de origen exacta
+        destination: Texto contenido en el destino
+        date_from: Fecha inicial (YYYY-MM-DD o ISO, inclusive)
+        date_to: Fecha final (YYYY-MM-DD incluye todo el día)
+    
+    Raises:
+        ValueError: Si alguna fecha no es ISO
+    """
+    where, params = [], []
+    if contractor:
+        where.append('contractor_name = ?')
+        params.append(contractor)
+    if origin:
+        where.append('origin_city = ?')
+        params.append(origin)
+    if destination:
+        where.append("destination_text LIKE ? ESCAPE '\\'")
+        escaped = destination.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params.append(f'%{escaped}%')
+    if date_from:
+        where.append('created_at >= ?')
+        params.append(datetime.fromisoformat(date_from).isoformat())
+    if date_to:
+        end = datetime.fromisoformat(date_to)
+        if len(date_to) == 10:
+            where.append('created_at < ?')
+            params.append((end + timedelta(days=1)).isoformat())
+        else:
+            where.append('created_at <= ?')
+            params.append(end.isoformat())
+    return where, params
+
+def _encode_trips_cursor(trip: Dict) -> str:
+    raw = json.dumps([trip['created_at'], trip['id']], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_trips_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, trip_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(created_at), str(trip_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError('cursor inválido') from e
+
+def list_trips(limit: int = TRIPS_PAGE_SIZE, cursor: Optional[str] = None, **filters) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Página de viajes del más reciente al más antiguo (paginación por cursor sobre
+    (created_at, id): cada página es una búsqueda en el índice, sin OFFSET)
+    
+    Args:
+        limit: Viajes por página
+        cursor: next_cursor de la página anterior
+        **filters: contractor, origin, destination, date_from, date_to (ver _trip_filters)
+    
+    Returns:
+        Tupla (viajes, next_cursor); next_cursor es None en la última página
+    """
+    where, params = _trip_filters(**filters)
+    if cursor:
+        created_at, trip_id = _decode_trips_cursor(cursor)
+        where.append('created_at <= ? AND (created_at < ? OR id < ?)')
+        params.extend([created_at, created_at, trip_id])
+    sql = f'SELECT {TRIP_COLUMNS} FROM trips'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    params.append(limit + 1)
+    
+    with db_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    trips = [dict(row) for row in rows[:limit]]
+    next_cursor = _encode_trips_cursor(trips[-1]) if len(rows) > limit else None
+    return trips, next_cursor
 
 def delete_trip(trip_id: str):
     """Elimina un viaje de la base de datos"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM trips WHERE id = ?', (trip_id,))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn, conn:
+        conn.execute('DELETE FROM trips WHERE id = ?', (trip_id,))
 
 @app.route('/')
 def index():
-    """Página principal"""
-    trips = get_all_trips()
+    """Página principal (solo la primera página de viajes; el resto se pide a /api/trips)"""
+    trips, next_cursor = list_trips(limit=TRIPS_PAGE_SIZE)
     return render_template('index.html', 
                          trips=trips, 
+                         next_cursor=next_cursor,
                          contractors=CONTRACTORS,
                          default_km_per_gallon=DEFAULT_KM_PER_GALLON)
 
@@ -168,14 +498,7 @@ def create_trip():
     data = request.json
     
     # Validaciones básicas
-    required_fields = [
-        'contractor_name', 'base_label', 'origin_city', 'destination_text',
-        'fuel_type', 'fuel_price_per_gallon_cop', 'km_per_gallon',
-        'one_way_distance_km', 'one_way_eta_minutes',
-        'toll_count_one_way', 'toll_cost_one_way_cop'
-    ]
-    
-    for field in required_fields:
+    for field in TRIP_REQUIRED_FIELDS:
         if field not in data:
             return jsonify({'success': False, 'error': f'Campo requerido faltante: {field}'}), 400
     
@@ -192,6 +515,282 @@ def create_trip():
     
     return jsonify({'success': True, 'trip': trip_result})
 
+def _parse_bulk_trip(row: Dict) -> Dict:
+    """
+    Valida y normaliza una fila de /api/trips/bulk (los valores de CSV llegan como texto)
+    
+    Raises:
+        ValueError: Campo faltante, número inválido o fecha no ISO
+    """
+    if not isinstance(row, dict):
+        raise ValueError('Cada viaje debe ser un objeto')
+    trip_data = dict(row)
+    for field in TRIP_REQUIRED_FIELDS:
+        value = trip_data.get(field)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            raise ValueError(f'Campo requerido faltante: {field}')
+    for field in TRIP_FLOAT_FIELDS + TRIP_INT_FIELDS:
+        value = trip_data[field]
+        if isinstance(value, str):
+            value = value.strip().replace(',', '.')
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Valor numérico inválido en {field}: {trip_data[field]!r}')
+        if not math.isfinite(number):  # 'inf', 'nan', '1e400'
+            raise ValueError(f'Valor numérico inválido en {field}: {trip_data[field]!r}')
+        trip_data[field] = int(round(number)) if field in TRIP_INT_FIELDS else number
+    if trip_data['km_per_gallon'] <= 0:
+        raise ValueError('km_per_gallon debe ser mayor a 0')
+    if trip_data['one_way_distance_km'] < 0:
+        raise ValueError('one_way_distance_km no puede ser negativo')
+    created_at = trip_data.get('created_at')
+    if created_at:
+        try:
+            parsed = datetime.fromisoformat(str(created_at).strip())
+        except ValueError:
+            raise ValueError(f'created_at inválido (se espera ISO 8601): {created_at!r}')
+        if parsed.tzinfo is not None:
+            # Con zona horaria se pasa a la hora local sin zona, como los demás viajes
+            # (el orden del listado y los filtros comparan created_at como texto)
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        trip_data['created_at'] = parsed.isoformat()
+    else:
+        trip_data.pop('created_at', None)
+    if not trip_data.get('id'):
+        trip_data.pop('id', None)
+    return trip_data
+
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+def _check_trip_range(trip: Dict) -> None:
+    """
+    Valores calculados que SQLite puede guardar: enteros de 64 bits y reales finitos
+    (un número finito pero enorme, p. ej. 1e300 km, se desborda al multiplicar)
+    
+    Raises:
+        ValueError: Si algún valor está fuera de rango
+    """
+    for field, value in trip.items():
+        if isinstance(value, bool):
+            continue
+        if (isinstance(value, int) and abs(value) > SQLITE_INT_MAX) or (isinstance(value, float) and not math.isfinite(value)):
+            raise ValueError(f'Valor fuera de rango en {field}')
+
+def _read_bulk_rows() -> List:
+    """
+    Filas del request de /api/trips/bulk: arreglo JSON ({"trips": [...]} o [...]),
+    archivo CSV subido (campo "file") o cuerpo text/csv. El CSV usa los mismos nombres
+    de campo en la primera fila; el separador puede ser coma, punto y coma o tabulador
+    
+    Raises:
+        ValueError: Si el cuerpo no es un arreglo JSON ni un CSV
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        text = upload.read().decode('utf-8-sig')
+    elif request.mimetype in ('text/csv', 'text/plain'):
+        text = request.get_data(as_text=False).decode('utf-8-sig')
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('trips')
+        if not isinstance(data, list):
+            raise ValueError('Se requiere un arreglo JSON de viajes (o {"trips": [...]}) o un archivo CSV')
+        return data
+    
+    lines = text.splitlines()
+    if not lines:
+        return []
+    try:
+        dialect = csv.Sniffer().sniff(lines[0], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(lines, dialect=dialect)
+    reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+    # Las filas en blanco quedan como None: se saltan sin correr la numeración de filas
+    return [
+        row if any(value.strip() for value in row.values() if isinstance(value, str)) else None
+        for row in reader
+    ]
+
+@app.route('/api/trips/bulk', methods=['POST'])
+def create_trips_bulk():
+    """
+    Carga masiva de viajes (p. ej. respaldo de planillas de las cuadrillas)
+    
+    Valida y calcula todas las filas en una pasada e inserta las válidas en una
+    sola transacción (los ids que ya existen se informan como error de su fila,
+    sin cortar la carga). Las filas con error no detienen el lote:
+    se devuelven en errors con su número de fila (1 = primera fila de datos)
+    """
+    try:
+        rows = _read_bulk_rows()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'error': f'Error en parámetros: {str(e)}'}), 400
+    
+    if not any(row is not None for row in rows):
+        return jsonify({'success': False, 'error': 'No hay viajes para cargar'}), 400
+    
+    if len(rows) > MAX_BULK_TRIPS:
+        return jsonify({'success': False, 'error': f'Máximo {MAX_BULK_TRIPS} viajes por request'}), 400
+    
+    now = datetime.now()
+    trips = []
+    row_numbers = []
+    errors = []
+    seen_ids = set()
+    for row_number, row in enumerate(rows, start=1):
+        if row is None:
+            continue
+        try:
+            trip_data = _parse_bulk_trip(row)
+            trip_data.setdefault('id', f"trip_{now.timestamp()}_{row_number}_{hash(str(row))}")
+            trip_data.setdefault('created_at', now.isoformat())
+            if trip_data['id'] in seen_ids:
+                raise ValueError(f"id repetido en el lote: {trip_data['id']}")
+            trip_result = compute_trip_result(trip_data)
+            _check_trip_range(trip_result)
+        except (ValueError, TypeError, KeyError, OverflowError) as e:
+            errors.append({'row': row_number, 'error': str(e)})
+            continue
+        seen_ids.add(trip_result['id'])
+        trips.append(trip_result)
+        row_numbers.append(row_number)
+    
+    # IDs enviados que ya existen (reintento de la misma carga)
+    duplicated = {trip['id'] for trip in save_trips(trips)} if trips else set()
+    if duplicated:
+        kept = []
+        for trip, row_number in zip(trips, row_numbers):
+            if trip['id'] in duplicated:
+                errors.append({'row': row_number, 'error': f"El viaje {trip['id']} ya existe"})
+            else:
+                kept.append(trip)
+        trips = kept
+        errors.sort(key=lambda e: e['row'])
+    print(f"[DEBUG] Carga masiva: {len(trips)} viajes guardados, {len(errors)} filas con error")
+    
+    return jsonify({
+        'success': True,
+        'total_rows': sum(1 for row in rows if row is not None),
+        'inserted': len(trips),
+        'errors': errors,
+        'ids': [trip['id'] for trip in trips]
+    })
+
+SUMMARY_GROUP_COLUMNS = {'contractor': 'contractor_name', 'base': 'base_label', 'month': 'month'}
+
+def get_trip_summary(
+    group_by: List[str],
+    contractor: Optional[str] = None,
+    base: Optional[str] = None,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None
+) -> List[Dict]:
+    """
+    Totales de trip_summary agrupados por las columnas de group_by
+    (subconjunto de 'contractor', 'base', 'month'; vacío = un solo total)
+    
+    Args:
+        month_from / month_to: Meses YYYY-MM (inclusive)
+    """
+    columns = [SUMMARY_GROUP_COLUMNS[key] for key in group_by]
+    where, params = [], []
+    if contractor:
+        where.append('contractor_name = ?')
+        params.append(contractor)
+    if base:
+        where.append('base_label = ?')
+        params.append(base)
+    if month_from:
+        where.append('month >= ?')
+        params.append(month_from)
+    if month_to:
+        where.append('month <= ?')
+        params.append(month_to)
+    
+    select = columns + [
+        'SUM(trips) AS trips',
+        'SUM(distance_km) AS distance_km',
+        'SUM(fuel_cost_cop) AS fuel_cost_cop',
+        'SUM(toll_cost_cop) AS toll_cost_cop',
+        'SUM(total_cost_cop) AS total_cost_cop'
+    ]
+    sql = f"SELECT {', '.join(select)} FROM trip_summary"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if columns:
+        sql += f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}"
+    
+    with db_connection() as conn:
+        rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    summary = []
+    for row in rows:
+        if not row['trips']:
+            continue  # Sin viajes (total vacío)
+        row['distance_km'] = round(row['distance_km'], 2)
+        summary.append(row)
+    return summary
+
+@app.route('/api/trips/summary', methods=['GET'])
+def trip_summary_endpoint():
+    """
+    Totales (viajes, km, combustible, peajes y total COP) por contratista, base y mes,
+    leídos de la tabla de resumen (no depende del tamaño de trips)
+    
+    Parámetros: group_by (lista separada por comas de contractor, base, month;
+    default: los tres), contractor, base, month_from y month_to (YYYY-MM)
+    """
+    group_by = [key.strip() for key in request.args.get('group_by', 'contractor,base,month').split(',') if key.strip()]
+    invalid = [key for key in group_by if key not in SUMMARY_GROUP_COLUMNS]
+    if invalid:
+        return jsonify({
+            'success': False,
+            'error': f"group_by inválido: {', '.join(invalid)} (opciones: contractor, base, month)"
+        }), 400
+    
+    months = {}
+    for param in ('month_from', 'month_to'):
+        value = request.args.get(param, '').strip()
+        if value:
+            try:
+                value = datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+            except ValueError:
+                return jsonify({'success': False, 'error': f'{param} inválido (se espera YYYY-MM): {value}'}), 400
+        months[param] = value or None
+    
+    summary = get_trip_summary(
+        list(dict.fromkeys(group_by)),
+        contractor=request.args.get('contractor', '').strip() or None,
+        base=request.args.get('base', '').strip() or None,
+        **months
+    )
+    return jsonify({'success': True, 'group_by': list(dict.fromkeys(group_by)), 'summary': summary})
+
+@app.route('/api/trips', methods=['GET'])
+def list_trips_endpoint():
+    """
+    Viajes paginados del más reciente al más antiguo
+    
+    Parámetros: limit, cursor (next_cursor de la página anterior), contractor,
+    origin, destination (texto contenido), date_from y date_to (YYYY-MM-DD)
+    """
+    try:
+        limit = max(1, min(MAX_TRIPS_PAGE_SIZE, int(request.args.get('limit', TRIPS_PAGE_SIZE))))
+        trips, next_cursor = list_trips(
+            limit=limit,
+            cursor=request.args.get('cursor') or None,
+            contractor=request.args.get('contractor', '').strip() or None,
+            origin=request.args.get('origin', '').strip() or None,
+            destination=request.args.get('destination', '').strip() or None,
+            date_from=request.args.get('date_from', '').strip() or None,
+            date_to=request.args.get('date_to', '').strip() or None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Error en parámetros: {str(e)}'}), 400
+    return jsonify({'success': True, 'trips': trips, 'count': len(trips), 'next_cursor': next_cursor})
+
 @app.route('/api/trip/<trip_id>', methods=['DELETE'])
 def delete_trip_endpoint(trip_id):
     """API endpoint para eliminar un viaje"""
@@ -234,8 +833,10 @@ def load_tolls_from_text():
         
         # Recargar peajes
         from data.tolls import load_tolls
+        from services.toll_calculator import set_tolls
         global TOLLS
         TOLLS = load_tolls()
+        set_tolls(TOLLS)
         
         return jsonify({
             'success': True,
@@ -257,11 +858,83 @@ def buscar_ciudad_endpoint():
     ciudades = buscar_ciudad(query)
     return jsonify({'success': True, 'ciudades': ciudades})
 
+def _calcular_regreso(origin_coords: Dict, dest_coords: Dict, route_regreso: Optional[Dict]):
+    """
+    Peajes de la ruta de regreso (destino -> origen), para correr en ROUTE_EXECUTOR
+    
+    Returns:
+        (route_regreso, peajes_regreso), o (None, None) si no hay ruta de regreso
+    """
+    if not route_regreso:
+        return None, None
+    
+    # Para la ruta de regreso, invertir origen y destino
+    peajes_regreso = _calcular_peajes(
+        route_regreso.get('geometry'),
+        threshold_m=1000.0,  # 1km para capturar peajes cercanos pero con validación estricta de dirección
+        origin_latlon=(dest_coords['lat'], dest_coords['lon']),  # El destino se convierte en origen
+        dest_latlon=(origin_coords['lat'], origin_coords['lon']),  # El origen se convierte en destino
+        simplify_tolerance_m=ROUTE_SIMPLIFY_TOLERANCE_M
+    )
+    return route_regreso, peajes_regreso
+
+def _polilinea_codificada(geometry: Optional[Dict], precision: int) -> Optional[Dict]:
+    """GeoJSON LineString -> {'type': 'EncodedPolyline', 'precision', 'polyline'} (formato compacto)"""
+    if not geometry:
+        return geometry
+    return {
+        'type': 'EncodedPolyline',
+        'precision': precision,
+        'polyline': encode_polyline(geometry.get('coordinates') or [], precision)
+    }
+
+def _offset_ruta_truncada(ruta_completa: PreparedRoute, ruta_truncada: PreparedRoute) -> Tuple[int, Optional[List[float]]]:
+    """
+    Posición de la ruta truncada (desde el primer peaje) en la geometría completa de OSRM:
+    coordenadas = [start] + geometría_completa[offset:], con start = None si no hay punto
+    interpolado (ruta sin truncar, o truncada a menos de 100m del final)
+    """
+    if ruta_truncada is ruta_completa:
+        return 0, None
+    if len(ruta_truncada) < 2:
+        # Truncada a menos de 100m del final: solo el último punto
+        return ruta_completa.source_index(len(ruta_completa) - 1), None
+    # source_index(0): vértice original anterior al corte; la cola sigue desde el siguiente
+    lat, lon = ruta_truncada.points[0]
+    return ruta_truncada.source_index(0) + 1, [lon, lat]
+
+def _geometria_truncada(geometry_full: Dict, ruta_completa: PreparedRoute, ruta_truncada: PreparedRoute) -> Dict:
+    """
+    GeoJSON de la ruta desde el primer peaje con todos los vértices de OSRM
+    (la simplificación solo se usa para buscar peajes)
+    """
+    offset, start = _offset_ruta_truncada(ruta_completa, ruta_truncada)
+    coordinates = geometry_full['coordinates'][offset:]
+    return {
+        'type': 'LineString',
+        'coordinates': ([start] if start else []) + coordinates
+    }
+
+def _geometria_desde_offset(ruta_completa: PreparedRoute, ruta_truncada: PreparedRoute) -> Dict:
+    """
+    Geometría de la ida (desde el primer peaje) como referencia a geometry_full:
+    coordenadas = [start] + geometry_full[offset:] ('start' se omite si no hay punto interpolado)
+    """
+    offset, start = _offset_ruta_truncada(ruta_completa, ruta_truncada)
+    geometry = {'type': 'GeometryOffset', 'of': 'geometry_full', 'offset': offset}
+    if start:
+        geometry['start'] = start
+    return geometry
+
 @app.route('/api/calcular_ruta_supply', methods=['GET'])
 def calcular_ruta_supply():
     """
     Calcula ruta con distancia, tiempos, costos y peajes
     Según el diagrama de flujo proporcionado
+    
+    Con format=compact las geometrías se envían como polilíneas codificadas
+    (precisión con el parámetro precision, 1-6) y ida.geometry como offset
+    dentro de ida.geometry_full en lugar de una segunda copia de la ruta
     """
     try:
         # Obtener parámetros
@@ -270,6 +943,8 @@ def calcular_ruta_supply():
         km_per_liter = float(request.args.get('km_per_liter', DEFAULT_KM_PER_GALLON))
         precio_liter_cop = float(request.args.get('precio_liter_cop', 0))
         round_trip = request.args.get('round_trip', 'false').lower() == 'true'
+        compact = request.args.get('format', '').lower() == 'compact'
+        precision = max(1, min(6, int(request.args.get('precision', GEOMETRY_PRECISION))))
         
         print(f"[DEBUG] Calculando ruta: {origin} -> {destination}")
         print(f"[DEBUG] Parámetros: km_per_liter={km_per_liter}, precio_liter_cop={precio_liter_cop}, round_trip={round_trip}")
@@ -296,13 +971,14 @@ def calcular_ruta_supply():
                 'error': 'El destino no puede estar vacío.'
             }), 400
         
-        # Geocodificar ciudades
-        print(f"[DEBUG] Geocodificando origen: '{origin}'")
-        origin_coords = geocode_city(origin.strip())
+        # Geocodificar ciudades (origen y destino en paralelo; el rate limiter de
+        # Nominatim ordena los requests que sí salen a la red)
+        print(f"[DEBUG] Geocodificando origen: '{origin}' y destino: '{destination}'")
+        origin_future = ROUTE_EXECUTOR.submit(geocode_city, origin.strip())
+        dest_future = ROUTE_EXECUTOR.submit(geocode_city, destination.strip())
+        origin_coords = origin_future.result()
+        dest_coords = dest_future.result()
         print(f"[DEBUG] Coordenadas origen: {origin_coords}")
-        
-        print(f"[DEBUG] Geocodificando destino: '{destination}'")
-        dest_coords = geocode_city(destination.strip())
         print(f"[DEBUG] Coordenadas destino: {dest_coords}")
         
         if not origin_coords:
@@ -317,24 +993,45 @@ def calcular_ruta_supply():
                 'error': f'No se pudieron encontrar coordenadas para el destino "{destination}". Verifica que la ciudad o dirección esté escrita correctamente.'
             }), 400
         
-        # Calcular ruta ida
+        # Calcular ruta ida; si es ida y regreso, ambas rutas salen de un solo request a OSRM
+        # y los peajes del regreso se calculan en paralelo con los de la ida
         print(f"[DEBUG] Calculando ruta con OSRM...")
-        route_ida = calcular_ruta_con_trafico(
-            origin_coords['lat'],
-            origin_coords['lon'],
-            dest_coords['lat'],
-            dest_coords['lon']
-        )
+        regreso_future = None
+        if round_trip:
+            route_ida, route_regreso = calcular_ruta_ida_y_regreso(
+                origin_coords['lat'],
+                origin_coords['lon'],
+                dest_coords['lat'],
+                dest_coords['lon']
+            )
+            regreso_future = ROUTE_EXECUTOR.submit(_calcular_regreso, origin_coords, dest_coords, route_regreso)
+        else:
+            route_ida = calcular_ruta_con_trafico(
+                origin_coords['lat'],
+                origin_coords['lon'],
+                dest_coords['lat'],
+                dest_coords['lon']
+            )
         print(f"[DEBUG] Ruta calculada: {route_ida is not None}")
         
         if not route_ida:
+            if regreso_future:
+                regreso_future.cancel()
             return jsonify({'success': False, 'error': 'No se pudo calcular la ruta. Verifica que las ciudades existan.'}), 400
         
         # Calcular peajes en ruta ida (ruta completa desde origen)
         origin_latlon = (origin_coords['lat'], origin_coords['lon'])
         dest_latlon = (dest_coords['lat'], dest_coords['lon'])
-        peajes_ida_completa = _calcular_peajes(
+        
+        # Preparar la ruta una sola vez (proyección y distancias acumuladas)
+        ruta_completa = PreparedRoute.from_geojson(
             route_ida.get('geometry'),
+            simplify_tolerance_m=ROUTE_SIMPLIFY_TOLERANCE_M
+        )
+        if ruta_completa.simplification_stats():
+            print(f"[DEBUG] Ruta simplificada: {ruta_completa.source_vertex_count} -> {len(ruta_completa)} vértices")
+        peajes_ida_completa, peajes_ida, ruta_truncada = _calcular_peajes_desde_primer_peaje(
+            ruta_completa,
             threshold_m=1000.0,  # 1km para capturar peajes cercanos pero con validación estricta de dirección
             origin_latlon=origin_latlon,
             dest_latlon=dest_latlon
@@ -350,27 +1047,12 @@ def calcular_ruta_supply():
             peajes_ordenados = peajes_ida_completa['peajes_en_ruta']
             primer_peaje = peajes_ordenados[0]
             
-            # Truncar la ruta desde el primer peaje
-            from services.route_utils import truncate_route_from_point, route_to_geojson, polyline_length_m
-            from services.toll_calculator import route_from_linestring
-            
-            ruta_completa = route_from_linestring(route_ida.get('geometry'))
-            primer_peaje_point = (primer_peaje['latitude'], primer_peaje['longitude'])
-            ruta_truncada = truncate_route_from_point(ruta_completa, primer_peaje_point)
-            
-            # Convertir de vuelta a GeoJSON
-            ruta_desde_primer_peaje = route_to_geojson(ruta_truncada)
+            # La ruta ya viene truncada desde el primer peaje (peajes re-anclados en ese punto);
+            # la geometría se arma con los vértices completos de OSRM, no con los simplificados
+            ruta_desde_primer_peaje = _geometria_truncada(route_ida.get('geometry'), ruta_completa, ruta_truncada)
             
             # Calcular distancia desde el primer peaje
-            distancia_desde_primer_peaje_km = round(polyline_length_m(ruta_truncada) / 1000.0, 2)
-            
-            # Recalcular peajes en la ruta truncada (desde primer peaje hasta destino)
-            peajes_ida = _calcular_peajes(
-                ruta_desde_primer_peaje,
-                threshold_m=1000.0,
-                origin_latlon=primer_peaje_point,
-                dest_latlon=dest_latlon
-            )
+            distancia_desde_primer_peaje_km = round(ruta_truncada.length_m / 1000.0, 2)
             
             # IMPORTANTE: Incluir el costo del primer peaje (peaje de salida) en el total
             # El primer peaje debe pagarse aunque la distancia se calcule desde ahí
@@ -434,23 +1116,11 @@ def calcular_ruta_supply():
             }
         }
         
-        # Si es ida y regreso, calcular ruta de regreso
+        # Si es ida y regreso, esperar los peajes del regreso (calculados en paralelo)
         if round_trip:
-            route_regreso = calcular_ruta_inversa(
-                origin_coords['lat'],
-                origin_coords['lon'],
-                dest_coords['lat'],
-                dest_coords['lon']
-            )
+            route_regreso, peajes_regreso = regreso_future.result()
             
             if route_regreso:
-                # Para la ruta de regreso, invertir origen y destino
-                peajes_regreso = _calcular_peajes(
-                    route_regreso.get('geometry'),
-                    threshold_m=1000.0,  # 1km para capturar peajes cercanos pero con validación estricta de dirección
-                    origin_latlon=dest_latlon,  # El destino se convierte en origen
-                    dest_latlon=origin_latlon   # El origen se convierte en destino
-                )
                 distancia_regreso_km = route_regreso['distance_km']
                 litros_regreso = distancia_regreso_km / km_per_liter
                 costo_combustible_regreso = litros_regreso * precio_liter_cop
@@ -492,6 +1162,15 @@ def calcular_ruta_supply():
                     'warning': 'No se pudo calcular la ruta de regreso. Los totales son aproximados (duplicando la ida).'
                 }
         
+        if compact:
+            resultado['format'] = 'compact'
+            resultado['ida']['geometry_full'] = _polilinea_codificada(route_ida.get('geometry'), precision)
+            resultado['ida']['geometry'] = _geometria_desde_offset(
+                ruta_completa, ruta_truncada if primer_peaje else ruta_completa
+            )
+            if resultado.get('regreso'):
+                resultado['regreso']['geometry'] = _polilinea_codificada(resultado['regreso']['geometry'], precision)
+        
         return jsonify(resultado)
         
     except ValueError as e:
@@ -499,65 +1178,160 @@ def calcular_ruta_supply():
     except Exception as e:
         return jsonify({'success': False, 'error': f'Error al calcular ruta: {str(e)}'}), 500
 
+@app.route('/api/peajes/batch', methods=['POST'])
+def calcular_peajes_batch_endpoint():
+    """
+    Calcula peajes para muchas geometrías de ruta ya conocidas (sin geocoding ni routing)
+    Body JSON: {"routes": [{"id", "geometry", "origin", "destination"}, ...],
+                "threshold_m": 1000, "simplify_tolerance_m": 10}
+    Responde NDJSON: una línea por ruta apenas se termina de calcular
+    """
+    data = request.get_json(silent=True) or {}
+    routes = data.get('routes')
+    
+    if not isinstance(routes, list) or not routes:
+        return jsonify({'success': False, 'error': 'Se requiere una lista "routes" con geometrías'}), 400
+    
+    if len(routes) > MAX_BATCH_ROUTES:
+        return jsonify({'success': False, 'error': f'Máximo {MAX_BATCH_ROUTES} rutas por request'}), 400
+    
+    try:
+        threshold_m = float(data.get('threshold_m', 1000.0))
+        simplify_tolerance_m = float(data.get('simplify_tolerance_m', ROUTE_SIMPLIFY_TOLERANCE_M))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Error en parámetros: {str(e)}'}), 400
+    
+    def generate():
+        for resultado in _calcular_peajes_batch(
+            routes,
+            threshold_m=threshold_m,
+            simplify_tolerance_m=simplify_tolerance_m
+        ):
+            yield json.dumps(resultado, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/peajes/cache', methods=['GET'])
+def toll_cache_stats_endpoint():
+    """Contadores de la caché de resultados de peajes (aciertos, fallos, tamaño)"""
+    return jsonify({'success': True, 'cache': toll_cache_stats()})
+
+@app.route('/api/rutas/cache', methods=['GET'])
+def route_cache_stats_endpoint():
+    """Contadores de la caché de rutas de OSRM (aciertos, rutas viejas refrescadas, tamaño)"""
+    return jsonify({'success': True, 'cache': route_cache_stats()})
+
+@app.route('/api/http/stats', methods=['GET'])
+def http_stats_endpoint():
+    """Contadores del cliente HTTP compartido (requests y conexiones reutilizadas por servicio)"""
+    return jsonify({'success': True, 'services': http_stats()})
+
+@app.route('/api/db/stats', methods=['GET'])
+def db_stats_endpoint():
+    """Estado del pool de conexiones SQLite (modo de journal, conexiones abiertas y reutilizadas)"""
+    return jsonify({'success': True, 'pool': DB_POOL.stats()})
+
+# Campos específicos del CSV exportado (tabla dinámica)
+EXPORT_FIELDNAMES = [
+    'Contratista',
+    'Ciudad Origen',
+    'Ciudad Destino',
+    'Total Recorrido (km)',
+    'Gasto Combustible (COP)',
+    'Gasto Peajes (COP)',
+    'Total (COP)'
+]
+EXPORT_COLUMNS = (
+    'created_at, contractor_name, origin_city, destination_text, round_trip_distance_km, '
+    'fuel_cost_round_trip_cop, toll_cost_round_trip_cop, total_round_trip_cop'
+)
+EXPORT_CHUNK_ROWS = 500  # Filas leídas del cursor por bloque
+
+def _export_row(trip) -> List:
+    """Fila del CSV (sin decimales para enteros, con 2 decimales para km)"""
+    round_trip_distance_km = trip['round_trip_distance_km']
+    fuel_cost_round_trip_cop = trip['fuel_cost_round_trip_cop']
+    toll_cost_round_trip_cop = trip['toll_cost_round_trip_cop']
+    total_round_trip_cop = trip['total_round_trip_cop']
+    return [
+        trip['contractor_name'] or '',
+        trip['origin_city'] or '',
+        trip['destination_text'] or '',
+        f"{round_trip_distance_km:.2f}" if isinstance(round_trip_distance_km, (int, float)) else "0.00",
+        int(fuel_cost_round_trip_cop) if fuel_cost_round_trip_cop else 0,
+        int(toll_cost_round_trip_cop) if toll_cost_round_trip_cop else 0,
+        int(total_round_trip_cop) if total_round_trip_cop else 0
+    ]
+
 @app.route('/api/trips/export', methods=['GET'])
 def export_trips():
-    """Exporta todos los viajes a CSV con campos específicos y formato dinámico"""
-    trips = get_all_trips()
-    
-    if not trips:
-        return jsonify({'error': 'No hay viajes para exportar'}), 404
-    
-    # Campos específicos solicitados (tabla dinámica)
-    fieldnames = [
-        'Contratista',
-        'Ciudad Origen',
-        'Ciudad Destino',
-        'Total Recorrido (km)',
-        'Gasto Combustible (COP)',
-        'Gasto Peajes (COP)',
-        'Total (COP)'
-    ]
+    """
+    Exporta los viajes a CSV con campos específicos y formato dinámico
     
-    # Crear CSV en memoria con campos específicos
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=fieldnames, delimiter=',', quoting=csv.QUOTE_MINIMAL)
-    writer.writeheader()
-    
-    # Procesar cada viaje y extraer solo los campos necesarios
-    for trip in trips:
-        # Obtener valores de la base de datos
-        contractor_name = trip.get('contractor_name', '')
-        origin_city = trip.get('origin_city', '')
-        destination_text = trip.get('destination_text', '')
-        round_trip_distance_km = trip.get('round_trip_distance_km', 0)
-        fuel_cost_round_trip_cop = trip.get('fuel_cost_round_trip_cop', 0)
-        toll_cost_round_trip_cop = trip.get('toll_cost_round_trip_cop', 0)
-        total_round_trip_cop = trip.get('total_round_trip_cop', 0)
-        
-        # Formatear valores numéricos (sin decimales para enteros, con 2 decimales para km)
-        row = {
-            'Contratista': contractor_name,
-            'Ciudad Origen': origin_city,
-            'Ciudad Destino': destination_text,
-            'Total Recorrido (km)': f"{round_trip_distance_km:.2f}" if isinstance(round_trip_distance_km, (int, float)) else "0.00",
-            'Gasto Combustible (COP)': int(fuel_cost_round_trip_cop) if fuel_cost_round_trip_cop else 0,
-            'Gasto Peajes (COP)': int(toll_cost_round_trip_cop) if toll_cost_round_trip_cop else 0,
-            'Total (COP)': int(total_round_trip_cop) if total_round_trip_cop else 0
-        }
-        writer.writerow(row)
+    El CSV se envía en streaming: las filas se leen del cursor en bloques de
+    EXPORT_CHUNK_ROWS y se escriben a medida que llegan (memoria constante).
+    Acepta los mismos filtros que /api/trips (contractor, origin, destination,
+    date_from, date_to) y since: solo viajes ingresados después de esa marca. El
+    header X-Export-Watermark trae el ingest_seq más alto exportado (orden de ingreso
+    en el servidor, no created_at), para pasarlo como since en la siguiente
+    exportación incremental
+    """
+    try:
+        where, params = _trip_filters(
+            contractor=request.args.get('contractor', '').strip() or None,
+            origin=request.args.get('origin', '').strip() or None,
+            destination=request.args.get('destination', '').strip() or None,
+            date_from=request.args.get('date_from', '').strip() or None,
+            date_to=request.args.get('date_to', '').strip() or None
+        )
+        since = request.args.get('since', '').strip()
+        if since:
+            where.append('ingest_seq > ?')
+            params.append(int(since))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Error en parámetros: {str(e)}'}), 400
     
-    # Crear respuesta
-    output.seek(0)
-    csv_content = output.getvalue()
+    where_sql = (' WHERE ' + ' AND '.join(where)) if where else ''
+    # La conexión del request sigue tomada hasta el teardown, que llega al terminar el streaming
+    with db_connection() as conn:
+        # Marca fija al empezar: los viajes guardados durante la descarga quedan para la siguiente
+        watermark = conn.execute(f'SELECT MAX(ingest_seq) FROM trips{where_sql}', params).fetchone()[0]
+        if watermark is None:
+            return jsonify({'error': 'No hay viajes para exportar'}), 404
+        # +ingest_seq: el tope no usa el índice de ingest_seq, así el orden sale del de created_at
+        cursor = conn.execute(
+            f'SELECT {EXPORT_COLUMNS} FROM trips{where_sql}{" AND" if where else " WHERE"} +ingest_seq <= ? '
+            'ORDER BY created_at DESC, id DESC',
+            params + [watermark]
+        )
+        first_chunk = cursor.fetchmany(EXPORT_CHUNK_ROWS)
     
-    # Agregar BOM para Excel (UTF-8 con BOM) - permite abrir correctamente en Excel
-    csv_bytes = '\ufeff'.encode('utf-8') + csv_content.encode('utf-8')
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+        # BOM para Excel (UTF-8 con BOM) - permite abrir correctamente en Excel
+        buffer.write('\ufeff')
+        writer.writerow(EXPORT_FIELDNAMES)
+        chunk = first_chunk
+        try:
+            while chunk:
+                for trip in chunk:
+                    writer.writerow(_export_row(trip))
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                chunk = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        finally:
+            cursor.close()  # También si el cliente corta la descarga
     
-    return send_file(
-        io.BytesIO(csv_bytes),
+    filename = f'biatrack_trips_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return Response(
+        stream_with_context(generate()),
         mimetype='text/csv; charset=utf-8',
-        as_attachment=True,
-        download_name=f'biatrack_trips_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'X-Export-Watermark': str(watermark)
+        }
     )
 
 # Inicializar base de datos solo si no estamos en Vercel
@@ -0,0 +1,183 @@
+"""
+Benchmark de las rutas críticas de geometría y cálculo de peajes
+Genera rutas sintéticas por Colombia (100 a 50.000 vértices) sobre los peajes
+reales de data/tolls_data.json y guarda los tiempos en JSON para comparar commits
+
+Uso:
+    python benchmark_tolls.py
+    python benchmark_tolls.py --sizes 100 1000 --output bench.json
+    python benchmark_tolls.py --compare bench_anterior.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.toll_calculator import (
+    TOLLS,
+    PreparedRoute,
+    _calcular_peajes,
+    haversine_m,
+    min_distance_point_to_polyline_m,
+    pick_best_route_geometry,
+    polyline_length_m,
+    route_from_linestring,
+)
+from services.route_utils import truncate_route_from_point
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+
+
+def synthetic_route(n_points: int, seed: int):
+    """
+    Ruta sintética con n_points vértices que pasa por 3 peajes activos reales
+    (recorrido suave con pequeñas desviaciones, similar a una geometría de OSRM)
+    Retorna (geometry GeoJSON, origin_latlon, dest_latlon)
+    """
+    rnd = random.Random(seed)
+    tolls = [t for t in TOLLS if t.get('status') == 'ACTIVE' and 'latitude' in t and 'longitude' in t]
+    waypoints = [(float(t['latitude']), float(t['longitude'])) for t in rnd.sample(tolls, 3)]
+    origin = (waypoints[0][0] + 0.05, waypoints[0][1] + 0.05)
+    waypoints = [origin] + waypoints
+
+    per_leg = max(1, (n_points - 1) // (len(waypoints) - 1))
+    coords = []
+    for (lat_a, lon_a), (lat_b, lon_b) in zip(waypoints, waypoints[1:]):
+        for k in range(per_leg):
+            t = k / per_leg
+            wiggle = 0.002 * math.sin(t * math.pi * 12)
+            coords.append([lon_a + (lon_b - lon_a) * t + wiggle, lat_a + (lat_b - lat_a) * t - wiggle])
+    while len(coords) < n_points - 1:
+        coords.append(coords[-1])
+    coords.append([waypoints[-1][1], waypoints[-1][0]])
+    return {'type': 'LineString', 'coordinates': coords}, origin, waypoints[-1]
+
+
+def time_call(fn, repeat: int, number: int = 1):
+    """Tiempos (ms por llamada) de repeat rondas de number llamadas"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000.0 / number)
+    return {
+        'min_ms': round(min(samples), 4),
+        'median_ms': round(statistics.median(samples), 4),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def run_benchmarks(sizes, repeat: int):
+    results = {}
+
+    a, b = (4.6097, -74.0817), (7.0653, -73.8547)
+    results['haversine_m'] = time_call(lambda: haversine_m(a, b), repeat, number=10000)
+
+    for n in sizes:
+        geometry, origin, dest = synthetic_route(n, seed=n)
+        route = route_from_linestring(geometry)
+        toll_point = route[len(route) // 2]
+        alternatives = [geometry] + [synthetic_route(n, seed=n + k)[0] for k in (1, 2)]
+        # Menos repeticiones en rutas grandes para que el benchmark termine en tiempo razonable
+        reps = repeat if n <= 10000 else max(1, repeat // 2)
+
+        results[f'n={n}'] = {
+            'polyline_length_m': time_call(lambda: polyline_length_m(route), reps),
+            'min_distance_point_to_polyline_m': time_call(
+                lambda: min_distance_point_to_polyline_m(toll_point, route), reps
+            ),
+            'prepared_route': time_call(lambda: PreparedRoute(route), reps),
+            '_calcular_peajes': time_call(
+                lambda: _calcular_peajes(
+                    geometry, threshold_m=1000.0, origin_latlon=origin, dest_latlon=dest, use_cache=False
+                ),
+                reps,
+            ),
+            'truncate_route_from_point': time_call(lambda: truncate_route_from_point(route, toll_point), reps),
+            'pick_best_route_geometry': time_call(
+                lambda: pick_best_route_geometry(alternatives, origin, dest), reps
+            ),
+        }
+        print(f"[INFO] n={n}: " + ', '.join(
+            f"{name}={r['median_ms']:.2f}ms" for name, r in results[f'n={n}'].items()
+        ))
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(current: dict, previous: dict):
+    """Imprime la razón de tiempos (actual / anterior) por benchmark"""
+    print("\n" + "=" * 60)
+    print(f"Comparación con {previous.get('commit', '?')} (ratio > 1 = más lento)")
+    print("=" * 60)
+    for group, entries in current['results'].items():
+        old_entries = previous.get('results', {}).get(group)
+        if not old_entries:
+            continue
+        if 'median_ms' in entries:
+            entries, old_entries = {group: entries}, {group: old_entries}
+        for name, r in entries.items():
+            old = old_entries.get(name)
+            if old and old.get('median_ms'):
+                ratio = r['median_ms'] / old['median_ms']
+                flag = '  <-- regresión' if ratio > 1.2 else ''
+                print(f"  {group:>8} {name:<34} {old['median_ms']:>10.3f} -> {r['median_ms']:>10.3f} ms  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de geometría y cálculo de peajes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Vértices por ruta')
+    parser.add_argument('--repeat', type=int, default=5, help='Rondas por benchmark')
+    parser.add_argument('--output', default='benchmark_results.json', help='Archivo JSON de salida')
+    parser.add_argument('--compare', help='JSON de una corrida anterior para comparar')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Benchmark de peajes - BiaTrack")
+    print("=" * 60)
+    print(f"[INFO] Peajes cargados: {len(TOLLS)}")
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'tolls': len(TOLLS),
+        'sizes': args.sizes,
+        'results': run_benchmarks(args.sizes, args.repeat),
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
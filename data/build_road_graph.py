@@ -0,0 +1,184 @@
+"""
+Genera el grafo vial compacto (data/road_graph.bin) para el motor de rutas offline
+(services/offline_router.py) a partir de un GeoJSON de vías
+
+Entrada: FeatureCollection con LineString/MultiLineString y propiedades estilo
+OpenStreetMap (highway, oneway, maxspeed), p. ej. exportado de un extracto de
+Colombia con:
+    osmium tags-filter colombia-latest.osm.pbf w/highway=motorway,trunk,primary,secondary,motorway_link,trunk_link,primary_link,secondary_link -o vias.osm.pbf
+    ogr2ogr -f GeoJSON vias.geojson vias.osm.pbf lines
+
+Uso:
+    python data/build_road_graph.py vias.geojson
+    python data/build_road_graph.py vias.geojson --output data/road_graph.bin --classes primary secondary
+    python data/build_road_graph.py vias.geojson --include-untagged   # también líneas sin highway
+"""
+
+import argparse
+import json
+import os
+import sys
+from array import array
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.offline_router import COORD_SCALE, GRAPH_MAGIC, GRAPH_VERSION, HEADER, DEFAULT_GRAPH_FILE, haversine_m
+
+# Velocidad por defecto (km/h) según el tipo de vía
+DEFAULT_SPEEDS = {
+    'motorway': 90, 'motorway_link': 50,
+    'trunk': 80, 'trunk_link': 45,
+    'primary': 70, 'primary_link': 40,
+    'secondary': 55, 'secondary_link': 35,
+    'tertiary': 45, 'tertiary_link': 30,
+}
+DEFAULT_CLASSES = [
+    'motorway', 'motorway_link', 'trunk', 'trunk_link',
+    'primary', 'primary_link', 'secondary', 'secondary_link'
+]
+FALLBACK_SPEED = 40
+
+Coord = Tuple[int, int]  # (lat, lon) en microgrados
+
+
+def _speed(props: Dict) -> int:
+    maxspeed = str(props.get('maxspeed') or '').split()[0] if props.get('maxspeed') else ''
+    if maxspeed.isdigit():
+        return max(5, min(255, int(maxspeed)))
+    return DEFAULT_SPEEDS.get(props.get('highway'), FALLBACK_SPEED)
+
+
+def _oneway(props: Dict) -> int:
+    """1 = solo en el sentido de la geometría, -1 = sentido contrario, 0 = doble sentido"""
+    value = str(props.get('oneway', '')).lower()
+    if value in ('yes', 'true', '1'):
+        return 1
+    if value == '-1':
+        return -1
+    if props.get('highway') == 'motorway' and value != 'no':
+        return 1
+    return 0
+
+
+def _lines(feature: Dict) -> List[List[Coord]]:
+    geometry = feature.get('geometry') or {}
+    if geometry.get('type') == 'LineString':
+        parts = [geometry['coordinates']]
+    elif geometry.get('type') == 'MultiLineString':
+        parts = geometry['coordinates']
+    else:
+        return []
+    lines = []
+    for part in parts:
+        line = []
+        for lon, lat, *_ in part:
+            point = (round(lat * COORD_SCALE), round(lon * COORD_SCALE))
+            if not line or line[-1] != point:
+                line.append(point)
+        if len(line) >= 2:
+            lines.append(line)
+    return lines
+
+
+def build_graph(features: List[Dict], classes: List[str], include_untagged: bool = False):
+    """
+    Nodos = extremos de cada vía y vértices compartidos por más de una vía.
+    Las líneas sin etiqueta highway (ríos, límites...) se descartan salvo include_untagged
+    """
+    ways = []
+    for feature in features:
+        props = feature.get('properties') or {}
+        highway = props.get('highway')
+        if highway not in classes and not (include_untagged and not highway):
+            continue
+        for line in _lines(feature):
+            ways.append((line, _speed(props), _oneway(props)))
+
+    # Vértices usados más de una vez (intersecciones) o extremos de una vía
+    uses: Dict[Coord, int] = {}
+    for line, _, _ in ways:
+        for k, point in enumerate(line):
+            extra = 2 if k in (0, len(line) - 1) else 1
+            uses[point] = uses.get(point, 0) + extra
+
+    node_ids: Dict[Coord, int] = {}
+    edges = []  # (origen, destino, longitud_m, velocidad, vértices intermedios)
+    for line, speed, oneway in ways:
+        start = 0
+        for k in range(1, len(line)):
+            if uses[line[k]] < 2 and k < len(line) - 1:
+                continue
+            segment = line[start:k + 1]
+            a = node_ids.setdefault(segment[0], len(node_ids))
+            b = node_ids.setdefault(segment[-1], len(node_ids))
+            length = sum(
+                haversine_m(p[0] / COORD_SCALE, p[1] / COORD_SCALE, q[0] / COORD_SCALE, q[1] / COORD_SCALE)
+                for p, q in zip(segment, segment[1:])
+            )
+            if oneway >= 0:
+                edges.append((a, b, length, speed, segment[1:-1]))
+            if oneway <= 0:
+                edges.append((b, a, length, speed, segment[-2:0:-1]))
+            start = k
+
+    return node_ids, edges
+
+
+def write_graph(path: str, node_ids: Dict[Coord, int], edges) -> None:
+    n_nodes = len(node_ids)
+    lat = array('i', [0]) * n_nodes
+    lon = array('i', [0]) * n_nodes
+    for (p_lat, p_lon), idx in node_ids.items():
+        lat[idx] = p_lat
+        lon[idx] = p_lon
+
+    edges.sort(key=lambda e: e[0])  # CSR: arcos agrupados por nodo de origen
+    offsets = array('I', [0]) * (n_nodes + 1)
+    for a, *_ in edges:
+        offsets[a + 1] += 1
+    for i in range(n_nodes):
+        offsets[i + 1] += offsets[i]
+
+    targets = array('I', (e[1] for e in edges))
+    length_m = array('f', (e[2] for e in edges))
+    speed_kmh = array('B', (e[3] for e in edges))
+    shape_offsets = array('I', [0])
+    shape_lat = array('i')
+    shape_lon = array('i')
+    for *_, shape in edges:
+        for p_lat, p_lon in shape:
+            shape_lat.append(p_lat)
+            shape_lon.append(p_lon)
+        shape_offsets.append(len(shape_lat))
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, 0, n_nodes, len(edges), len(shape_lat)))
+        for arr in (lat, lon, offsets, targets, length_m, speed_kmh, shape_offsets, shape_lat, shape_lon):
+            if sys.byteorder != 'little':
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            f.write(arr.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera el grafo vial offline desde un GeoJSON de vías')
+    parser.add_argument('input', help='GeoJSON (FeatureCollection) de vías')
+    parser.add_argument('--output', default=DEFAULT_GRAPH_FILE, help='Archivo binario de salida')
+    parser.add_argument('--classes', nargs='+', default=DEFAULT_CLASSES, help='Tipos de vía (highway) a incluir')
+    parser.add_argument('--include-untagged', action='store_true',
+                        help='Incluir también las líneas sin etiqueta highway')
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        features = json.load(f).get('features', [])
+
+    node_ids, edges = build_graph(features, args.classes, include_untagged=args.include_untagged)
+    if not edges:
+        raise SystemExit('No se encontraron vías en el GeoJSON de entrada')
+    write_graph(args.output, node_ids, edges)
+    print(f"OK -> {args.output} ({len(node_ids)} nodos, {len(edges)} arcos, {os.path.getsize(args.output) / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Descarga el listado DIVIPOLA de municipios de Colombia (DANE) desde datos.gov.co
+y lo guarda en data/municipios_colombia.json para el gazetteer offline
+(services/gazetteer.py): código, nombre, departamento y centroide de cada municipio
+
+Uso:
+    python data/download_municipios.py
+    python data/download_municipios.py --url https://www.datos.gov.co/resource/gdxc-w37w.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.gazetteer import MIN_COMPLETE_MUNICIPIOS
+
+# DIVIPOLA - Códigos municipios (API Socrata de datos.gov.co)
+DEFAULT_URL = "https://www.datos.gov.co/resource/gdxc-w37w.json"
+
+OUTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "municipios_colombia.json")
+PAGE_SIZE = 1000
+
+# Nombres de columnas posibles según la versión del dataset
+CODE_FIELDS = ("cod_mpio", "codigo_municipio", "cod_municipio")
+NAME_FIELDS = ("nom_mpio", "nombre_municipio", "municipio")
+DEPT_FIELDS = ("dpto", "nom_dpto", "departamento", "nombre_departamento")
+LAT_FIELDS = ("latitud", "lat")
+LON_FIELDS = ("longitud", "lon")
+
+
+def _field(row: Dict[str, Any], names) -> Optional[Any]:
+    for name in names:
+        if row.get(name) not in (None, ""):
+            return row[name]
+    return None
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        # Algunas versiones usan coma decimal
+        return float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    code = _field(row, CODE_FIELDS)
+    name = _field(row, NAME_FIELDS)
+    dept = _field(row, DEPT_FIELDS)
+    lat = _number(_field(row, LAT_FIELDS))
+    lon = _number(_field(row, LON_FIELDS))
+    if not code or not name or lat is None or lon is None:
+        return None
+    return {
+        "code": str(code).split(".")[0].zfill(5),
+        "name": str(name).strip().title().replace(" De ", " de ").replace(" Del ", " del ").replace(" La ", " la "),
+        "department": str(dept or "").strip().title(),
+        "lat": round(lat, 4),
+        "lon": round(lon, 4),
+    }
+
+
+def fetch_all(url: str) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    offset = 0
+    while True:
+        r = requests.get(url, params={"$limit": PAGE_SIZE, "$offset": offset}, timeout=60)
+        r.raise_for_status()
+        page = r.json()
+        if not page:
+            break
+        rows.extend(page)
+        print(f"Offset {offset}: +{len(page)} (total {len(rows)})")
+        offset += PAGE_SIZE
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Descarga municipios DIVIPOLA para el gazetteer offline")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Endpoint JSON del dataset DIVIPOLA")
+    parser.add_argument("--output", default=OUTFILE, help="Archivo JSON de salida")
+    args = parser.parse_args()
+
+    municipios = {}
+    for row in fetch_all(args.url):
+        m = parse_row(row)
+        if m:
+            municipios[m["code"]] = m
+
+    if not municipios:
+        raise SystemExit("No se obtuvieron municipios (revisar URL o columnas del dataset)")
+
+    if len(municipios) < MIN_COMPLETE_MUNICIPIOS:
+        raise SystemExit(
+            f"Solo {len(municipios)} municipios con coordenadas (se esperan al menos "
+            f"{MIN_COMPLETE_MUNICIPIOS}): el gazetteer no reemplazaría a Nominatim, no se guarda"
+        )
+
+    result = sorted(municipios.values(), key=lambda m: m["code"])
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"OK -> {args.output} ({len(result)} municipios)")
+
+
+if __name__ == "__main__":
+    main()
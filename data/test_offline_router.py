@@ -0,0 +1,149 @@
+"""
+Prueba del motor de rutas offline sobre un grafo pequeño (data/road_graph_fixture.geojson)
+Genera el grafo con build_road_graph en un archivo temporal, lo carga con get_graph y
+compara route() (A* sobre el CSR) contra un Dijkstra simple sobre los arcos de build_graph.
+Revisa además el sentido único de la autopista, que se descarten las vías fuera de las
+clases pedidas y las líneas sin highway, y la ruta completa por services.routing.
+
+Uso:
+    python data/test_offline_router.py
+"""
+
+import heapq
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp(prefix='biatrack_grafo_')
+GRAPH_FILE = os.path.join(TMP_DIR, 'road_graph.bin')
+# El motor de services.routing usa el grafo por defecto: apuntarlo al de la prueba antes de importar
+os.environ['ROAD_GRAPH_FILE'] = GRAPH_FILE
+os.environ['ROUTE_CACHE_DB'] = os.path.join(TMP_DIR, 'route_cache.db')
+
+from services.offline_router import COORD_SCALE, get_graph, haversine_m
+from data.build_road_graph import DEFAULT_CLASSES, build_graph, write_graph
+
+FIXTURE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'road_graph_fixture.geojson')
+TOLERANCE_M = 1.0
+TOLERANCE_S = 0.5
+
+# Cruces del fixture (lat, lon)
+SUR_OESTE = (5.50, -73.40)
+SUR_ESTE = (5.50, -73.20)
+NORTE_OESTE = (5.60, -73.40)
+NORTE_ESTE = (5.60, -73.20)
+RIO = (5.30, -73.00)
+
+
+def dijkstra(n_nodes, edges, source, target):
+    """(distancia_m, duración_s) del camino más rápido según los arcos de build_graph, o None"""
+    adjacency = [[] for _ in range(n_nodes)]
+    for a, b, length, speed, _ in edges:
+        adjacency[a].append((b, length, length / (speed / 3.6)))
+    best = {source: 0.0}
+    heap = [(0.0, 0.0, source)]
+    while heap:
+        duration, distance, node = heapq.heappop(heap)
+        if node == target:
+            return distance, duration
+        if duration > best.get(node, float('inf')):
+            continue
+        for nxt, length, seconds in adjacency[node]:
+            if duration + seconds < best.get(nxt, float('inf')):
+                best[nxt] = duration + seconds
+                heapq.heappush(heap, (duration + seconds, distance + length, nxt))
+    return None
+
+
+def line_length_m(coords):
+    return sum(haversine_m(a[1], a[0], b[1], b[0]) for a, b in zip(coords, coords[1:]))
+
+
+def check_against_dijkstra(graph, node_ids, edges, errors):
+    nodes = sorted(node_ids.items(), key=lambda item: item[1])
+    for (a_lat, a_lon), a in nodes:
+        for (b_lat, b_lon), b in nodes:
+            if a == b:
+                continue
+            origin = (a_lat / COORD_SCALE, a_lon / COORD_SCALE)
+            dest = (b_lat / COORD_SCALE, b_lon / COORD_SCALE)
+            expected = dijkstra(len(node_ids), edges, a, b)
+            got = graph.route(*origin, *dest)
+            label = f"{origin} -> {dest}"
+            if expected is None or got is None:
+                if (expected is None) != (got is None):
+                    errors.append(f"{label}: route() = {got is not None}, Dijkstra = {expected is not None}")
+                continue
+            if abs(got['distance_m'] - expected[0]) > TOLERANCE_M or abs(got['duration_s'] - expected[1]) > TOLERANCE_S:
+                errors.append(
+                    f"{label}: {got['distance_m']:.0f} m / {got['duration_s']:.0f} s, "
+                    f"Dijkstra {expected[0]:.0f} m / {expected[1]:.0f} s"
+                )
+            coords = got['geometry']['coordinates']
+            if coords[0] != [origin[1], origin[0]] or coords[-1] != [dest[1], dest[0]]:
+                errors.append(f"{label}: la geometría no empieza/termina en los puntos pedidos")
+            if abs(line_length_m(coords) - got['distance_m']) > TOLERANCE_M:
+                errors.append(f"{label}: la geometría mide {line_length_m(coords):.0f} m, distance_m {got['distance_m']:.0f} m")
+
+
+def main():
+    errors = []
+    with open(FIXTURE_FILE, 'r', encoding='utf-8') as f:
+        features = json.load(f)['features']
+
+    node_ids, edges = build_graph(features, DEFAULT_CLASSES)
+    write_graph(GRAPH_FILE, node_ids, edges)
+    graph = get_graph(GRAPH_FILE)
+    if graph is None:
+        print("ERROR: get_graph no cargó el grafo del fixture")
+        sys.exit(1)
+    # 6 cruces: los vértices que usa una sola vía quedan como forma de los arcos
+    if len(graph) != 6:
+        errors.append(f"El grafo tiene {len(graph)} nodos, se esperaban 6")
+
+    check_against_dijkstra(graph, node_ids, edges, errors)
+
+    # La autopista (sentido único) es el camino más rápido de ida pero no sirve de regreso
+    autopista = [f for f in features if f['properties'].get('highway') == 'motorway'][0]
+    ida = graph.route(*SUR_OESTE, *NORTE_ESTE)
+    regreso = graph.route(*NORTE_ESTE, *SUR_OESTE)
+    if ida is None or abs(ida['distance_m'] - line_length_m(autopista['geometry']['coordinates'])) > TOLERANCE_M:
+        errors.append(f"La ida no va por la autopista: {ida and ida['distance_m']:.0f} m")
+    if regreso is None or regreso['distance_m'] <= ida['distance_m'] + 1000:
+        errors.append("El regreso usa la autopista en contravía")
+
+    # La calle residencial no está en las clases del grafo: no se puede usar de atajo
+    residencial = graph.route(*NORTE_OESTE, *SUR_ESTE)
+    if residencial is None or residencial['distance_m'] < 30000:
+        errors.append(f"La ruta usa la calle residencial: {residencial and residencial['distance_m']:.0f} m")
+
+    # El río no tiene highway: queda fuera del grafo (el punto está lejos de cualquier vía)
+    if graph.route(*RIO, 5.30, -72.90) is not None:
+        errors.append("El río (sin highway) quedó como vía en el grafo")
+    con_rio, _ = build_graph(features, DEFAULT_CLASSES, include_untagged=True)
+    if len(con_rio) != len(node_ids) + 2:
+        errors.append(f"include_untagged: {len(con_rio)} nodos, se esperaban {len(node_ids) + 2}")
+
+    if get_graph(os.path.join(TMP_DIR, 'no_existe.bin')) is not None:
+        errors.append("get_graph devolvió un grafo para un archivo inexistente")
+
+    # Ruta completa por el motor offline de services.routing
+    from services import routing
+    routing.set_routing_backend('offline')
+    ruta = routing.calcular_ruta_con_trafico(*SUR_OESTE, *NORTE_ESTE, use_cache=False)
+    if ruta is None or abs(ruta['distance_km'] * 1000 - ida['distance_m']) > 10:
+        errors.append(f"calcular_ruta_con_trafico (offline) no coincide con route(): {ruta}")
+
+    if errors:
+        print(f"ERROR: {len(errors)} fallas en el motor de rutas offline")
+        for error in errors[:20]:
+            print(f"  - {error}")
+        sys.exit(1)
+    print(f"OK: motor offline ({len(graph)} nodos, {len(edges)} arcos) coincide con Dijkstra")
+
+
+if __name__ == '__main__':
+    main()
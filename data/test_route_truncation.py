@@ -0,0 +1,108 @@
+"""
+Prueba de regresión del truncado de la ruta en el primer peaje
+Compara la geometría que arma la app (ruta simplificada para buscar peajes, cola con
+los vértices completos de OSRM: _geometria_truncada) contra el truncado de la versión
+original: truncate_route_from_point sobre la ruta completa en el mismo punto.
+También revisa el formato compacto: ida.geometry como GeometryOffset dentro de
+geometry_full codificada (_geometria_desde_offset) debe dar las mismas coordenadas.
+Las rutas son fijas (semillas): una recta y curvas con ruido.
+
+Uso:
+    python data/test_route_truncation.py
+"""
+
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.toll_calculator import PreparedRoute, haversine_m, route_from_linestring
+from services.route_utils import truncate_route_from_point
+from services.polyline import decode_polyline
+import app
+
+SEEDS = [0, 1, 2, 3]
+POINTS_PER_ROUTE = 2000
+TOLERANCES_M = [0.0, 5.0, 25.0]  # 0 = sin simplificar
+CUTS_PER_ROUTE = 5
+TOLERANCE_M = 0.5  # Diferencia máxima aceptada por coordenada
+PRECISION = 6  # Precisión de la polilínea en el formato compacto (~0.1 m)
+
+
+def make_geometry(seed):
+    """GeoJSON LineString: recta (semilla 0) o curva con ruido"""
+    rnd = random.Random(seed)
+    lon, lat = -74.0, 4.0
+    coordinates = []
+    for i in range(POINTS_PER_ROUTE):
+        if seed == 0:
+            lon += 1e-4
+        else:
+            lon += 1e-4 * math.cos(i / (20 + 10 * seed)) + rnd.uniform(-2e-6, 2e-6)
+            lat += 1e-4 * math.sin(i / (30 + 7 * seed)) + rnd.uniform(-2e-6, 2e-6)
+        coordinates.append([lon, lat])
+    return {'type': 'LineString', 'coordinates': coordinates}
+
+
+def point_at(route, distance_m):
+    """Punto (lat, lon) a distance_m del inicio recorriendo la ruta completa"""
+    accumulated = 0.0
+    for a, b in zip(route, route[1:]):
+        length = haversine_m(a, b)
+        if accumulated + length >= distance_m and length > 0:
+            t = (distance_m - accumulated) / length
+            return (a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1]))
+        accumulated += length
+    return route[-1]
+
+
+def resolve_offset(geometry_full, geometry):
+    """Coordenadas de un GeometryOffset como las arma el cliente: [start] + geometry_full[offset:]"""
+    coordinates = decode_polyline(geometry_full['polyline'], geometry_full['precision'])
+    return ([geometry['start']] if 'start' in geometry else []) + coordinates[geometry['offset']:]
+
+
+def compare(label, expected, got):
+    if len(expected) != len(got):
+        return [f"{label}: {len(got)} coordenadas, se esperaban {len(expected)}"]
+    worst = max(haversine_m((a[1], a[0]), (b[1], b[0])) for a, b in zip(expected, got))
+    if worst > TOLERANCE_M:
+        return [f"{label}: coordenada a {worst:.2f} m de la referencia"]
+    return []
+
+
+def main():
+    errors = []
+    total = 0
+    for seed in SEEDS:
+        geometry = make_geometry(seed)
+        full = route_from_linestring(geometry)
+        length_m = PreparedRoute(full).length_m
+        geometry_full = app._polilinea_codificada(geometry, PRECISION)
+        rnd = random.Random(100 + seed)
+        for distance_m in [rnd.uniform(200.0, length_m - 200.0) for _ in range(CUTS_PER_ROUTE)]:
+            expected = [[lon, lat] for lat, lon in truncate_route_from_point(full, point_at(full, distance_m))]
+            for tolerance_m in TOLERANCES_M:
+                route = PreparedRoute.from_geojson(geometry, simplify_tolerance_m=tolerance_m)
+                truncated = route.truncate(distance_m)
+                label = (f"semilla {seed}, corte {distance_m:.0f} m, simplificación {tolerance_m:.0f} m "
+                         f"({len(route)} vértices)")
+                got = app._geometria_truncada(geometry, route, truncated)['coordinates']
+                total += 1
+                errors.extend(compare(label, expected, got))
+                compact = resolve_offset(geometry_full, app._geometria_desde_offset(route, truncated))
+                errors.extend(compare(f"{label}, GeometryOffset", expected, compact))
+
+    print(f"Cortes comparados: {total}")
+    if errors:
+        print(f"ERROR: {len(errors)} diferencias con el truncado sobre la ruta completa")
+        for error in errors[:20]:
+            print(f"  - {error}")
+        sys.exit(1)
+    print("OK: el truncado (y su GeometryOffset) coincide con el de la ruta completa")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Prueba de regresión del emparejamiento de peajes con la ruta
+Compara los peajes encontrados (ids, distancia a la ruta y posición en la ruta)
+por el cálculo optimizado (índice espacial, corredor por tramos, NumPy) contra el
+recorrido de referencia: todos los peajes contra todos los segmentos con
+min_distance_point_to_polyline_m. Las rutas son fijas (semillas) y se arman sobre
+los peajes cargados.
+
+Uso:
+    python data/test_toll_matching.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.toll_calculator as tc
+from data.tolls import TOLLS
+
+SEEDS = [0, 1, 2, 3, 4, 5]
+POINTS_PER_ROUTE = 600
+THRESHOLDS_M = [1000.0, 5000.0]
+TOLERANCE_M = 1.0  # Diferencia máxima aceptada en distancias (redondeo de punto flotante)
+
+
+def make_route(seed):
+    """Ruta con ruido que pasa por tres peajes activos elegidos con la semilla"""
+    rnd = random.Random(seed)
+    activos = [t for t in TOLLS if t.get('status') == 'ACTIVE' and 'latitude' in t and 'longitude' in t]
+    a, b, c = rnd.sample(activos, 3)
+    waypoints = [
+        (a['latitude'] + 0.05, a['longitude'] + 0.05),
+        (a['latitude'], a['longitude']),
+        (b['latitude'] + 0.003, b['longitude']),
+        (c['latitude'], c['longitude'] - 0.004),
+    ]
+    per_leg = POINTS_PER_ROUTE // (len(waypoints) - 1)
+    route = []
+    for (lat_a, lon_a), (lat_b, lon_b) in zip(waypoints, waypoints[1:]):
+        for k in range(per_leg):
+            t = k / per_leg
+            route.append((
+                lat_a + (lat_b - lat_a) * t + rnd.uniform(-0.0005, 0.0005),
+                lon_a + (lon_b - lon_a) * t + rnd.uniform(-0.0005, 0.0005),
+            ))
+    route.append(waypoints[-1])
+    return route
+
+
+def reference_matches(route, threshold_m):
+    """{id: (d_perp_m, d_accumulated_m)} recorriendo todos los peajes y todos los segmentos (lento)"""
+    found = {}
+    for toll in TOLLS:
+        if toll.get('status') != 'ACTIVE' or 'latitude' not in toll or 'longitude' not in toll:
+            continue
+        point = (float(toll['latitude']), float(toll['longitude']))
+        d_perp_m, d_accumulated_m = tc.min_distance_point_to_polyline_m(point, route)
+        if d_perp_m <= threshold_m:
+            found[toll['id']] = (d_perp_m, d_accumulated_m)
+    return found
+
+
+def optimized_matches(route, threshold_m, with_index):
+    """{id: (d_perp_m, d_accumulated_m)} con el emparejamiento de toll_calculator"""
+    # Una copia de la lista se trata como lista externa: sin índice, solo el prefiltro por cajas
+    tolls_db = TOLLS if with_index else list(TOLLS)
+    store = tc._get_toll_store(tolls_db, with_index=with_index)
+    matches = tc._emparejar_peajes(tc.PreparedRoute(route), tolls_db, threshold_m, toll_store=store)
+    return {toll.id: (d_perp_m, d_acc_m) for toll, _, _, d_perp_m, d_acc_m, _ in matches.candidates}
+
+
+def compare(label, expected, got):
+    errors = []
+    if set(expected) != set(got):
+        errors.append(f"{label}: ids distintos, faltan {sorted(set(expected) - set(got))}, "
+                      f"sobran {sorted(set(got) - set(expected))}")
+    for toll_id in set(expected) & set(got):
+        (ref_perp, ref_acc), (perp, acc) = expected[toll_id], got[toll_id]
+        if abs(ref_perp - perp) > TOLERANCE_M or abs(ref_acc - acc) > TOLERANCE_M:
+            errors.append(f"{label}: peaje {toll_id} d_perp {ref_perp:.1f} vs {perp:.1f}, "
+                          f"posición {ref_acc:.1f} vs {acc:.1f}")
+    return errors
+
+
+def main():
+    errors = []
+    total = 0
+    variants = [('índice + numpy', True, True), ('sin índice + numpy', False, True), ('índice sin numpy', True, False)]
+    numpy_module = tc.np
+    for seed in SEEDS:
+        route = make_route(seed)
+        reference = reference_matches(route, max(THRESHOLDS_M))
+        for threshold_m in THRESHOLDS_M:
+            expected = {k: v for k, v in reference.items() if v[0] <= threshold_m}
+            total += len(expected)
+            for name, with_index, use_numpy in variants:
+                if use_numpy and numpy_module is None:
+                    continue
+                tc.np = numpy_module if use_numpy else None
+                try:
+                    got = optimized_matches(route, threshold_m, with_index)
+                finally:
+                    tc.np = numpy_module
+                errors.extend(compare(f"semilla {seed}, umbral {threshold_m:.0f} m, {name}", expected, got))
+
+    print(f"Rutas: {len(SEEDS)} x {len(THRESHOLDS_M)} umbrales, peajes emparejados (referencia): {total}")
+    if errors:
+        print(f"ERROR: {len(errors)} diferencias con el recorrido de referencia")
+        for error in errors[:20]:
+            print(f"  - {error}")
+        sys.exit(1)
+    print("OK: el emparejamiento coincide con el recorrido de referencia")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Almacén columnar de peajes
+Se construye una vez al cargar los peajes: columnas compactas (array('d')) de
+lat/lon solo para los peajes ACTIVOS con coordenadas, listas para el
+cálculo de peajes en ruta sin recorrer ni convertir los dicts en cada request
+"""
+
+import hashlib
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class TollRecord:
+    """
+    Peaje activo con coordenadas (registro liviano con __slots__)
+    Soporta acceso tipo dict con get() para el código que espera dicts
+    """
+
+    __slots__ = ('id', 'name', 'department', 'operator', 'fare_cop', 'status', 'latitude', 'longitude')
+
+    def __init__(self, toll: Dict, latitude: float, longitude: float):
+        self.id = toll.get('id')
+        self.name = toll.get('name')
+        self.department = toll.get('department')
+        self.operator = toll.get('operator')
+        self.fare_cop = toll.get('fare_cop', 0)
+        self.status = toll.get('status')
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def to_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class TollStore:
+    """
+    Peajes en formato columnar:
+    - tolls: la lista de dicts original (vista para /api/tolls y load_tolls.py)
+    - lat, lon: columnas compactas solo de los peajes ACTIVOS con coordenadas válidas
+    - records: TollRecord alineado con las columnas (nombre, tarifa, etc.)
+    - fingerprint: hash del contenido usado en el cálculo (id, coordenadas, tarifa)
+    """
+
+    def __init__(self, tolls: List[Dict]):
+        self.tolls = tolls
+        self.lat = array('d')
+        self.lon = array('d')
+        self.records: List[TollRecord] = []
+
+        for toll in tolls:
+            point = _active_point(toll)
+            if point is None:
+                continue
+            self.lat.append(point[0])
+            self.lon.append(point[1])
+            self.records.append(TollRecord(toll, point[0], point[1]))
+
+        h = hashlib.sha1()
+        for record in self.records:
+            h.update(repr((record.id, record.name, record.department, record.operator,
+                           record.fare_cop, record.latitude, record.longitude)).encode('utf-8'))
+        self.fingerprint = h.hexdigest()[:16]
+
+    def __len__(self) -> int:
+        """Cantidad de peajes en las columnas (activos con coordenadas)"""
+        return len(self.records)
+
+    def points(self) -> Iterator[Tuple[int, float, float]]:
+        """Itera (posición_en_columnas, lat, lon)"""
+        return zip(range(len(self.records)), self.lat, self.lon)
+
+
+def _active_point(toll: Dict) -> Optional[Tuple[float, float]]:
+    """Coordenadas (lat, lon) si el peaje está ACTIVO y las tiene válidas"""
+    if toll.get('status') != 'ACTIVE':
+        return None
+    if 'latitude' not in toll or 'longitude' not in toll:
+        return None
+    try:
+        return (float(toll['latitude']), float(toll['longitude']))
+    except (ValueError, TypeError):
+        return None
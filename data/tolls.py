@@ -5,6 +5,7 @@ Carga datos desde archivos o estructura directa
 
 import os
 from .tolls_parser import parse_toll_data_from_text, load_tolls_from_json, normalize_toll
+from .toll_store import TollStore
 
 # Peajes hardcoded - estructura directa
 HARDCODED_TOLLS = [
@@ -55,3 +56,7 @@ def load_tolls() -> list:
 
 # Cargar peajes al importar el módulo
 TOLLS = load_tolls()
+
+# Columnas compactas de los peajes activos con coordenadas (para el cálculo en ruta)
+TOLL_STORE = TollStore(TOLLS)
+
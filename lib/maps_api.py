@@ -7,6 +7,8 @@ import os
 import requests
 from dotenv import load_dotenv
 
+from services import http_client
+
 load_dotenv()
 
 DEFAULT_KM_PER_GALLON = 30  # Valor por defecto para vehículos livianos (Categoría I)
@@ -40,7 +42,6 @@ def get_route_data(origin: str, destination: str) -> dict:
         origin_encoded = f"{origin}, Colombia"
         destination_encoded = f"{destination}, Colombia"
         
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
         params = {
             'origins': origin_encoded,
             'destinations': destination_encoded,
@@ -49,7 +50,7 @@ def get_route_data(origin: str, destination: str) -> dict:
             'key': api_key
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get('google_maps', '/maps/api/distancematrix/json', params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
         
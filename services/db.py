@@ -0,0 +1,275 @@
+"""
+Pool de conexiones SQLite para la base de viajes
+Las conexiones quedan abiertas y se reutilizan entre requests: cada una se
+configura una sola vez (WAL, synchronous=NORMAL, caché de páginas) y conserva
+su caché de sentencias preparadas. En modo WAL los lectores no bloquean al
+escritor, así la página principal y POST /api/trip no se serializan en el archivo
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_CACHE_SIZE_KIB = int(os.environ.get('DB_CACHE_SIZE_KIB', '8192'))  # Caché de páginas por conexión
+DEFAULT_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', '8'))  # Conexiones libres que se conservan
+STATEMENT_CACHE_SIZE = 256  # Sentencias preparadas por conexión (clave: texto SQL)
+BUSY_TIMEOUT_S = 5.0
+
+
+def default_db_file() -> str:
+    """
+    Archivo de la base de datos de la app: DB_FILE si está definida; si no, en Vercel
+    (o donde exista /tmp) /tmp/biatrack.db, porque es lo único con escritura, y en
+    local biatrack.db
+    """
+    return os.environ.get('DB_FILE') or (os.path.join('/tmp', 'biatrack.db') if os.path.exists('/tmp') else 'biatrack.db')
+
+
+def default_cache_path(filename: str, env_var: str) -> str:
+    """
+    Ruta de un archivo de caché: la variable de entorno env_var si está definida; si no,
+    filename en el mismo directorio que la base de datos de la app
+    """
+    path = os.environ.get(env_var)
+    if path:
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(default_db_file())), filename)
+
+
+class ConnectionPool:
+    """
+    Conexiones SQLite reutilizables. Cada conexión la usa un solo hilo a la vez:
+    se toma con acquire() (o connection()) y se devuelve con release(), que
+    descarta cualquier transacción sin confirmar
+    """
+
+    def __init__(self, db_path: str, max_idle: int = DEFAULT_MAX_IDLE, cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.cache_size_kib = cache_size_kib
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.closed = 0
+        self.journal_mode = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False: la conexión puede pasar a otro hilo entre requests
+        # (nunca la usan dos hilos al mismo tiempo)
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_S,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row
+        mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kib)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        with self._lock:
+            self.opened += 1
+            if self.journal_mode != mode:
+                self.journal_mode = mode
+                if mode != 'wal':
+                    print(f"[WARNING] SQLite sin modo WAL ({self.db_path}): journal_mode={mode}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Conexión libre del pool (o una nueva si no hay)"""
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Devuelve la conexión al pool (se cierra si ya hay max_idle libres)"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._close(conn)
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        self._close(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Conexión del pool durante el bloque with"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        """Cierra las conexiones libres del pool"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def _close(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self.closed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'db_path': self.db_path,
+                'journal_mode': self.journal_mode,
+                'opened': self.opened,
+                'reused': self.reused,
+                'closed': self.closed,
+                'idle': len(self._idle),
+                'max_idle': self.max_idle,
+                'cache_size_kib': self.cache_size_kib
+            }
+
+
+class TwoTierCache:
+    """
+    Base de las cachés en dos niveles (rutas, geocoding, peajes): LRU en memoria
+    (OrderedDict con límite de entradas y, opcional, de bytes) delante de una tabla
+    SQLite key -> fila que sobrevive reinicios. Si la tabla no se puede crear la caché
+    queda solo en memoria.
+
+    Las subclases definen TABLE, COLUMNS (columnas además de key, con su tipo SQL) y
+    LABEL, y deciden qué guardan en memoria (entry) y en disco (fila de COLUMNS).
+    Los métodos _store, _discard y _memory_stats se llaman con self._lock tomado
+    """
+
+    TABLE = ''
+    COLUMNS: Tuple[Tuple[str, str], ...] = ()
+    LABEL = ''  # Para los mensajes: "Caché de <LABEL>"
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 1024, max_bytes: Optional[int] = None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        if db_path:
+            self._init_db()
+
+    def _entry_size(self, entry: Any) -> int:
+        """Bytes de una entrada en memoria (para max_bytes y las estadísticas)"""
+        return 0
+
+    # --- Memoria ---
+
+    def _lookup(self, key: str) -> Any:
+        """Entrada en memoria (la marca como usada) o None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: str, entry: Any) -> None:
+        """Inserta en el LRU en memoria y desaloja lo más viejo si se pasa de los límites"""
+        size = self._entry_size(entry)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = entry
+        self._bytes += size
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._entry_size(evicted)
+            self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= self._entry_size(old)
+
+    def _clear_memory(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _memory_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+            'persistent': bool(self.db_path)
+        }
+
+    # --- SQLite ---
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_S)
+
+    def _init_db(self) -> None:
+        columns = ',\n'.join(f'{name} {sql_type}' for name, sql_type in self.COLUMNS)
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {self.TABLE} (\nkey TEXT PRIMARY KEY,\n{columns}\n)')
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Caché de {self.LABEL} solo en memoria ({self.db_path}): {e}")
+            self.db_path = None
+
+    def _db_get(self, key: str) -> Optional[tuple]:
+        """Fila (en el orden de COLUMNS) o None; None también si no hay base o falla"""
+        if not self.db_path:
+            return None
+        names = ', '.join(name for name, _ in self.COLUMNS)
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(f'SELECT {names} FROM {self.TABLE} WHERE key = ?', (key,)).fetchone()
+            finally:
+                conn.close()
+            return tuple(row) if row else None
+        except sqlite3.Error as e:
+            print(f"[WARNING] Error leyendo caché de {self.LABEL}: {e}")
+            return None
+
+    def _db_put(self, key: str, row: tuple) -> None:
+        """Guarda la fila (valores en el orden de COLUMNS); sin base no hace nada"""
+        if not self.db_path:
+            return
+        names = ', '.join(name for name, _ in self.COLUMNS)
+        placeholders = ', '.join('?' * (len(self.COLUMNS) + 1))
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(f'INSERT OR REPLACE INTO {self.TABLE} (key, {names}) VALUES ({placeholders})', (key,) + tuple(row))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Error guardando caché de {self.LABEL}: {e}")
+
+    def _db_clear(self) -> None:
+        if not self.db_path:
+            return
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(f'DELETE FROM {self.TABLE}')
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Error vaciando caché de {self.LABEL}: {e}")
@@ -0,0 +1,170 @@
+"""
+Gazetteer offline de municipios de Colombia (DIVIPOLA - DANE)
+Índice de prefijos sobre un arreglo ordenado (bisect) con los nombres sin tildes
+ni mayúsculas, para el autocompletar y el geocoding de nombres de municipio.
+
+Solo reemplaza a Nominatim con el listado DIVIPOLA completo, generado con
+data/download_municipios.py. El repo trae una semilla parcial (las ciudades
+principales): con ella las consultas siguen yendo a Nominatim, el gazetteer solo
+adelanta resultados en el autocompletar y responde el geocoding cuando la consulta
+trae el departamento, porque un nombre suelto puede ser de un municipio que no
+está en la semilla ("Granada", "Rionegro")
+
+Datos: data/municipios_colombia.json (regenerar con data/download_municipios.py)
+"""
+
+import bisect
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from services.geocode_cache import fold_text
+
+MUNICIPIOS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'municipios_colombia.json')
+
+# DIVIPOLA tiene ~1.120 municipios; con menos entradas el listado es parcial
+MIN_COMPLETE_MUNICIPIOS = 1100
+
+# Primeras palabras que indican una dirección y no un municipio
+STREET_WORDS = {
+    'calle', 'cl', 'cll', 'carrera', 'cra', 'kr', 'cr', 'avenida', 'av', 'ak', 'ac',
+    'diagonal', 'dg', 'transversal', 'tv', 'autopista', 'km', 'kilometro', 'via',
+    'vereda', 'barrio', 'sector', 'manzana', 'mz', 'edificio', 'centro comercial'
+}
+
+
+def is_street_address(query: str) -> bool:
+    """
+    True si la consulta parece una dirección (números, '#', tipo de vía o más de
+    municipio + departamento); esas consultas siguen yendo a Nominatim
+    """
+    folded = fold_text(query)
+    if re.search(r'[0-9#]', folded):
+        return True
+    parts = [p.strip() for p in folded.split(',') if p.strip() and p.strip() != 'colombia']
+    if len(parts) > 2 or not parts:
+        return True
+    first_word = parts[0].split(' ', 1)[0]
+    return first_word in STREET_WORDS or parts[0] in STREET_WORDS
+
+
+def _split_query(query: str) -> Tuple[str, str]:
+    """'Duitama, Boyacá, Colombia' -> ('duitama', 'boyaca')"""
+    parts = [p.strip() for p in fold_text(query).split(',') if p.strip() and p.strip() != 'colombia']
+    if not parts:
+        return '', ''
+    return parts[0], (parts[1] if len(parts) > 1 else '')
+
+
+class Gazetteer:
+    """
+    Índice de prefijos de municipios: un arreglo ordenado de claves (nombre completo
+    y también desde cada palabra, así "guaviare" encuentra "San José del Guaviare")
+    donde una búsqueda es un rango [bisect_left(q), bisect_left(q + '\\uffff'))
+    """
+
+    def __init__(self, municipios: List[Dict]):
+        self.municipios = municipios
+        # True si el listado es el DIVIPOLA completo (no solo la semilla)
+        self.complete = len(municipios) >= MIN_COMPLETE_MUNICIPIOS
+        entries = []
+        for idx, m in enumerate(municipios):
+            words = _name_key(m).split()
+            for k in range(len(words)):
+                # k == 0: nombre completo (se ordena antes que las coincidencias por palabra)
+                entries.append((' '.join(words[k:]), k > 0, idx))
+        entries.sort()
+        self._keys = [e[0] for e in entries]
+        self._entries = entries
+        # Departamento y resto del nombre oficial ("d.c." en "Bogotá, D.C.") para filtrar
+        self._departments = [
+            (fold_text(m.get('department', '')), fold_text(m['name']))
+            for m in municipios
+        ]
+
+    def __len__(self) -> int:
+        return len(self.municipios)
+
+    def _in_department(self, idx: int, department: str) -> bool:
+        dept, full_name = self._departments[idx]
+        return dept.startswith(department) or full_name.endswith(department)
+
+    def _ranked(self, name: str, department: str) -> List[Tuple[str, bool, int]]:
+        """Claves que empiezan con name: exactas, luego por prefijo del nombre completo, luego por palabra"""
+        lo = bisect.bisect_left(self._keys, name)
+        hi = bisect.bisect_left(self._keys, name + '\uffff', lo)
+        ranked = sorted(self._entries[lo:hi], key=lambda e: (e[0] != name, e[1], len(e[0]), e[0]))
+        if department:
+            ranked = [e for e in ranked if self._in_department(e[2], department)]
+        return ranked
+
+    def search(self, query: str, limit: int = 15) -> List[Dict]:
+        """Municipios cuyo nombre (o alguna palabra del nombre) empieza con la consulta"""
+        name, department = _split_query(query)
+        if not name:
+            return []
+        found = []
+        seen = set()
+        for _, _, idx in self._ranked(name, department):
+            if idx not in seen:
+                seen.add(idx)
+                found.append(self.municipios[idx])
+                if len(found) >= limit:
+                    break
+        return found
+
+    def lookup(self, query: str) -> Optional[Dict]:
+        """
+        Municipio que corresponde a la consulta completa, en orden: nombre exacto,
+        palabras iniciales del nombre ("Cartagena" -> "Cartagena de Indias") o palabras
+        finales ("Tumaco" -> "San Andrés de Tumaco"). None si no hay o si es ambiguo
+        (p. ej. "Granada" sin departamento). Con el listado parcial solo responde si la
+        consulta trae el departamento: "Granada" puede ser un municipio que no está
+        """
+        name, department = _split_query(query)
+        if not name or not (department or self.complete):
+            return None
+        ranked = self._ranked(name, department)
+        tiers = (
+            lambda key, by_word: key == name and not by_word,
+            lambda key, by_word: key.startswith(name + ' ') and not by_word,
+            lambda key, by_word: key == name,
+        )
+        for matches_tier in tiers:
+            found = {idx for key, by_word, idx in ranked if matches_tier(key, by_word)}
+            if len(found) == 1:
+                return self.municipios[found.pop()]
+            if found:
+                return None
+        return None
+
+
+def _name_key(m: Dict) -> str:
+    """Nombre sin tildes hasta la primera coma ("Bogotá, D.C." -> "bogota")"""
+    return fold_text(m['name'].split(',')[0])
+
+
+def load_gazetteer(path: str = MUNICIPIOS_FILE) -> Gazetteer:
+    """Carga el gazetteer desde el JSON de municipios (vacío si no existe)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            municipios = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] No se pudo cargar el gazetteer de municipios ({path}): {e}")
+        municipios = []
+    gazetteer = Gazetteer(municipios)
+    if municipios and not gazetteer.complete:
+        print(f"[WARNING] Gazetteer parcial ({len(gazetteer)} municipios): los nombres de municipio "
+              f"siguen yendo a Nominatim; generar el listado completo con data/download_municipios.py")
+    return gazetteer
+
+
+GAZETTEER = load_gazetteer()
+
+
+def municipio_display_name(m: Dict) -> str:
+    """'Duitama, Boyacá, Colombia'"""
+    if m.get('department') and m['department'] != m['name']:
+        return f"{m['name']}, {m['department']}, Colombia"
+    return f"{m['name']}, Colombia"
@@ -0,0 +1,126 @@
+"""
+Caché persistente de geocoding (SQLite junto a la base de datos de la app)
+Guarda las respuestas de Nominatim por consulta normalizada, con TTL configurable
+y un TTL más corto para las consultas sin resultados ("no encontrado")
+"""
+
+import json
+import os
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+from services.db import TwoTierCache
+
+# TTL de respuestas encontradas (30 días) y de "no encontrado" (1 hora), en segundos
+DEFAULT_TTL_S = float(os.environ.get('GEOCODE_CACHE_TTL_S', 30 * 24 * 3600))
+DEFAULT_NEGATIVE_TTL_S = float(os.environ.get('GEOCODE_CACHE_NEGATIVE_TTL_S', 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('GEOCODE_CACHE_MAX_ENTRIES', '4096'))  # Entradas en memoria
+
+# Marca de una respuesta "no encontrado" guardada en caché
+NOT_FOUND = object()
+
+
+def fold_text(text: str) -> str:
+    """Texto sin tildes, en minúsculas y con espacios colapsados"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def normalize_query(query: str, country: str = "Colombia") -> str:
+    """
+    Clave de caché de una consulta: sin tildes, en minúsculas, espacios colapsados
+    y sin el sufijo ", <país>" (así "Bogotá" y "bogota, Colombia" comparten entrada)
+    """
+    key = fold_text(query)
+    suffix = ', ' + fold_text(country)
+    while key.endswith(suffix):
+        key = key[:-len(suffix)].rstrip()
+    # Espacios alrededor de las comas no cambian la consulta
+    key = ', '.join(part.strip() for part in key.split(','))
+    return f"{fold_text(country)}|{key}"
+
+
+class GeocodeCache(TwoTierCache):
+    """
+    Caché de geocoding en dos niveles: LRU en memoria con límite de entradas
+    (lecturas en microsegundos) delante de una tabla SQLite que sobrevive reinicios.
+    Cada entrada guarda su fecha de vencimiento; las vencidas se descartan de memoria
+    al leerlas y se reemplazan en el próximo put.
+    Entrada en memoria: (expires_at, JSON del resultado o None = "no encontrado")
+    """
+
+    TABLE = 'geocode_cache'
+    COLUMNS = (
+        ('value', 'TEXT'),
+        ('expires_at', 'REAL NOT NULL'),
+    )
+    LABEL = 'geocoding'
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_s: float = DEFAULT_TTL_S,
+        negative_ttl_s: float = DEFAULT_NEGATIVE_TTL_S,
+        max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        super().__init__(db_path=db_path, max_entries=max_entries)
+
+    def get(self, key: str) -> Any:
+        """
+        Devuelve una copia del resultado guardado, NOT_FOUND si la consulta se guardó
+        sin resultados, o None si no está en caché (o venció)
+        """
+        now = time.time()
+        entry = self._lookup(key)
+        if entry is None:
+            row = self._db_get(key)
+            if row is not None:
+                entry = (row[1], row[0])
+                if entry[0] > now:
+                    with self._lock:
+                        self._store(key, entry)
+
+        with self._lock:
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._discard(key)  # Vencida: no ocupa lugar en memoria
+                self.misses += 1
+                return None
+            if entry[1] is None:
+                self.negative_hits += 1
+                return NOT_FOUND
+            self.hits += 1
+        return json.loads(entry[1])
+
+    def put(self, key: str, value: Optional[Dict]) -> None:
+        """Guarda un resultado (o None = "no encontrado", con el TTL corto)"""
+        if value is None:
+            entry = (time.time() + self.negative_ttl_s, None)
+        else:
+            entry = (time.time() + self.ttl_s, json.dumps(value, ensure_ascii=False))
+        with self._lock:
+            self._store(key, entry)
+        self._db_put(key, (entry[1], entry[0]))
+
+    def clear(self) -> None:
+        """Vacía la caché en memoria y en disco"""
+        self._clear_memory()
+        self._db_clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'ttl_s': self.ttl_s,
+                'negative_ttl_s': self.negative_ttl_s,
+                **self._memory_stats()
+            }
@@ -5,12 +5,49 @@ Usa Nominatim (OpenStreetMap) como servicio gratuito
 
 import requests
 from typing import Optional, Dict, Tuple
-import time
+
+from services.db import default_cache_path
+from services.geocode_cache import GeocodeCache, NOT_FOUND, fold_text, normalize_query
+from services.rate_limiter import NOMINATIM_LIMITER, PRIORITY_HIGH, PRIORITY_LOW, AUTOCOMPLETE_MAX_WAIT_S
+from services.gazetteer import GAZETTEER, is_street_address, municipio_display_name
+from services import http_client
+
+# Caché persistente de geocode_city (se comparte entre requests y reinicios)
+GEOCODE_CACHE = GeocodeCache(db_path=default_cache_path('geocode_cache.db', 'GEOCODE_CACHE_DB'))
+
+# Reintentos de geocode_city ante errores de red o 502/503/504 (cada uno pasa por el limiter)
+NOMINATIM_RETRIES = 1
+NOMINATIM_RETRY_STATUS = (502, 503, 504)
+
+def _buscar_nominatim_con_reintento(params: Dict, timeout: float) -> requests.Response:
+    """
+    GET /search de Nominatim con prioridad de cálculo de ruta. Cada intento, también el
+    reintento, toma su turno en NOMINATIM_LIMITER: se respeta 1 request por segundo
+    
+    Raises:
+        requests.exceptions.RequestException: Si falla también el último intento
+    """
+    for attempt in range(NOMINATIM_RETRIES + 1):
+        last_attempt = attempt == NOMINATIM_RETRIES
+        NOMINATIM_LIMITER.acquire(PRIORITY_HIGH)
+        try:
+            response = http_client.get('nominatim', '/search', params=params, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if last_attempt:
+                raise
+            print(f"[WARNING] Nominatim sin respuesta, reintentando: {e}")
+            continue
+        if response.status_code in NOMINATIM_RETRY_STATUS and not last_attempt:
+            print(f"[WARNING] Nominatim respondió {response.status_code}, reintentando")
+            continue
+        return response
 
 def geocode_city(city_name: str, country: str = "Colombia") -> Optional[Dict]:
     """
     Obtiene coordenadas de una ciudad o dirección usando Nominatim
     Ahora acepta tanto ciudades como direcciones completas
+    Las respuestas (también "no encontrado") se guardan en GEOCODE_CACHE: un acierto
+    no consulta Nominatim ni espera el segundo de rate limiting
     
     Args:
         city_name: Nombre de la ciudad o dirección completa
@@ -19,14 +56,37 @@ def geocode_city(city_name: str, country: str = "Colombia") -> Optional[Dict]:
     Returns:
         dict con 'lat', 'lon' y 'display_name', o None si no se encuentra
     """
+    # Validar entrada
+    if not city_name or not city_name.strip():
+        print(f"[ERROR] Nombre de ciudad vacío")
+        return None
+    
+    city_name = city_name.strip()
+    
+    # Nombres de municipio se resuelven con el gazetteer offline (sin Nominatim) cuando
+    # la respuesta es segura; si no (listado parcial sin departamento), sigue a Nominatim
+    if country == "Colombia" and not is_street_address(city_name):
+        municipio = GAZETTEER.lookup(city_name)
+        if municipio:
+            print(f"[DEBUG] Geocoding desde gazetteer: {city_name} -> {municipio['name']}")
+            return {
+                'lat': municipio['lat'],
+                'lon': municipio['lon'],
+                'display_name': municipio_display_name(municipio),
+                'type': 'city',
+                'class': 'place'
+            }
+    
+    cache_key = normalize_query(city_name, country)
+    cached = GEOCODE_CACHE.get(cache_key)
+    if cached is NOT_FOUND:
+        print(f"[DEBUG] Geocoding desde caché (sin resultados): {city_name}")
+        return None
+    if cached is not None:
+        print(f"[DEBUG] Geocoding desde caché: {city_name}")
+        return cached
+    
     try:
-        # Validar entrada
-        if not city_name or not city_name.strip():
-            print(f"[ERROR] Nombre de ciudad vacío")
-            return None
-        
-        city_name = city_name.strip()
-        
         # Si ya contiene "Colombia" o parece una dirección completa, usar directamente
         if ', Colombia' in city_name or city_name.count(',') >= 2:
             query = city_name
@@ -35,7 +95,6 @@ def geocode_city(city_name: str, country: str = "Colombia") -> Optional[Dict]:
         
         print(f"[DEBUG] Geocoding query: {query}")
         
-        url = "https://nominatim.openstreetmap.org/search"
         params = {
             'q': query,
             'format': 'json',
@@ -43,11 +102,8 @@ def geocode_city(city_name: str, country: str = "Colombia") -> Optional[Dict]:
             'countrycodes': 'co',
             'addressdetails': 1
         }
-        headers = {
-            'User-Agent': 'BiaTrack/1.0'  # Requerido por Nominatim
-        }
         
-        response = requests.get(url, params=params, headers=headers, timeout=15)
+        response = _buscar_nominatim_con_reintento(params, timeout=15)
         response.raise_for_status()
         data = response.json()
         
@@ -57,28 +113,24 @@ def geocode_city(city_name: str, country: str = "Colombia") -> Optional[Dict]:
             # Priorizar resultados de tipo city, town, village, administrative
             preferred_types = ['city', 'town', 'village', 'administrative']
             
-            # Buscar primero resultados preferidos
-            for result in data:
-                if result.get('type') in preferred_types or result.get('class') == 'place':
-                    return {
-                        'lat': float(result['lat']),
-                        'lon': float(result['lon']),
-                        'display_name': result.get('display_name', query),
-                        'type': result.get('type', 'unknown'),
-                        'class': result.get('class', 'unknown')
-                    }
-            
-            # Si no hay preferidos, usar el primero
-            result = data[0]
-            return {
+            # Buscar primero resultados preferidos; si no hay preferidos, usar el primero
+            result = next(
+                (r for r in data if r.get('type') in preferred_types or r.get('class') == 'place'),
+                data[0]
+            )
+            coords = {
                 'lat': float(result['lat']),
                 'lon': float(result['lon']),
                 'display_name': result.get('display_name', query),
                 'type': result.get('type', 'unknown'),
                 'class': result.get('class', 'unknown')
             }
+            GEOCODE_CACHE.put(cache_key, coords)
+            return coords
         
         print(f"[WARNING] No se encontraron resultados para: {query}")
+        # Solo se cachea "no encontrado" (TTL corto); los errores de red no se guardan
+        GEOCODE_CACHE.put(cache_key, None)
         return None
     except requests.exceptions.Timeout:
         print(f"[ERROR] Timeout al geocodificar {city_name}")
@@ -91,9 +143,6 @@ def geocode_city(city_name: str, country: str = "Colombia") -> Optional[Dict]:
         import traceback
         traceback.print_exc()
         return None
-    finally:
-        # Rate limiting: Nominatim requiere 1 segundo entre requests
-        time.sleep(1)
 
 def buscar_ciudad(query: str) -> list:
     """
@@ -107,6 +156,26 @@ def buscar_ciudad(query: str) -> list:
     Returns:
         Lista de resultados encontrados con coordenadas
     """
+    # Nombres de municipio: autocompletar con el gazetteer offline. Si el listado es el
+    # DIVIPOLA completo no hace falta Nominatim; con el listado parcial los municipios
+    # encontrados van primero y se completan con los resultados de Nominatim
+    municipios_result = []
+    if not is_street_address(query):
+        municipios_result = [
+            {
+                'name': m['name'],
+                'full_name': municipio_display_name(m),
+                'lat': m['lat'],
+                'lon': m['lon'],
+                'type': 'city',
+                'class': 'place',
+                'department': m.get('department', '')
+            }
+            for m in GAZETTEER.search(query, limit=15)
+        ]
+        if municipios_result and GAZETTEER.complete:
+            return municipios_result
+    
     try:
         # Si el query ya contiene comas, probablemente es una dirección completa
         # Si contiene "Colombia", usar directamente; si no, agregar ", Colombia"
@@ -119,7 +188,6 @@ def buscar_ciudad(query: str) -> list:
             # Solo ciudad, agregar ", Colombia"
             search_query = f"{query}, Colombia"
         
-        url = "https://nominatim.openstreetmap.org/search"
         params = {
             'q': search_query,
             'format': 'json',
@@ -127,15 +195,17 @@ def buscar_ciudad(query: str) -> list:
             'countrycodes': 'co',
             'addressdetails': 1
         }
-        headers = {
-            'User-Agent': 'BiaTrack/1.0'
-        }
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        # Autocompletar tiene prioridad baja: si el cupo de Nominatim no alcanza
+        # a tiempo, el request se descarta (el usuario ya siguió escribiendo)
+        if not NOMINATIM_LIMITER.acquire(PRIORITY_LOW, max_wait_s=AUTOCOMPLETE_MAX_WAIT_S):
+            print(f"[DEBUG] Autocompletar descartado por rate limiting: {query}")
+            return municipios_result
+        response = http_client.get('nominatim', '/search', params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
         
-        results = []
+        results = list(municipios_result)
         seen_names = set()  # Para evitar duplicados
         
         for item in data:
@@ -158,6 +228,10 @@ def buscar_ciudad(query: str) -> list:
                         # Solo ciudad: usar la primera parte
                         short_name = parts[0].strip()
                     
+                    # El municipio ya viene del gazetteer
+                    if _es_municipio_repetido(parts[0].strip(), float(item['lat']), float(item['lon']), municipios_result):
+                        continue
+                    
                     results.append({
                         'name': short_name,
                         'full_name': display_name,  # Nombre completo con todas las comas
@@ -170,7 +244,15 @@ def buscar_ciudad(query: str) -> list:
         return results[:15]  # Limitar a 15 resultados
     except Exception as e:
         print(f"Error en búsqueda de ciudad/dirección: {e}")
-        return []
-    finally:
-        time.sleep(1)
+        return municipios_result
+
+
+def _es_municipio_repetido(name: str, lat: float, lon: float, municipios: list) -> bool:
+    """True si un resultado de Nominatim es el mismo municipio que uno del gazetteer (nombre y ~10 km)"""
+    folded = fold_text(name)
+    return any(
+        fold_text(m['name'].split(',')[0]) == folded
+        and abs(m['lat'] - lat) < 0.1 and abs(m['lon'] - lon) < 0.1
+        for m in municipios
+    )
 
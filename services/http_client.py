@@ -0,0 +1,143 @@
+"""
+Cliente HTTP compartido para los servicios externos (Nominatim, OSRM, Google Maps)
+Una sesión keep-alive por servicio (pool de conexiones reutilizadas), reintentos
+acotados con backoff, timeouts por servicio y contadores de reutilización.
+Las URLs base se configuran por variables de entorno (p. ej. para apuntar a
+servidores locales en pruebas)
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Configuración por servicio: URL base, timeout (s), reintentos y backoff
+SERVICES: Dict[str, Dict[str, Any]] = {
+    'nominatim': {
+        'base_url': os.environ.get('NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org'),
+        'timeout': 15,
+        # Sin reintentos en el adaptador: no pasarían por NOMINATIM_LIMITER (1 request por
+        # segundo) y urllib3 hace el primer reintento sin espera. geocode_city reintenta
+        # pidiendo otro turno al limiter
+        'retries': 0,
+        'backoff': 0.0,
+        'headers': {'User-Agent': 'BiaTrack/1.0'},  # Requerido por Nominatim
+    },
+    'osrm': {
+        'base_url': os.environ.get('OSRM_BASE_URL', 'https://router.project-osrm.org'),
+        'timeout': 15,
+        'retries': 2,
+        'backoff': 0.5,
+        'headers': {},
+    },
+    'google_maps': {
+        'base_url': os.environ.get('GOOGLE_MAPS_BASE_URL', 'https://maps.googleapis.com'),
+        'timeout': 10,
+        'retries': 2,
+        'backoff': 0.5,
+        'headers': {},
+    },
+}
+
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '10'))  # Conexiones por host
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_request_counts: Dict[str, int] = {}
+_error_counts: Dict[str, int] = {}
+_counts_lock = threading.Lock()
+
+
+def _build_session(config: Dict[str, Any]) -> requests.Session:
+    retry = Retry(
+        total=config['retries'],
+        connect=config['retries'],
+        read=config['retries'],
+        status=config['retries'],
+        backoff_factor=config['backoff'],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # La última respuesta se devuelve y el llamador decide (raise_for_status)
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(config['headers'])
+    return session
+
+
+def get_session(service: str) -> requests.Session:
+    """Sesión keep-alive del servicio (se crea en el primer uso)"""
+    session = _sessions.get(service)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(service)
+            if session is None:
+                session = _build_session(SERVICES[service])
+                _sessions[service] = session
+    return session
+
+
+def get(
+    service: str,
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+) -> requests.Response:
+    """
+    GET a la URL base del servicio + path, por la sesión compartida
+
+    Args:
+        service: 'nominatim', 'osrm' o 'google_maps'
+        path: Ruta relativa (p. ej. '/search')
+        timeout: Timeout en segundos (default: el del servicio)
+
+    Raises:
+        requests.exceptions.RequestException: Igual que requests.get
+    """
+    config = SERVICES[service]
+    url = config['base_url'].rstrip('/') + path
+    with _counts_lock:
+        _request_counts[service] = _request_counts.get(service, 0) + 1
+    try:
+        return get_session(service).get(
+            url,
+            params=params,
+            headers=headers,
+            timeout=timeout if timeout is not None else config['timeout'],
+        )
+    except requests.exceptions.RequestException:
+        with _counts_lock:
+            _error_counts[service] = _error_counts.get(service, 0) + 1
+        raise
+
+
+def http_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Requests, errores y conexiones abiertas por servicio; reused = requests que
+    viajaron por una conexión ya abierta (sin nuevo handshake TCP/TLS)
+    """
+    stats = {}
+    for service in SERVICES:
+        connections = 0
+        pool_requests = 0
+        session = _sessions.get(service)
+        if session is not None:
+            for adapter in set(session.adapters.values()):
+                for pool in list(adapter.poolmanager.pools._container.values()):
+                    connections += pool.num_connections
+                    pool_requests += pool.num_requests
+        stats[service] = {
+            'base_url': SERVICES[service]['base_url'],
+            'requests': _request_counts.get(service, 0),
+            'errors': _error_counts.get(service, 0),
+            'connections_opened': connections,
+            'connections_reused': max(0, pool_requests - connections),
+        }
+    return stats
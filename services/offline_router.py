@@ -0,0 +1,249 @@
+"""
+Motor de rutas offline sobre un grafo vial preprocesado (archivo binario compacto)
+Búsqueda A* por tiempo de viaje con reconstrucción de la geometría de cada arco.
+El grafo se genera con data/build_road_graph.py a partir de un GeoJSON de vías
+primarias y secundarias (p. ej. un extracto de OpenStreetMap)
+
+Formato del archivo (little-endian):
+    cabecera: magic b'BIAG', versión u16, reservado u16, n_nodos u32, n_arcos u32, n_formas u32
+    nodos:    lat i32[n_nodos], lon i32[n_nodos]          (microgrados)
+    CSR:      offsets u32[n_nodos + 1], destinos u32[n_arcos]
+    arcos:    longitud_m f32[n_arcos], velocidad_kmh u8[n_arcos]
+    formas:   offsets u32[n_arcos + 1], lat i32[n_formas], lon i32[n_formas]
+              (vértices intermedios de cada arco, sin los nodos de los extremos)
+"""
+
+import heapq
+import math
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+GRAPH_MAGIC = b'BIAG'
+GRAPH_VERSION = 1
+HEADER = struct.Struct('<4sHHIII')
+COORD_SCALE = 1e6  # Coordenadas en microgrados
+
+DEFAULT_GRAPH_FILE = os.environ.get(
+    'ROAD_GRAPH_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'road_graph.bin')
+)
+
+EARTH_R = 6371000.0
+MAX_SNAP_M = 20000.0   # Distancia máxima del origen/destino al nodo más cercano del grafo
+CONNECTOR_KMH = 30.0   # Velocidad del tramo entre el punto pedido y el nodo del grafo
+SNAP_CELL_DEG = 0.05   # Celdas de la grilla para buscar el nodo más cercano
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_R * math.asin(math.sqrt(a))
+
+
+def _array(typecode: str, data: bytes, offset: int, count: int) -> Tuple[array, int]:
+    arr = array(typecode)
+    end = offset + count * arr.itemsize
+    arr.frombytes(data[offset:end])
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr, end
+
+
+class RoadGraph:
+    """Grafo vial en arreglos compactos (CSR) con búsqueda A*"""
+
+    def __init__(self, lat, lon, offsets, targets, length_m, speed_kmh, shape_offsets, shape_lat, shape_lon):
+        self.lat = lat
+        self.lon = lon
+        self.offsets = offsets
+        self.targets = targets
+        self.length_m = length_m
+        self.speed_kmh = speed_kmh
+        self.shape_offsets = shape_offsets
+        self.shape_lat = shape_lat
+        self.shape_lon = shape_lon
+        self.max_speed_ms = max(speed_kmh) / 3.6 if len(speed_kmh) else 1.0
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        for node in range(len(lat)):
+            self._cells.setdefault(self._cell(lat[node] / COORD_SCALE, lon[node] / COORD_SCALE), []).append(node)
+
+    @classmethod
+    def load(cls, path: str) -> 'RoadGraph':
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, _, n_nodes, n_edges, n_shape = HEADER.unpack_from(data, 0)
+        if magic != GRAPH_MAGIC or version != GRAPH_VERSION:
+            raise ValueError(f"Archivo de grafo inválido o de otra versión: {path}")
+        offset = HEADER.size
+        lat, offset = _array('i', data, offset, n_nodes)
+        lon, offset = _array('i', data, offset, n_nodes)
+        offsets, offset = _array('I', data, offset, n_nodes + 1)
+        targets, offset = _array('I', data, offset, n_edges)
+        length_m, offset = _array('f', data, offset, n_edges)
+        speed_kmh, offset = _array('B', data, offset, n_edges)
+        shape_offsets, offset = _array('I', data, offset, n_edges + 1)
+        shape_lat, offset = _array('i', data, offset, n_shape)
+        shape_lon, offset = _array('i', data, offset, n_shape)
+        return cls(lat, lon, offsets, targets, length_m, speed_kmh, shape_offsets, shape_lat, shape_lon)
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (int(math.floor(lat / SNAP_CELL_DEG)), int(math.floor(lon / SNAP_CELL_DEG)))
+
+    def node_latlon(self, node: int) -> Tuple[float, float]:
+        return (self.lat[node] / COORD_SCALE, self.lon[node] / COORD_SCALE)
+
+    def nearest_node(self, lat: float, lon: float, max_m: float = MAX_SNAP_M) -> Optional[Tuple[int, float]]:
+        """(nodo, distancia_m) más cercano dentro de max_m, buscando en anillos de celdas"""
+        ci, cj = self._cell(lat, lon)
+        max_ring = int(math.degrees(max_m / EARTH_R) / SNAP_CELL_DEG / max(math.cos(math.radians(lat)), 0.1)) + 1
+        best = None
+        for ring in range(max_ring + 1):
+            for i in range(ci - ring, ci + ring + 1):
+                for j in range(cj - ring, cj + ring + 1):
+                    if max(abs(i - ci), abs(j - cj)) != ring:
+                        continue
+                    for node in self._cells.get((i, j), ()):
+                        d = haversine_m(lat, lon, *self.node_latlon(node))
+                        if best is None or d < best[1]:
+                            best = (node, d)
+            # Todo lo que queda fuera de este anillo está a más de ring celdas
+            if best is not None and best[1] <= ring * SNAP_CELL_DEG * 111195.0 * math.cos(math.radians(lat)):
+                break
+        if best is None or best[1] > max_m:
+            return None
+        return best
+
+    def shortest_path(self, source: int, target: int) -> Optional[List[int]]:
+        """
+        A* por tiempo de viaje (heurística: distancia en línea recta a la velocidad máxima del grafo)
+
+        Returns:
+            Lista de arcos del camino, o None si no hay camino
+        """
+        goal_lat, goal_lon = self.node_latlon(target)
+        max_speed = self.max_speed_ms
+        best = {source: 0.0}
+        via: Dict[int, Tuple[int, int]] = {}  # nodo -> (arco por el que se llegó, nodo anterior)
+        heap = [(0.0, 0.0, source)]
+        offsets, targets, length_m, speed_kmh = self.offsets, self.targets, self.length_m, self.speed_kmh
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if cost > best.get(node, math.inf):
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                nxt = targets[edge]
+                new_cost = cost + length_m[edge] / (speed_kmh[edge] / 3.6)
+                if new_cost < best.get(nxt, math.inf):
+                    best[nxt] = new_cost
+                    via[nxt] = (edge, node)
+                    h = haversine_m(*self.node_latlon(nxt), goal_lat, goal_lon) / max_speed
+                    heapq.heappush(heap, (new_cost + h, new_cost, nxt))
+
+        if target != source and target not in via:
+            return None
+        edges = []
+        node = target
+        while node != source:
+            edge, node = via[node]
+            edges.append(edge)
+        edges.reverse()
+        return edges
+
+    def edge_coordinates(self, edge: int) -> List[List[float]]:
+        """Vértices intermedios y nodo final del arco como [lon, lat]"""
+        coords = [
+            [self.shape_lon[k] / COORD_SCALE, self.shape_lat[k] / COORD_SCALE]
+            for k in range(self.shape_offsets[edge], self.shape_offsets[edge + 1])
+        ]
+        lat, lon = self.node_latlon(self.targets[edge])
+        coords.append([lon, lat])
+        return coords
+
+    def route(self, origin_lat: float, origin_lon: float, dest_lat: float, dest_lon: float) -> Optional[Dict]:
+        """
+        Ruta entre dos coordenadas
+
+        Returns:
+            {'distance_m', 'duration_s', 'geometry'} o None si algún punto queda lejos
+            del grafo o no hay camino
+        """
+        start = self.nearest_node(origin_lat, origin_lon)
+        end = self.nearest_node(dest_lat, dest_lon)
+        if start is None or end is None:
+            return None
+        edges = self.shortest_path(start[0], end[0])
+        if edges is None:
+            return None
+
+        coords = [[origin_lon, origin_lat]]
+        start_lat, start_lon = self.node_latlon(start[0])
+        if start[1] > 1.0:
+            coords.append([start_lon, start_lat])
+        distance_m = start[1] + end[1]
+        duration_s = (start[1] + end[1]) / (CONNECTOR_KMH / 3.6)
+        for edge in edges:
+            coords.extend(self.edge_coordinates(edge))
+            distance_m += self.length_m[edge]
+            duration_s += self.length_m[edge] / (self.speed_kmh[edge] / 3.6)
+        if end[1] > 1.0 or len(coords) == 1:
+            coords.append([dest_lon, dest_lat])
+
+        return {
+            'distance_m': distance_m,
+            'duration_s': duration_s,
+            'geometry': {'type': 'LineString', 'coordinates': coords}
+        }
+
+
+_graph: Optional[RoadGraph] = None
+_graph_path: Optional[str] = None
+_graph_lock = threading.Lock()
+# (ruta, mtime o None si no existe) de la última carga fallida: no se reintenta ni se
+# repite el error hasta que el archivo aparezca o cambie
+_graph_failed: Optional[Tuple[str, Optional[float]]] = None
+
+
+def _graph_file_state(path: str) -> Tuple[str, Optional[float]]:
+    try:
+        return path, os.path.getmtime(path)
+    except OSError:
+        return path, None
+
+
+def get_graph(path: str = DEFAULT_GRAPH_FILE) -> Optional[RoadGraph]:
+    """
+    Grafo cargado (una vez por proceso), o None si el archivo no existe o es inválido.
+    Una carga fallida se recuerda por (ruta, mtime) y se reintenta solo si el archivo cambia
+    """
+    global _graph, _graph_path, _graph_failed
+    if _graph is not None and _graph_path == path:
+        return _graph
+    state = _graph_file_state(path)
+    if state == _graph_failed:
+        return None
+    with _graph_lock:
+        if _graph is None or _graph_path != path:
+            if state == _graph_failed:
+                return None
+            try:
+                _graph = RoadGraph.load(path)
+                _graph_path = path
+                _graph_failed = None
+                print(f"[DEBUG] Grafo vial offline cargado: {len(_graph)} nodos ({path})")
+            except (OSError, ValueError, struct.error) as e:
+                _graph_failed = state
+                print(f"[ERROR] No se pudo cargar el grafo vial offline ({path}): {e}")
+                return None
+    return _graph
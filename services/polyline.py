@@ -0,0 +1,87 @@
+"""
+Polilíneas codificadas (formato de Google / OSRM, p. ej. polyline6)
+Las coordenadas se devuelven como [lon, lat], igual que en GeoJSON
+"""
+
+from typing import List
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se decodifica carácter por carácter
+    np = None
+
+
+def decode_polyline(encoded: str, precision: int = 6) -> List[List[float]]:
+    """
+    Decodifica una polilínea a una lista de coordenadas [lon, lat]
+
+    Args:
+        encoded: Polilínea codificada
+        precision: Decimales de la codificación (5 para polyline, 6 para polyline6)
+    """
+    factor = 10.0 ** precision
+    if np is not None and encoded:
+        return _decode_numpy(encoded, factor)
+    coords = []
+    lat = lon = 0
+    index = 0
+    length = len(encoded)
+    data = encoded.encode('ascii')
+
+    while index < length:
+        # Latitud y longitud se codifican como diferencias en bloques de 5 bits
+        for axis in (0, 1):
+            result = 0
+            shift = 0
+            while True:
+                b = data[index] - 63
+                index += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if axis == 0:
+                lat += delta
+            else:
+                lon += delta
+        coords.append([lon / factor, lat / factor])
+
+    return coords
+
+
+def encode_polyline(coords: List[List[float]], precision: int = 5) -> str:
+    """
+    Codifica coordenadas [lon, lat] como polilínea (inversa de decode_polyline)
+
+    Args:
+        coords: Lista de coordenadas [lon, lat]
+        precision: Decimales conservados (5 ~ 1 m, 6 ~ 0.1 m)
+    """
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for c in coords:
+        lat = int(round(c[1] * factor))
+        lon = int(round(c[0] * factor))
+        for delta in (lat - prev_lat, lon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lon = lat, lon
+    return ''.join(out)
+
+
+def _decode_numpy(encoded: str, factor: float) -> List[List[float]]:
+    """Decodificación vectorizada: todos los bloques de 5 bits y las sumas de diferencias de una vez"""
+    chunks = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    ends = chunks < 0x20  # Último bloque de cada valor
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    # Posición de cada bloque dentro de su valor (para el desplazamiento de 5 bits)
+    position = np.arange(len(chunks)) - np.repeat(starts, np.diff(np.append(starts, len(chunks))))
+    values = np.add.reduceat((chunks & 0x1F) << (5 * position), starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    points = np.cumsum(deltas.reshape(-1, 2), axis=0) / factor
+    return points[:, ::-1].tolist()
@@ -0,0 +1,96 @@
+"""
+Rate limiter compartido por todo el proceso (token bucket con prioridades)
+Nominatim permite 1 request por segundo: en vez de dormir 1 s después de cada
+request, se espera solo cuando el presupuesto está agotado, y los requests de
+cálculo de ruta pasan antes que los de autocompletar
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+PRIORITY_HIGH = 0  # Cálculo de rutas (geocoding de origen/destino, geocoding inverso)
+PRIORITY_LOW = 1   # Autocompletar: se descarta si tendría que esperar demasiado
+
+# Espera máxima de un request de autocompletar antes de descartarlo (ya quedó viejo)
+AUTOCOMPLETE_MAX_WAIT_S = float(os.environ.get('AUTOCOMPLETE_MAX_WAIT_S', '2'))
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe con dos carriles de prioridad.
+    Se recargan rate_per_s tokens por segundo hasta capacity; cada request
+    consume un token. Mientras haya requests de prioridad alta esperando, los de
+    prioridad baja no toman tokens.
+    """
+
+    def __init__(self, rate_per_s: float = 1.0, capacity: float = 1.0):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = {PRIORITY_HIGH: 0, PRIORITY_LOW: 0}
+        self.granted = {PRIORITY_HIGH: 0, PRIORITY_LOW: 0}
+        self.dropped = 0
+        self.waited_s = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def acquire(self, priority: int = PRIORITY_HIGH, max_wait_s: Optional[float] = None) -> bool:
+        """
+        Toma un token, esperando solo lo necesario
+
+        Args:
+            priority: PRIORITY_HIGH o PRIORITY_LOW
+            max_wait_s: Espera máxima; si el token no llegaría a tiempo se descarta el request
+
+        Returns:
+            True si se puede hacer el request, False si se descartó
+        """
+        start = time.monotonic()
+        deadline = start + max_wait_s if max_wait_s is not None else None
+
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    blocked = priority == PRIORITY_LOW and self._waiting[PRIORITY_HIGH] > 0
+
+                    if self._tokens >= 1.0 and not blocked:
+                        self._tokens -= 1.0
+                        self.granted[priority] += 1
+                        self.waited_s += now - start
+                        return True
+
+                    # Tiempo hasta el próximo token (si hay requests de prioridad alta, hasta que avisen)
+                    wait = (1.0 - self._tokens) / self.rate_per_s if self._tokens < 1.0 else None
+                    if deadline is not None:
+                        if now >= deadline or (wait is not None and now + wait > deadline):
+                            self.dropped += 1
+                            return False
+                        wait = deadline - now if wait is None else wait
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'rate_per_s': self.rate_per_s,
+                'granted_high': self.granted[PRIORITY_HIGH],
+                'granted_low': self.granted[PRIORITY_LOW],
+                'dropped': self.dropped,
+                'waited_s': round(self.waited_s, 3),
+                'waiting': self._waiting[PRIORITY_HIGH] + self._waiting[PRIORITY_LOW]
+            }
+
+
+# Límite de Nominatim (política de uso: máximo 1 request por segundo)
+NOMINATIM_LIMITER = TokenBucket(rate_per_s=float(os.environ.get('NOMINATIM_RATE_PER_S', '1')), capacity=1.0)
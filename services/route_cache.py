@@ -0,0 +1,151 @@
+"""
+Caché de rutas de OSRM
+La clave son las coordenadas de origen y destino ajustadas a una grilla de ~50 m:
+la misma base y destino reutilizan la ruta sin consultar OSRM. LRU en memoria
+respaldado por SQLite; la geometría se guarda comprimida (zlib). Las rutas más
+viejas que max_age_s se sirven igual y se refrescan en segundo plano
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.db import TwoTierCache
+
+# Grilla de coordenadas de la clave: 0.00045 grados ~ 50 m
+SNAP_DEG = 0.00045
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('ROUTE_CACHE_MAX_ENTRIES', '512'))
+DEFAULT_MAX_AGE_S = float(os.environ.get('ROUTE_CACHE_MAX_AGE_S', 7 * 24 * 3600))
+
+
+def make_route_key(origin_lat: float, origin_lon: float, dest_lat: float, dest_lon: float, variant: str = 'ruta') -> str:
+    """Clave de la ruta con las coordenadas ajustadas a la grilla de SNAP_DEG"""
+    snapped = (round(c / SNAP_DEG) for c in (origin_lat, origin_lon, dest_lat, dest_lon))
+    return f"{variant}|" + ','.join(str(c) for c in snapped)
+
+
+class RouteCache(TwoTierCache):
+    """
+    LRU en memoria (valores comprimidos) con respaldo opcional en SQLite.
+    get_or_fetch() devuelve la ruta guardada si existe (refrescándola en segundo
+    plano si está vieja) o la pide con fetch() y la guarda.
+    Entrada en memoria: (created_at, blob comprimido)
+    """
+
+    TABLE = 'route_cache'
+    COLUMNS = (
+        ('distance_km', 'REAL'),
+        ('duration_normal_min', 'INTEGER'),
+        ('data', 'BLOB NOT NULL'),
+        ('created_at', 'REAL NOT NULL'),
+    )
+    LABEL = 'rutas'
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES, max_age_s: float = DEFAULT_MAX_AGE_S):
+        self.max_age_s = max_age_s
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        super().__init__(db_path=db_path, max_entries=max_entries)
+
+    def _entry_size(self, entry: Tuple[float, bytes]) -> int:
+        return len(entry[1])
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Ruta de la caché o de fetch() (None de fetch no se guarda)
+
+        Args:
+            key: Clave de make_route_key
+            fetch: Función que consulta el servicio de rutas
+        """
+        entry = self._get_entry(key)
+        if entry is not None:
+            created_at, blob = entry
+            stale = time.time() - created_at > self.max_age_s
+            with self._lock:
+                self.hits += 1
+                if stale:
+                    self.stale_hits += 1
+            if stale:
+                self._refresh_in_background(key, fetch)
+            return _decode(blob)
+
+        with self._lock:
+            self.misses += 1
+        result = fetch()
+        if result:
+            self.put(key, result)
+        return result
+
+    def put(self, key: str, route: Dict) -> None:
+        blob = _encode(route)
+        created_at = time.time()
+        with self._lock:
+            self._store(key, (created_at, blob))
+        self._db_put(key, (route.get('distance_km'), route.get('duration_normal_min'), sqlite3.Binary(blob), created_at))
+
+    def clear(self) -> None:
+        """Vacía la caché en memoria (la de disco se reemplaza al refrescar)"""
+        self._clear_memory()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'bytes': self._bytes,
+                'max_age_s': self.max_age_s,
+                **self._memory_stats()
+            }
+
+    def _get_entry(self, key: str) -> Optional[Tuple[float, bytes]]:
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry
+        row = self._db_get(key)
+        if row is None:
+            return None
+        entry = (row[3], bytes(row[2]))
+        with self._lock:
+            self._store(key, entry)
+        return entry
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Optional[Dict]]) -> None:
+        """Pide la ruta de nuevo en un hilo aparte (una sola vez por clave a la vez)"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                result = fetch()
+                if result:
+                    self.put(key, result)
+                    with self._lock:
+                        self.refreshes += 1
+            except Exception as e:
+                print(f"[WARNING] Error refrescando ruta en caché: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='biatrack-route-refresh', daemon=True).start()
+
+
+def _encode(route: Dict) -> bytes:
+    return zlib.compress(json.dumps(route, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def _decode(blob: bytes) -> Dict:
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
@@ -3,22 +3,23 @@ Utilidades para manipulación de rutas
 Incluye funciones para truncar rutas desde un punto específico
 """
 
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Union
 from services.toll_calculator import (
+    PreparedRoute,
     haversine_m,
     to_local_xy_m,
-    point_segment_distance_m_xy,
-    polyline_length_m,
-    route_from_linestring
+    point_segment_distance_m_xy
 )
 
-def find_point_on_route(route: List[Tuple[float, float]], target_point: Tuple[float, float]) -> Tuple[int, float]:
+RouteLike = Union[List[Tuple[float, float]], PreparedRoute]
+
+def find_point_on_route(route: RouteLike, target_point: Tuple[float, float]) -> Tuple[int, float]:
     """
     Encuentra el punto más cercano en la ruta a un punto objetivo
     Retorna el índice del segmento y la distancia acumulada hasta ese punto
     
     Args:
-        route: Lista de puntos de la ruta [(lat, lon), ...]
+        route: Lista de puntos de la ruta [(lat, lon), ...] o PreparedRoute
         target_point: Punto objetivo (lat, lon)
     
     Returns:
@@ -29,6 +30,10 @@ def find_point_on_route(route: List[Tuple[float, float]], target_point: Tuple[fl
     if len(route) < 2:
         return (0, 0.0)
     
+    if isinstance(route, PreparedRoute):
+        _, accumulated, segment_index, _ = route.nearest([target_point])[0]
+        return (segment_index, accumulated)
+    
     lat0, lon0 = route[0]
     px, py = to_local_xy_m(lat0, lon0, target_point[0], target_point[1])
     
@@ -71,21 +76,30 @@ def find_point_on_route(route: List[Tuple[float, float]], target_point: Tuple[fl
     
     return (best_index, best_accumulated)
 
-def truncate_route_from_point(route: List[Tuple[float, float]], start_point: Tuple[float, float]) -> List[Tuple[float, float]]:
+def truncate_route_from_point(route: RouteLike, start_point: Tuple[float, float]) -> RouteLike:
     """
     Trunca una ruta empezando desde un punto específico
     Encuentra el punto más cercano en la ruta y devuelve la ruta desde ahí hasta el final
     
     Args:
-        route: Ruta completa [(lat, lon), ...]
+        route: Ruta completa [(lat, lon), ...] o PreparedRoute
         start_point: Punto desde donde empezar (lat, lon)
     
     Returns:
         Ruta truncada desde el punto más cercano hasta el final
+        (PreparedRoute si se recibió una PreparedRoute)
     """
     if len(route) < 2:
         return route
     
+    if isinstance(route, PreparedRoute):
+        _, accumulated_dist, segment_index, t = route.nearest([start_point])[0]
+        if accumulated_dist < 100.0:  # Menos de 100m desde el inicio
+            return route
+        if accumulated_dist > route.length_m - 100.0:  # Menos de 100m hasta el final
+            return PreparedRoute([route.points[-1]])
+        return route.truncate_at(segment_index, t)
+    
     segment_index, accumulated_dist = find_point_on_route(route, start_point)
     
     # Si el punto está muy cerca del inicio, usar la ruta completa
@@ -129,10 +143,12 @@ def truncate_route_from_point(route: List[Tuple[float, float]], start_point: Tup
     # Fallback: usar desde el siguiente segmento
     return route[segment_index + 1:]
 
-def route_to_geojson(route: List[Tuple[float, float]]) -> Dict:
+def route_to_geojson(route: RouteLike) -> Dict:
     """
-    Convierte una lista de puntos (lat, lon) a GeoJSON LineString (lon, lat)
+    Convierte una lista de puntos (lat, lon) o PreparedRoute a GeoJSON LineString (lon, lat)
     """
+    if isinstance(route, PreparedRoute):
+        route = route.points
     coordinates = [[lon, lat] for lat, lon in route]
     return {
         'type': 'LineString',
@@ -1,43 +1,229 @@
 """
 Servicio de routing usando OSRM (Open Source Routing Machine)
 Calcula rutas con distancia, tiempo y geometría
+Con ROUTING_BACKEND=offline usa el motor local (services/offline_router.py)
 """
 
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, List, Tuple
 import json
+import math
+import os
+
+from services import http_client
+from services.offline_router import get_graph
+from services.polyline import decode_polyline
+from services.db import default_cache_path
+from services.route_cache import RouteCache, make_route_key
+
+METROS_POR_GRADO = 111195.0  # Metros por grado de latitud (radio terrestre medio)
+
+# Caché de rutas por coordenadas ajustadas a ~50 m (memoria + SQLite junto a DB_FILE)
+ROUTE_CACHE = RouteCache(db_path=default_cache_path('route_cache.db', 'ROUTE_CACHE_DB'))
 
 def calcular_ruta_con_trafico(
     origin_lat: float,
     origin_lon: float,
     dest_lat: float,
-    dest_lon: float
+    dest_lon: float,
+    use_cache: bool = True,
+    steps: bool = False
 ) -> Optional[Dict]:
     """
     Calcula ruta usando OSRM con información de tráfico
+    Las rutas se guardan en ROUTE_CACHE: el mismo par origen/destino (a ~50 m)
+    no vuelve a consultar OSRM; si la ruta guardada está vieja se sirve igual
+    y se refresca en segundo plano
     
     Args:
         origin_lat, origin_lon: Coordenadas de origen
         dest_lat, dest_lon: Coordenadas de destino
+        use_cache: Usar la caché de rutas
+        steps: Pedir las indicaciones paso a paso (por defecto se piden solo
+               distancia, duración y geometría en polyline6, mucho más livianas)
     
     Returns:
         dict con distancia (km), duración (min), geometría, etc.
     """
+    consultar = ROUTING_BACKENDS[ROUTING_BACKEND]
+    fetch = lambda: consultar(origin_lat, origin_lon, dest_lat, dest_lon, steps=steps)
+    if not use_cache:
+        return fetch()
+    variant = _cache_variant('ruta_pasos' if steps else 'ruta')
+    key = make_route_key(origin_lat, origin_lon, dest_lat, dest_lon, variant=variant)
+    return ROUTE_CACHE.get_or_fetch(key, fetch)
+
+def set_routing_backend(name: str) -> None:
+    """Cambia el motor de rutas ('osrm' u 'offline')"""
+    global ROUTING_BACKEND
+    if name not in ROUTING_BACKENDS:
+        raise ValueError(f"Motor de rutas desconocido: {name} (opciones: {', '.join(ROUTING_BACKENDS)})")
+    ROUTING_BACKEND = name
+
+def _cache_variant(variant: str) -> str:
+    """Las rutas de cada motor se guardan por separado en la caché (OSRM conserva las claves originales)"""
+    return variant if ROUTING_BACKEND == 'osrm' else f"{variant}:{ROUTING_BACKEND}"
+
+def route_cache_stats() -> Dict:
+    """Contadores de la caché de rutas"""
+    return ROUTE_CACHE.stats()
+
+def _consultar_osrm(
+    origin_lat: float,
+    origin_lon: float,
+    dest_lat: float,
+    dest_lon: float,
+    steps: bool = False
+) -> Optional[Dict]:
+    """Consulta la ruta a OSRM (sin caché)"""
     try:
-        # OSRM public demo server (puede tener límites de uso)
-        # En producción, usaría un servidor OSRM propio o servicio pago
-        base_url = "https://router.project-osrm.org"
+        # OSRM public demo server por defecto (puede tener límites de uso)
+        # En producción, usar un servidor OSRM propio (OSRM_BASE_URL)
         
         # Endpoint de route con geometría
-        url = f"{base_url}/route/v1/driving/{origin_lon},{origin_lat};{dest_lon},{dest_lat}"
-        params = {
+        path = f"/route/v1/driving/{origin_lon},{origin_lat};{dest_lon},{dest_lat}"
+        params = _osrm_params(steps)
+        
+        response = http_client.get('osrm', path, params=params, timeout=15)
+        response.raise_for_status()
+        data = response.json()
+        
+        if data.get('code') != 'Ok':
+            return None
+        
+        route = data['routes'][0]
+        return _formatear_ruta(
+            route['distance'],  # en metros
+            route['duration'],  # en segundos
+            _osrm_geometry(route),  # GeoJSON LineString
+            route.get('legs', [])
+        )
+    except Exception as e:
+        print(f"Error calculando ruta: {e}")
+        return None
+
+def _osrm_params(steps: bool) -> Dict[str, str]:
+    """
+    Parámetros de /route: en modo liviano (sin steps) la geometría viaja como
+    polyline6, varias veces más chica que GeoJSON y más rápida de parsear
+    """
+    if steps:
+        return {
             'overview': 'full',  # Geometría completa de la ruta
             'geometries': 'geojson',
             'steps': 'true',
             'alternatives': 'false'
         }
+    return {
+        'overview': 'full',
+        'geometries': 'polyline6',
+        'steps': 'false',
+        'alternatives': 'false'
+    }
+
+def _osrm_geometry(route: Dict) -> Optional[Dict]:
+    """Geometría de la ruta de OSRM como GeoJSON LineString (decodificando polyline6)"""
+    geometry = route.get('geometry')
+    if isinstance(geometry, str):
+        return {'type': 'LineString', 'coordinates': decode_polyline(geometry, precision=6)}
+    return geometry
+
+def _formatear_ruta(distance_m: float, duration_s: float, geometry: Optional[Dict], legs: List[Dict]) -> Dict:
+    """Resultado de una ruta en el formato de calcular_ruta_con_trafico"""
+    # Calcular tiempo con factor de hora pico (3.5x según especificación)
+    duration_normal_min = int(duration_s / 60)
+    duration_peak_min = int(duration_normal_min * 3.5)
+    
+    return {
+        'distance_km': round(distance_m / 1000, 2),
+        'duration_normal_min': duration_normal_min,
+        'duration_peak_min': duration_peak_min,
+        'geometry': geometry,
+        'legs': legs,
+        'steps': legs[0].get('steps', []) if legs else []
+    }
+
+def calcular_ruta_ida_y_regreso(
+    origin_lat: float,
+    origin_lon: float,
+    dest_lat: float,
+    dest_lon: float,
+    use_cache: bool = True
+) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Calcula la ruta de ida y la de regreso con un solo request a OSRM
+    (waypoints origen -> destino -> origen) separando la respuesta por tramos.
+    Si OSRM no responde la ruta de 3 puntos (o el motor no es OSRM), se piden
+    las dos rutas en paralelo.
+    
+    Returns:
+        (ruta_ida, ruta_regreso) con el formato de calcular_ruta_con_trafico
+        (cada una None si no se pudo calcular)
+    """
+    resultado = None
+    if ROUTING_BACKEND == 'osrm':
+        key = make_route_key(origin_lat, origin_lon, dest_lat, dest_lon, variant='ida_regreso')
+        if use_cache:
+            fetch = lambda: _consultar_y_sembrar_ida_y_regreso(origin_lat, origin_lon, dest_lat, dest_lon)
+            resultado = ROUTE_CACHE.get_or_fetch(key, fetch)
+        else:
+            resultado = _consultar_osrm_ida_y_regreso(origin_lat, origin_lon, dest_lat, dest_lon)
+        if not resultado:
+            print(f"[WARNING] Ruta ida y regreso en un request no disponible, usando dos requests en paralelo")
+    
+    if resultado:
+        return resultado['ida'], resultado['regreso']
+    
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='biatrack-osrm') as executor:
+        ida = executor.submit(calcular_ruta_con_trafico, origin_lat, origin_lon, dest_lat, dest_lon, use_cache)
+        regreso = executor.submit(calcular_ruta_con_trafico, dest_lat, dest_lon, origin_lat, origin_lon, use_cache)
+        return ida.result(), regreso.result()
+
+def _consultar_y_sembrar_ida_y_regreso(
+    origin_lat: float,
+    origin_lon: float,
+    dest_lat: float,
+    dest_lon: float
+) -> Optional[Dict]:
+    """
+    Consulta la ruta de ida y regreso y guarda cada sentido en la caché de rutas de
+    solo ida (solo cuando se consultó a OSRM, no en cada acierto de caché).
+    Con continue_straight=false cada tramo se calcula sin restricciones en el waypoint
+    intermedio, así que el tramo es la misma ruta que devuelve /route con dos puntos
+    (mismo formato, sin pasos) y puede ir bajo la clave 'ruta'
+    """
+    resultado = _consultar_osrm_ida_y_regreso(origin_lat, origin_lon, dest_lat, dest_lon)
+    if resultado:
+        variant = _cache_variant('ruta')
+        ROUTE_CACHE.put(make_route_key(origin_lat, origin_lon, dest_lat, dest_lon, variant=variant), resultado['ida'])
+        ROUTE_CACHE.put(make_route_key(dest_lat, dest_lon, origin_lat, origin_lon, variant=variant), resultado['regreso'])
+    return resultado
+
+def _consultar_osrm_ida_y_regreso(
+    origin_lat: float,
+    origin_lon: float,
+    dest_lat: float,
+    dest_lon: float
+) -> Optional[Dict]:
+    """
+    Consulta a OSRM la ruta origen -> destino -> origen y la separa en ida y regreso
+    
+    Returns:
+        {'ida': ruta, 'regreso': ruta} o None si OSRM no devolvió los dos tramos
+    """
+    try:
+        path = (
+            f"/route/v1/driving/{origin_lon},{origin_lat};{dest_lon},{dest_lat};"
+            f"{origin_lon},{origin_lat}"
+        )
+        params = {
+            **_osrm_params(steps=False),
+            # Permitir girar en U en el destino: el regreso es la misma ruta
+            # que se obtendría pidiéndola por separado
+            'continue_straight': 'false'
+        }
         
-        response = requests.get(url, params=params, timeout=15)
+        response = http_client.get('osrm', path, params=params, timeout=15)
         response.raise_for_status()
         data = response.json()
         
@@ -45,33 +231,83 @@ def calcular_ruta_con_trafico(
             return None
         
         route = data['routes'][0]
-        distance_m = route['distance']  # en metros
-        duration_s = route['duration']  # en segundos
-        
-        # Calcular tiempo con factor de hora pico (3.5x según especificación)
-        duration_normal_min = int(duration_s / 60)
-        duration_peak_min = int(duration_normal_min * 3.5)
+        legs = route.get('legs', [])
+        coords = (_osrm_geometry(route) or {}).get('coordinates', [])
+        waypoints = data.get('waypoints', [])
+        if len(legs) != 2 or len(waypoints) != 3 or len(coords) < 2:
+            return None
         
-        return {
-            'distance_km': round(distance_m / 1000, 2),
-            'duration_normal_min': duration_normal_min,
-            'duration_peak_min': duration_peak_min,
-            'geometry': route.get('geometry'),  # GeoJSON LineString
-            'legs': route.get('legs', []),
-            'steps': route.get('legs', [{}])[0].get('steps', []) if route.get('legs') else []
-        }
+        corte = _indice_de_waypoint(coords, waypoints[1]['location'], legs[0]['distance'])
+        geometrias = (
+            {'type': 'LineString', 'coordinates': coords[:corte + 1]},
+            {'type': 'LineString', 'coordinates': coords[corte:]}
+        )
+        ida, regreso = (
+            _formatear_ruta(leg['distance'], leg['duration'], geometria, [leg])
+            for leg, geometria in zip(legs, geometrias)
+        )
+        return {'ida': ida, 'regreso': regreso}
     except Exception as e:
-        print(f"Error calculando ruta: {e}")
+        print(f"Error calculando ruta ida y regreso: {e}")
+        return None
+
+def _indice_de_waypoint(coords: List[List[float]], location: List[float], distancia_tramo_m: float) -> int:
+    """
+    Índice del vértice de la geometría donde termina el primer tramo: el más cercano
+    al waypoint intermedio y, si la ruta pasa varias veces por ahí, el de distancia
+    acumulada más parecida a la del tramo
+    """
+    lon_w, lat_w = location
+    cos_lat = math.cos(math.radians(lat_w))
+    cercania = []
+    acumulada = 0.0
+    for i, (lon, lat) in enumerate(coords):
+        if i > 0:
+            lon_p, lat_p = coords[i - 1]
+            acumulada += math.hypot((lon - lon_p) * cos_lat, lat - lat_p) * METROS_POR_GRADO
+        d = math.hypot((lon - lon_w) * cos_lat, lat - lat_w) * METROS_POR_GRADO
+        cercania.append((round(d, 1), abs(acumulada - distancia_tramo_m), i))
+    return min(cercania)[2]
+
+def _consultar_offline(
+    origin_lat: float,
+    origin_lon: float,
+    dest_lat: float,
+    dest_lon: float,
+    steps: bool = False
+) -> Optional[Dict]:
+    """Calcula la ruta con el motor offline (grafo vial local, sin red; sin indicaciones paso a paso)"""
+    graph = get_graph()
+    if graph is None:
+        return None
+    ruta = graph.route(origin_lat, origin_lon, dest_lat, dest_lon)
+    if ruta is None:
+        print(f"[WARNING] Sin ruta offline entre ({origin_lat}, {origin_lon}) y ({dest_lat}, {dest_lon})")
         return None
+    leg = {'distance': ruta['distance_m'], 'duration': ruta['duration_s'], 'steps': []}
+    return _formatear_ruta(ruta['distance_m'], ruta['duration_s'], ruta['geometry'], [leg])
+
+# Motores de rutas disponibles: función (origin_lat, origin_lon, dest_lat, dest_lon, steps) -> ruta o None
+ROUTING_BACKENDS = {
+    'osrm': _consultar_osrm,
+    'offline': _consultar_offline,
+}
+
+# Motor activo (ROUTING_BACKEND=offline para usar el grafo local en pruebas o despliegues sin red)
+ROUTING_BACKEND = os.environ.get('ROUTING_BACKEND', 'osrm')
+if ROUTING_BACKEND not in ROUTING_BACKENDS:
+    print(f"[WARNING] ROUTING_BACKEND desconocido: {ROUTING_BACKEND}, usando osrm")
+    ROUTING_BACKEND = 'osrm'
 
 def calcular_ruta_inversa(
     origin_lat: float,
     origin_lon: float,
     dest_lat: float,
-    dest_lon: float
+    dest_lon: float,
+    steps: bool = False
 ) -> Optional[Dict]:
     """
     Calcula ruta de regreso (destino -> origen)
     """
-    return calcular_ruta_con_trafico(dest_lat, dest_lon, origin_lat, origin_lon)
+    return calcular_ruta_con_trafico(dest_lat, dest_lon, origin_lat, origin_lon, steps=steps)
 
@@ -0,0 +1,130 @@
+"""
+Caché de resultados de peajes direccionado por contenido
+La clave es un hash de la geometría cuantizada de la ruta, el umbral,
+origen/destino y la versión de los peajes cargados: al recargar peajes
+cambia la versión y ninguna entrada anterior se vuelve a servir
+"""
+
+import hashlib
+import json
+import time
+from array import array
+from typing import Any, Dict, Optional, Tuple
+
+from services.db import TwoTierCache
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se cuantiza punto a punto
+    np = None
+
+# Cuantización de coordenadas (1e-5 grados ~ 1 m) y de distancias acumuladas (1 m)
+COORD_SCALE = 100000
+DISTANCE_SCALE = 1
+
+
+def make_cache_key(
+    points,
+    cum,
+    threshold_m: float,
+    origin_latlon: Optional[Tuple[float, float]],
+    dest_latlon: Optional[Tuple[float, float]],
+    toll_version: str,
+    variant: str = 'peajes',
+    max_error_m: float = 0.0,
+) -> str:
+    """
+    Hash SHA-256 de la ruta cuantizada (puntos y distancias acumuladas) y de los parámetros del cálculo
+
+    Args:
+        points: Puntos (lat, lon) de la ruta preparada
+        cum: Distancias acumuladas de cada punto (m)
+        toll_version: Versión de los peajes cargados
+        variant: Tipo de resultado guardado (p. ej. 'peajes', 'ida')
+        max_error_m: Desvío por simplificación de la ruta
+    """
+    h = hashlib.sha256()
+    h.update(f"{variant}|{toll_version}|{threshold_m:.1f}|{max_error_m:.1f}|".encode())
+    for latlon in (origin_latlon, dest_latlon):
+        if latlon is None:
+            h.update(b'-|')
+        else:
+            h.update(f"{round(latlon[0] * COORD_SCALE)},{round(latlon[1] * COORD_SCALE)}|".encode())
+    if np is not None:
+        h.update(np.rint(np.asarray(points, dtype=float) * COORD_SCALE).astype(np.int64).tobytes())
+        h.update(np.rint(np.asarray(cum, dtype=float) * DISTANCE_SCALE).astype(np.int64).tobytes())
+    else:
+        coords = array('q')
+        for lat, lon in points:
+            coords.append(round(lat * COORD_SCALE))
+            coords.append(round(lon * COORD_SCALE))
+        h.update(coords.tobytes())
+        h.update(array('q', (round(c * DISTANCE_SCALE) for c in cum)).tobytes())
+    return h.hexdigest()
+
+
+class TollResultCache(TwoTierCache):
+    """
+    Caché LRU en memoria con límite de entradas y de bytes, opcionalmente
+    respaldada por SQLite (persistente entre reinicios). Los valores se guardan
+    serializados en JSON, así cada lectura devuelve una copia independiente.
+    """
+
+    TABLE = 'toll_cache'
+    COLUMNS = (
+        ('value', 'TEXT NOT NULL'),
+        ('created_at', 'REAL NOT NULL'),
+    )
+    LABEL = 'peajes'
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 32 * 1024 * 1024, db_path: Optional[str] = None):
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        super().__init__(db_path=db_path, max_entries=max_entries, max_bytes=max_bytes)
+
+    def _entry_size(self, raw: str) -> int:
+        return len(raw)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Devuelve una copia del valor guardado o None"""
+        raw = self._lookup(key)
+        if raw is not None:
+            with self._lock:
+                self.hits += 1
+            return json.loads(raw)
+
+        row = self._db_get(key)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            raw = row[0]
+            self.hits += 1
+            self.persistent_hits += 1
+            self._store(key, raw)
+        return json.loads(raw)
+
+    def put(self, key: str, value: Any) -> None:
+        """Guarda el valor (en memoria y, si está configurado, en disco)"""
+        raw = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._store(key, raw)
+        self._db_put(key, (raw, time.time()))
+
+    def clear(self) -> None:
+        """Vacía la caché en memoria (la persistente se invalida por versión en la clave)"""
+        self._clear_memory()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'persistent_hits': self.persistent_hits,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                **self._memory_stats()
+            }
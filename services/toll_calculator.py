@@ -4,15 +4,79 @@ Basado en la geometría de la ruta y ubicación de peajes
 Usa proyección local para cálculos precisos de distancia
 """
 
-from typing import List, Dict, Tuple, Set, Any, Optional
-from data.tolls import TOLLS
+from typing import List, Dict, Tuple, Set, Any, Optional, Union, Iterable, Iterator
+from data.tolls import TOLLS, TOLL_STORE
+from data.toll_store import TollStore
+from services.toll_index import TollGridIndex
+from services.toll_cache import TollResultCache, make_cache_key
+from services.rate_limiter import NOMINATIM_LIMITER, PRIORITY_HIGH
+from services import http_client
+import bisect
 import math
-import requests
-import time
+import os
 import json
 
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él se usa el cálculo punto a punto
+    np = None
+
 EARTH_R = 6371000.0  # Radio de la Tierra en metros
 
+# Índice espacial sobre las columnas de los peajes cargados (se construye una vez al cargar peajes)
+TOLL_INDEX = TollGridIndex(TOLL_STORE.points())
+
+
+# Versión de los peajes cargados (se incrementa al recargarlos) y caché de resultados
+TOLLS_VERSION = 1
+TOLL_CACHE = TollResultCache(db_path=os.environ.get('TOLL_CACHE_DB') or None)
+
+
+def set_tolls(tolls: List[Dict]) -> None:
+    """
+    Reemplaza los peajes por defecto y reconstruye su almacén columnar e índice espacial
+    (usado al recargar peajes desde /api/tolls/load)
+    Incrementa la versión de peajes, así la caché nunca sirve resultados anteriores
+    """
+    global TOLLS, TOLL_STORE, TOLL_INDEX, TOLLS_VERSION
+    TOLLS = tolls
+    TOLL_STORE = TollStore(tolls)
+    TOLL_INDEX = TollGridIndex(TOLL_STORE.points())
+    TOLLS_VERSION += 1
+    TOLL_CACHE.clear()
+
+
+def toll_cache_stats() -> Dict[str, Any]:
+    """Contadores de la caché de resultados de peajes y versión de los peajes cargados"""
+    return {**TOLL_CACHE.stats(), 'tolls_version': TOLLS_VERSION}
+
+
+def _toll_cache_key(
+    route: 'PreparedRoute',
+    threshold_m: float,
+    origin_latlon: Optional[Tuple[float, float]],
+    dest_latlon: Optional[Tuple[float, float]],
+    variant: str = 'peajes'
+) -> str:
+    """Clave de caché para un cálculo sobre los peajes por defecto"""
+    return make_cache_key(
+        route.points, route.cum, threshold_m, origin_latlon, dest_latlon,
+        toll_version=f"{TOLLS_VERSION}:{TOLL_STORE.fingerprint}",
+        variant=variant,
+        max_error_m=route.max_error_m
+    )
+
+
+def _get_toll_store(tolls_db: List[Dict], with_index: bool = False) -> Tuple[TollStore, Optional[TollGridIndex]]:
+    """
+    Devuelve el almacén e índice de los peajes por defecto, o construye el almacén para
+    una lista externa (el índice solo si with_index; si no, basta el prefiltro por cajas)
+    """
+    if tolls_db is TOLLS:
+        return TOLL_STORE, TOLL_INDEX
+    store = TollStore(tolls_db)
+    return store, (TollGridIndex(store.points()) if with_index else None)
+
 
 def haversine_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
     """
@@ -52,10 +116,12 @@ def point_segment_distance_m_xy(px, py, ax, ay, bx, by) -> float:
     return math.hypot(px - cx, py - cy)
 
 
-def polyline_length_m(route_latlon: List[Tuple[float, float]]) -> float:
+def polyline_length_m(route_latlon: Union[List[Tuple[float, float]], 'PreparedRoute']) -> float:
     """
     Calcula la longitud total de una polilínea en metros
     """
+    if isinstance(route_latlon, PreparedRoute):
+        return route_latlon.length_m
     total = 0.0
     for i in range(len(route_latlon) - 1):
         total += haversine_m(route_latlon[i], route_latlon[i + 1])
@@ -204,6 +270,463 @@ def route_from_linestring(geometry: Dict[str, Any]) -> List[Tuple[float, float]]
     return out
 
 
+def _douglas_peucker(xs: List[float], ys: List[float], tolerance_m: float) -> List[int]:
+    """
+    Simplificación Douglas-Peucker (iterativa) sobre coordenadas XY en metros
+    Usa la distancia a segmento (no a la recta), así el desvío máximo está garantizado
+    
+    Returns:
+        Índices ordenados de los vértices conservados (siempre incluye el primero y el último)
+    """
+    n = len(xs)
+    if n < 3:
+        return list(range(n))
+    
+    keep = [False] * n
+    keep[0] = keep[n - 1] = True
+    x_arr = np.asarray(xs, dtype=float) if np is not None else None
+    y_arr = np.asarray(ys, dtype=float) if np is not None else None
+    stack = [(0, n - 1)]
+    
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        ax, ay, bx, by = xs[first], ys[first], xs[last], ys[last]
+        
+        if x_arr is not None:
+            px = x_arr[first + 1:last]
+            py = y_arr[first + 1:last]
+            abx, aby = bx - ax, by - ay
+            ab2 = abx * abx + aby * aby
+            if ab2 > 0:
+                t = np.clip(((px - ax) * abx + (py - ay) * aby) / ab2, 0.0, 1.0)
+                d = np.hypot(px - (ax + t * abx), py - (ay + t * aby))
+            else:
+                d = np.hypot(px - ax, py - ay)
+            k = int(np.argmax(d))
+            max_d, index = float(d[k]), first + 1 + k
+        else:
+            max_d, index = -1.0, first
+            for i in range(first + 1, last):
+                d = point_segment_distance_m_xy(xs[i], ys[i], ax, ay, bx, by)
+                if d > max_d:
+                    max_d, index = d, i
+        
+        if max_d > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    
+    return [i for i in range(n) if keep[i]]
+
+
+# Máximo de pares (punto, segmento) evaluados por bloque en el cálculo vectorizado
+_BATCH_MAX_PAIRS = 1_000_000
+
+# Tamaño máximo de cada tramo del corredor de la ruta (prefiltro por cajas)
+CORRIDOR_CHUNK_SEGMENTS = 64
+CORRIDOR_CHUNK_M = 10000.0
+
+
+class PreparedRoute:
+    """
+    Ruta preparada una sola vez a partir de la geometría:
+    puntos (lat, lon), proyección XY local, longitud haversine de cada segmento
+    y distancia acumulada en cada vértice.
+    
+    Evita re-proyectar y re-medir la misma polilínea en cada consulta
+    (cálculo de peajes, búsqueda del punto más cercano, truncado, longitud).
+    """
+
+    def __init__(
+        self,
+        points: List[Tuple[float, float]],
+        origin: Optional[Tuple[float, float]] = None,
+        first_segment_m: Optional[float] = None,
+    ):
+        """
+        Args:
+            points: Lista de puntos (lat, lon)
+            origin: Centro de la proyección local (default: primer punto)
+            first_segment_m: Longitud ya conocida del primer segmento (uso interno)
+        """
+        if not points:
+            raise ValueError("La ruta debe tener al menos 1 punto.")
+        self.points = points
+        self.lat0, self.lon0 = origin if origin is not None else points[0]
+        
+        kx = EARTH_R * math.cos(math.radians(self.lat0))
+        self.xs = [math.radians(lon - self.lon0) * kx for _, lon in points]
+        self.ys = [math.radians(lat - self.lat0) * EARTH_R for lat, _ in points]
+        
+        self.seg_len = [haversine_m(points[i], points[i + 1]) for i in range(len(points) - 1)]
+        if first_segment_m is not None and self.seg_len:
+            self.seg_len[0] = first_segment_m
+        
+        # cum[i] = distancia acumulada desde el inicio hasta el vértice i
+        self.cum = [0.0]
+        accumulated = 0.0
+        for seg_length in self.seg_len:
+            accumulated += seg_length
+            self.cum.append(accumulated)
+        
+        # Vértices de la geometría original y desvío máximo acumulado por simplificación
+        self.source_vertex_count = len(points)
+        self.source_indices = None  # Índice original de cada vértice (solo si se simplificó)
+        self.source_offset = 0  # Vértices de la geometría original descartados al truncar
+        # Ruta original con todos los vértices (None: esta misma) y distancia en ella del vértice 0;
+        # al truncar una ruta simplificada el corte se busca sobre los vértices originales
+        self.source_route = None
+        self.source_start_m = 0.0
+        self.max_error_m = 0.0
+        self._reset_caches()
+
+    @classmethod
+    def from_geojson(cls, geometry: Dict[str, Any], simplify_tolerance_m: float = 0.0) -> 'PreparedRoute':
+        """
+        Construye la ruta preparada desde un GeoJSON LineString
+        (opcionalmente simplificada con desvío máximo simplify_tolerance_m)
+        """
+        route = cls(route_from_linestring(geometry))
+        if simplify_tolerance_m > 0:
+            route = route.simplified(simplify_tolerance_m)
+        return route
+
+    def simplified(self, max_error_m: float) -> 'PreparedRoute':
+        """
+        Ruta simplificada con Douglas-Peucker en XY local: todo vértice original
+        queda a menos de max_error_m de la ruta simplificada.
+        
+        Los vértices conservados mantienen la distancia acumulada de la ruta original,
+        así la longitud total y las posiciones siguen medidas sobre la ruta completa.
+        """
+        if max_error_m <= 0 or len(self.points) < 3:
+            return self
+        keep = _douglas_peucker(self.xs, self.ys, max_error_m)
+        if len(keep) == len(self.points):
+            return self
+        
+        simplified = PreparedRoute.__new__(PreparedRoute)
+        simplified.points = [self.points[i] for i in keep]
+        simplified.lat0, simplified.lon0 = self.lat0, self.lon0
+        simplified.xs = [self.xs[i] for i in keep]
+        simplified.ys = [self.ys[i] for i in keep]
+        simplified.cum = [self.cum[i] for i in keep]
+        simplified.seg_len = [b - a for a, b in zip(simplified.cum, simplified.cum[1:])]
+        simplified.source_vertex_count = self.source_vertex_count
+        simplified.source_indices = (
+            keep if self.source_indices is None else [self.source_indices[i] for i in keep]
+        )
+        simplified.source_offset = self.source_offset
+        simplified.source_route = self.source_route or self
+        simplified.source_start_m = self.source_start_m
+        simplified.max_error_m = self.max_error_m + max_error_m
+        simplified._reset_caches()
+        return simplified
+
+    def simplification_stats(self) -> Optional[Dict[str, Any]]:
+        """Reducción de vértices por simplificación (None si la ruta no se simplificó)"""
+        if self.max_error_m <= 0:
+            return None
+        return {
+            'vertices_originales': self.source_vertex_count,
+            'vertices': len(self.points),
+            'reduccion_pct': round(100.0 * (1 - len(self.points) / self.source_vertex_count), 1),
+            'desvio_max_m': self.max_error_m
+        }
+
+    def source_index(self, k: int) -> int:
+        """
+        Índice del vértice k en la geometría original completa (antes de simplificar y truncar).
+        El vértice 0 de una ruta truncada es interpolado: source_index(0) es el vértice
+        original anterior a él.
+        """
+        return self.source_offset + (self.source_indices[k] if self.source_indices is not None else k)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def length_m(self) -> float:
+        """Longitud total de la ruta en metros"""
+        return self.cum[-1]
+
+    def segment_at(self, distance_m: float) -> Tuple[int, float]:
+        """
+        Busca (binaria) el segmento que contiene la distancia acumulada dada
+        
+        Returns:
+            Tupla (segment_index, t) con t en [0, 1] la fracción dentro del segmento
+        """
+        if len(self.points) < 2:
+            return (0, 0.0)
+        i = bisect.bisect_right(self.cum, distance_m) - 1
+        i = max(0, min(i, len(self.seg_len) - 1))
+        seg_length = self.seg_len[i]
+        t = (distance_m - self.cum[i]) / seg_length if seg_length > 0 else 0.0
+        return (i, max(0.0, min(1.0, t)))
+
+    def interpolate(self, segment_index: int, t: float) -> Tuple[float, float]:
+        """
+        Punto interpolado (lat, lon) a una fracción t del segmento
+        """
+        seg_start = self.points[segment_index]
+        seg_end = self.points[min(segment_index + 1, len(self.points) - 1)]
+        return (
+            seg_start[0] + t * (seg_end[0] - seg_start[0]),
+            seg_start[1] + t * (seg_end[1] - seg_start[1]),
+        )
+
+    def truncate_at(self, segment_index: int, t: float) -> 'PreparedRoute':
+        """
+        Ruta desde el punto a fracción t del segmento hasta el final.
+        Reutiliza las longitudes ya medidas de los segmentos restantes.
+        Si la ruta está simplificada, el punto de corte se interpola sobre el segmento
+        original que lo contiene (búsqueda binaria en las distancias de la ruta completa)
+        y source_index(0) es el vértice original anterior al corte.
+        """
+        # Distancias en la misma métrica de la ruta original (también si fue simplificada)
+        offset = self.cum[segment_index] + t * self.seg_len[segment_index]
+        source = self.source_route or self
+        if self.source_indices is None:
+            start = self.interpolate(segment_index, t)
+        else:
+            source_segment, source_t = source.segment_at(self.source_start_m + offset)
+            start = source.interpolate(source_segment, source_t)
+        points = [start] + self.points[segment_index + 1:]
+        truncated = PreparedRoute.__new__(PreparedRoute)
+        truncated.points = points
+        truncated.lat0, truncated.lon0 = self.lat0, self.lon0
+        
+        kx = EARTH_R * math.cos(math.radians(self.lat0))
+        truncated.xs = [math.radians(start[1] - self.lon0) * kx] + self.xs[segment_index + 1:]
+        truncated.ys = [math.radians(start[0] - self.lat0) * EARTH_R] + self.ys[segment_index + 1:]
+        
+        truncated.cum = [0.0] + [c - offset for c in self.cum[segment_index + 1:]]
+        truncated.seg_len = [b - a for a, b in zip(truncated.cum, truncated.cum[1:])]
+        if self.source_indices is None:
+            truncated.source_vertex_count = len(points)
+            truncated.source_indices = None
+            truncated.source_offset = self.source_offset + segment_index
+        else:
+            # Índices relativos a source_offset (source_route es la geometría completa)
+            base = source_segment - self.source_offset
+            truncated.source_vertex_count = self.source_vertex_count - (base - self.source_indices[0])
+            truncated.source_indices = [base] + self.source_indices[segment_index + 1:]
+            truncated.source_offset = self.source_offset
+        truncated.source_route = source
+        truncated.source_start_m = self.source_start_m + offset
+        truncated.max_error_m = self.max_error_m
+        truncated._reset_caches()
+        return truncated
+
+    def truncate(self, distance_m: float) -> 'PreparedRoute':
+        """
+        Ruta desde una distancia acumulada hasta el final (búsqueda binaria del segmento).
+        Con menos de 100m desde el inicio devuelve la misma ruta, y con menos de 100m
+        hasta el final solo el último punto (igual que truncate_route_from_point).
+        """
+        if len(self.points) < 2 or distance_m < 100.0:
+            return self
+        if distance_m > self.length_m - 100.0:
+            return PreparedRoute([self.points[-1]])
+        segment_index, t = self.segment_at(distance_m)
+        return self.truncate_at(segment_index, t)
+
+    def _reset_caches(self) -> None:
+        """Inicializa los datos derivados que se calculan bajo demanda"""
+        self._arrays = None
+        self._corridors: Dict[float, Tuple] = {}
+
+    def corridor(self, buffer_m: float) -> Tuple[Tuple[float, float, float, float], List[Tuple]]:
+        """
+        Corredor de la ruta en XY local ampliado en buffer_m: caja total y cajas por tramo.
+        Cada tramo agrupa hasta CORRIDOR_CHUNK_SEGMENTS segmentos o CORRIDOR_CHUNK_M metros
+        de ruta, lo que ocurra primero, así las cajas siguen la forma de la ruta tanto en
+        geometrías densas como en tramos largos y rectos.
+        
+        Returns:
+            Tupla (caja_total, tramos) con caja_total = (min_x, max_x, min_y, max_y) y
+            cada tramo = (min_x, max_x, min_y, max_y, primer_segmento, fin_segmentos)
+        """
+        cached = self._corridors.get(buffer_m)
+        if cached is not None:
+            return cached
+        
+        n_seg = len(self.seg_len)
+        xs, ys = self.xs, self.ys
+        
+        # Inicio de cada tramo: cada CORRIDOR_CHUNK_SEGMENTS segmentos o CORRIDOR_CHUNK_M metros
+        starts = set(range(0, n_seg, CORRIDOR_CHUNK_SEGMENTS))
+        next_cut = CORRIDOR_CHUNK_M
+        for i in range(n_seg):
+            if self.cum[i] >= next_cut:
+                starts.add(i)
+                next_cut = self.cum[i] + CORRIDOR_CHUNK_M
+        starts = sorted(starts)
+        
+        chunks = []
+        for first, end in zip(starts, starts[1:] + [n_seg]):
+            chunk_x = xs[first:end + 1]
+            chunk_y = ys[first:end + 1]
+            chunks.append((
+                min(chunk_x) - buffer_m, max(chunk_x) + buffer_m,
+                min(chunk_y) - buffer_m, max(chunk_y) + buffer_m,
+                first, end
+            ))
+        
+        bbox = (
+            min(c[0] for c in chunks), max(c[1] for c in chunks),
+            min(c[2] for c in chunks), max(c[3] for c in chunks)
+        )
+        self._corridors[buffer_m] = (bbox, chunks)
+        return bbox, chunks
+
+    def xy_box_to_latlon(self, box: Tuple[float, float, float, float]) -> Tuple[float, float, float, float]:
+        """Convierte una caja XY local (min_x, max_x, min_y, max_y) a (min_lat, max_lat, min_lon, max_lon)"""
+        kx = EARTH_R * math.cos(math.radians(self.lat0))
+        return (
+            self.lat0 + math.degrees(box[2] / EARTH_R), self.lat0 + math.degrees(box[3] / EARTH_R),
+            self.lon0 + math.degrees(box[0] / kx), self.lon0 + math.degrees(box[1] / kx)
+        )
+
+    def nearest_in_segments(
+        self,
+        point: Tuple[float, float],
+        ranges: List[Tuple[int, int]]
+    ) -> Tuple[float, float, int, float]:
+        """
+        Como nearest() para un punto, pero solo evaluando los segmentos de los rangos
+        [primer_segmento, fin) dados (en orden ascendente)
+        """
+        if np is None:
+            return self._nearest_scalar(point, ranges)
+        
+        arr = self._np_arrays()
+        if len(ranges) == 1:
+            idx = slice(ranges[0][0], ranges[0][1])
+            offsets = None
+        else:
+            offsets = np.concatenate([np.arange(first, end) for first, end in ranges])
+            idx = offsets
+        ax, ay, abx, aby = arr['ax'][idx], arr['ay'][idx], arr['abx'][idx], arr['aby'][idx]
+        
+        px, py = self.project_point(point)
+        t = ((px - ax) * abx + (py - ay) * aby) / arr['ab2'][idx]
+        np.clip(t, 0.0, 1.0, out=t)
+        d = np.hypot(px - (ax + t * abx), py - (ay + t * aby))
+        d[~arr['valid'][idx]] = np.inf
+        
+        k = int(np.argmin(d))
+        if math.isinf(d[k]):
+            return (float("inf"), 0.0, 0, 0.0)
+        seg = ranges[0][0] + k if offsets is None else int(offsets[k])
+        frac = float(t[k])
+        return (float(d[k]), self.cum[seg] + frac * self.seg_len[seg], seg, frac)
+
+    def _np_arrays(self) -> Dict[str, Any]:
+        """Arreglos NumPy de los segmentos (se construyen una vez por ruta)"""
+        if self._arrays is None:
+            x = np.asarray(self.xs, dtype=float)
+            y = np.asarray(self.ys, dtype=float)
+            ax, ay = x[:-1], y[:-1]
+            abx, aby = x[1:] - ax, y[1:] - ay
+            ab2 = abx * abx + aby * aby
+            valid = ab2 > 0
+            self._arrays = {
+                'ax': ax, 'ay': ay, 'abx': abx, 'aby': aby,
+                'ab2': np.where(valid, ab2, 1.0),
+                'valid': valid,
+                'seg_len': np.asarray(self.seg_len, dtype=float),
+                'seg_start': np.asarray(self.cum[:-1], dtype=float),
+            }
+        return self._arrays
+
+    def project_point(self, point: Tuple[float, float]) -> Tuple[float, float]:
+        """Proyecta un punto (lat, lon) al XY local de la ruta"""
+        return to_local_xy_m(self.lat0, self.lon0, point[0], point[1])
+
+    def nearest(self, points: List[Tuple[float, float]]) -> List[Tuple[float, float, int, float]]:
+        """
+        Punto más cercano de la ruta para cada punto dado.
+        Los segmentos de longitud 0 se ignoran y ante empates gana el primer segmento,
+        igual que en min_distance_point_to_polyline_m.
+        
+        Returns:
+            Lista de tuplas (distancia_perpendicular_m, distancia_acumulada_m, segment_index, t)
+        """
+        if not points:
+            return []
+        if len(self.points) < 2:
+            raise ValueError("La ruta debe tener al menos 2 puntos.")
+        if np is None:
+            return [self._nearest_scalar(p) for p in points]
+        
+        arr = self._np_arrays()
+        ax, ay, abx, aby = arr['ax'], arr['ay'], arr['abx'], arr['aby']
+        
+        pts = np.asarray(points, dtype=float)
+        kx = EARTH_R * math.cos(math.radians(self.lat0))
+        px_all = np.radians(pts[:, 1] - self.lon0) * kx
+        py_all = np.radians(pts[:, 0] - self.lat0) * EARTH_R
+        
+        rows_per_block = max(1, _BATCH_MAX_PAIRS // len(ax))
+        results: List[Tuple[float, float, int, float]] = []
+        
+        for start in range(0, len(pts), rows_per_block):
+            px = px_all[start:start + rows_per_block, None]
+            py = py_all[start:start + rows_per_block, None]
+            
+            t = ((px - ax) * abx + (py - ay) * aby) / arr['ab2']
+            np.clip(t, 0.0, 1.0, out=t)
+            d = np.hypot(px - (ax + t * abx), py - (ay + t * aby))
+            # Segmentos degenerados (longitud 0) no se consideran, igual que en la versión escalar
+            d[:, ~arr['valid']] = np.inf
+            
+            best = np.argmin(d, axis=1)
+            rows = np.arange(len(best))
+            best_d = d[rows, best]
+            best_t = t[rows, best]
+            best_acc = arr['seg_start'][best] + best_t * arr['seg_len'][best]
+            
+            for dist, acc, idx, frac in zip(best_d.tolist(), best_acc.tolist(), best.tolist(), best_t.tolist()):
+                if math.isinf(dist):
+                    results.append((float("inf"), 0.0, 0, 0.0))
+                else:
+                    results.append((dist, acc, idx, frac))
+        
+        return results
+
+    def _nearest_scalar(
+        self,
+        point: Tuple[float, float],
+        ranges: Optional[List[Tuple[int, int]]] = None
+    ) -> Tuple[float, float, int, float]:
+        """Punto más cercano de la ruta sin NumPy (segmento por segmento)"""
+        px, py = self.project_point(point)
+        xs, ys = self.xs, self.ys
+        best = (float("inf"), 0.0, 0, 0.0)
+        if ranges is None:
+            segments = range(len(self.seg_len))
+        else:
+            segments = (i for first, end in ranges for i in range(first, end))
+        
+        for i in segments:
+            ax, ay, bx, by = xs[i], ys[i], xs[i + 1], ys[i + 1]
+            abx, aby = bx - ax, by - ay
+            ab2 = abx * abx + aby * aby
+            if ab2 <= 0:
+                continue
+            t = ((px - ax) * abx + (py - ay) * aby) / ab2
+            t = max(0.0, min(1.0, t))
+            d_perp = math.hypot(px - (ax + t * abx), py - (ay + t * aby))
+            if d_perp < best[0]:
+                best = (d_perp, self.cum[i] + t * self.seg_len[i], i, t)
+        
+        return best
+
+
 def toll_point_from_feature(feature: Dict[str, Any]) -> Optional[Tuple[float, float]]:
     """
     Extrae las coordenadas de un peaje desde un feature GeoJSON
@@ -227,11 +750,13 @@ def toll_point_from_feature(feature: Dict[str, Any]) -> Optional[Tuple[float, fl
     return None
 
 def _calcular_peajes(
-    geometry: Dict,
+    geometry: Union[Dict, 'PreparedRoute'],
     tolls_db: List[Dict] = None,
     threshold_m: float = 5000.0,
     origin_latlon: Optional[Tuple[float, float]] = None,
-    dest_latlon: Optional[Tuple[float, float]] = None
+    dest_latlon: Optional[Tuple[float, float]] = None,
+    simplify_tolerance_m: float = 0.0,
+    use_cache: bool = True
 ) -> Dict:
     """
     Calcula qué peajes están en la ruta basándose en la geometría
@@ -239,150 +764,423 @@ def _calcular_peajes(
     Solo incluye peajes que están en el orden lógico de la ruta (desde origen hasta destino)
     
     Args:
-        geometry: GeoJSON LineString con la ruta
+        geometry: GeoJSON LineString con la ruta, o PreparedRoute ya construida
         tolls_db: Lista de peajes (default: TOLLS)
         threshold_m: Umbral de distancia en metros (default: 5000m = 5km)
         origin_latlon: Coordenadas del origen (lat, lon) - opcional, para validación
         dest_latlon: Coordenadas del destino (lat, lon) - opcional, para validación
+        simplify_tolerance_m: Desvío máximo (m) para simplificar la ruta antes de emparejar;
+            el umbral se amplía con ese valor (default: 0 = sin simplificar)
+        use_cache: Usar la caché de resultados (solo con los peajes por defecto)
     
     Returns:
         dict con 'peajes_en_ruta', 'costo_total_cop', 'count'
+        (y 'simplificacion' con la reducción de vértices si la ruta se simplificó)
     """
     if tolls_db is None:
         tolls_db = TOLLS
     
-    if not geometry or geometry.get('type') != 'LineString':
-        return {
-            'peajes_en_ruta': [],
-            'costo_total_cop': 0,
-            'count': 0
-        }
+    if isinstance(geometry, PreparedRoute):
+        route = geometry
+    else:
+        if not geometry or geometry.get('type') != 'LineString':
+            return {
+                'peajes_en_ruta': [],
+                'costo_total_cop': 0,
+                'count': 0
+            }
+        
+        try:
+            # Convertir GeoJSON LineString a ruta preparada (puntos, XY local, distancias acumuladas)
+            route = PreparedRoute.from_geojson(geometry)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[ERROR] Error procesando geometría de ruta: {e}")
+            return {
+                'peajes_en_ruta': [],
+                'costo_total_cop': 0,
+                'count': 0
+            }
     
-    try:
-        # Convertir GeoJSON LineString a lista de puntos (lat, lon)
-        route = route_from_linestring(geometry)
-    except (ValueError, KeyError, TypeError) as e:
-        print(f"[ERROR] Error procesando geometría de ruta: {e}")
-        return {
-            'peajes_en_ruta': [],
-            'costo_total_cop': 0,
-            'count': 0
+    if simplify_tolerance_m > 0:
+        route = route.simplified(simplify_tolerance_m)
+    
+    cache_key = None
+    if use_cache and tolls_db is TOLLS:
+        cache_key = _toll_cache_key(route, threshold_m, origin_latlon, dest_latlon)
+        cached = TOLL_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    matches = _emparejar_peajes(route, tolls_db=tolls_db, threshold_m=threshold_m)
+    resultado = _filtrar_peajes(matches, origin_latlon=origin_latlon, dest_latlon=dest_latlon)
+    
+    if cache_key is not None:
+        TOLL_CACHE.put(cache_key, resultado)
+    return resultado
+
+
+def _calcular_peajes_desde_primer_peaje(
+    route: 'PreparedRoute',
+    threshold_m: float,
+    origin_latlon: Tuple[float, float],
+    dest_latlon: Tuple[float, float],
+    use_cache: bool = True
+) -> Tuple[Dict, Optional[Dict], Optional['PreparedRoute']]:
+    """
+    Peajes de la ruta completa y, si hay alguno, de la ruta re-anclada en el primer peaje
+    (desde el primer peaje hasta el destino, con ese peaje como origen)
+    
+    Returns:
+        Tupla (peajes_ruta_completa, peajes_desde_primer_peaje, ruta_desde_primer_peaje);
+        los dos últimos son None si la ruta no tiene peajes
+    """
+    cache_key = None
+    if use_cache:
+        cache_key = _toll_cache_key(route, threshold_m, origin_latlon, dest_latlon, variant='desde_primer_peaje')
+        cached = TOLL_CACHE.get(cache_key)
+        if cached is not None:
+            if cached['posicion_m'] is None:
+                return cached['completa'], None, None
+            return cached['completa'], cached['desde_primer_peaje'], route.truncate(cached['posicion_m'])
+    
+    matches = _emparejar_peajes(route, threshold_m=threshold_m)
+    completa = _filtrar_peajes(matches, origin_latlon=origin_latlon, dest_latlon=dest_latlon)
+    desde_primer_peaje = None
+    posicion_m = None
+    ruta_truncada = None
+    
+    if completa['count'] > 0:
+        primer_peaje = completa['peajes_en_ruta'][0]
+        primer_peaje_point = (primer_peaje['latitude'], primer_peaje['longitude'])
+        posicion_m = matches.position_m(primer_peaje['id'])
+        
+        # Re-anclar los peajes ya emparejados en el primer peaje (sin volver a emparejar)
+        matches_truncada = matches.reanchor(posicion_m)
+        ruta_truncada = matches_truncada.route
+        desde_primer_peaje = _filtrar_peajes(
+            matches_truncada,
+            origin_latlon=primer_peaje_point,
+            dest_latlon=dest_latlon
+        )
+    
+    if cache_key is not None:
+        TOLL_CACHE.put(cache_key, {
+            'completa': completa,
+            'desde_primer_peaje': desde_primer_peaje,
+            'posicion_m': posicion_m
+        })
+    return completa, desde_primer_peaje, ruta_truncada
+
+
+def _parse_latlon(value: Any) -> Optional[Tuple[float, float]]:
+    """
+    Convierte {'lat': .., 'lon': ..} o [lat, lon] a tupla (lat, lon); None si no viene
+    """
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return (float(value['lat']), float(value['lon']))
+    lat, lon = value
+    return (float(lat), float(lon))
+
+
+def _calcular_peajes_batch(
+    routes: Iterable[Dict],
+    tolls_db: List[Dict] = None,
+    threshold_m: float = 5000.0,
+    simplify_tolerance_m: float = 0.0
+) -> Iterator[Dict]:
+    """
+    Calcula los peajes de muchas rutas ya conocidas (sin geocoding ni routing)
+    compartiendo el mismo almacén e índice de peajes para todas
+    Genera el resultado de cada ruta apenas termina, en el orden de entrada
+    
+    Args:
+        routes: Iterable de dicts {'id': opcional, 'geometry': GeoJSON LineString,
+            'origin': opcional, 'destination': opcional}; origin/destination como
+            {'lat', 'lon'} o [lat, lon]. También se acepta directamente un LineString.
+        tolls_db: Lista de peajes (default: TOLLS)
+        threshold_m: Umbral de distancia en metros
+        simplify_tolerance_m: Desvío máximo (m) para simplificar cada ruta (default: 0)
+    
+    Yields:
+        dict con 'index', 'id', 'success' y 'peajes' (mismo formato que _calcular_peajes)
+        o 'error' si la ruta no se pudo procesar
+    """
+    if tolls_db is None:
+        tolls_db = TOLLS
+    toll_store = _get_toll_store(tolls_db, with_index=True)
+    use_cache = tolls_db is TOLLS
+    
+    for i, item in enumerate(routes):
+        route_id = item.get('id') if isinstance(item, dict) else None
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Cada ruta debe ser un objeto")
+            geometry = item if item.get('type') == 'LineString' else item.get('geometry')
+            if not isinstance(geometry, dict) or geometry.get('type') != 'LineString':
+                raise ValueError("Se esperaba un GeoJSON LineString en 'geometry'")
+            origin_latlon = _parse_latlon(item.get('origin'))
+            dest_latlon = _parse_latlon(item.get('destination'))
+            route = PreparedRoute.from_geojson(geometry, simplify_tolerance_m=simplify_tolerance_m)
+        except (ValueError, KeyError, TypeError) as e:
+            yield {'index': i, 'id': route_id, 'success': False, 'error': str(e)}
+            continue
+        
+        cache_key = _toll_cache_key(route, threshold_m, origin_latlon, dest_latlon) if use_cache else None
+        peajes = TOLL_CACHE.get(cache_key) if cache_key else None
+        if peajes is None:
+            matches = _emparejar_peajes(route, tolls_db=tolls_db, threshold_m=threshold_m, toll_store=toll_store)
+            peajes = _filtrar_peajes(matches, origin_latlon=origin_latlon, dest_latlon=dest_latlon)
+            if cache_key:
+                TOLL_CACHE.put(cache_key, peajes)
+        
+        yield {
+            'index': i,
+            'id': route_id,
+            'success': True,
+            'distance_km': round(route.length_m / 1000.0, 2),
+            'peajes': peajes
         }
+
+
+class TollMatches:
+    """
+    Peajes activos a menos de threshold_m de una ruta preparada, con su distancia
+    perpendicular y su posición en la ruta, antes de aplicar los filtros de
+    rango, origen y dirección de _filtrar_peajes.
+    
+    Permite re-anclar la ruta en una posición (p. ej. el primer peaje) y obtener
+    el resultado de la ruta truncada sin volver a emparejar todos los peajes.
+    """
+
+    def __init__(self, route: PreparedRoute, threshold_m: float, candidates: List[Tuple]):
+        self.route = route
+        self.threshold_m = threshold_m
+        # Tuplas (TollRecord, lat, lon, d_perp_m, d_accumulated_m, segment_index)
+        self.candidates = candidates
+
+    def position_m(self, toll_id: Any) -> Optional[float]:
+        """Posición (m desde el inicio de la ruta) del peaje con ese id, o None"""
+        for toll, _, _, _, d_accumulated_m, _ in self.candidates:
+            if toll.id == toll_id:
+                return d_accumulated_m
+        return None
+
+    def reanchor(self, distance_m: float) -> 'TollMatches':
+        """
+        Trunca la ruta en distance_m y desplaza las posiciones de los candidatos.
+        
+        Los candidatos emparejados después del segmento de corte conservan su distancia
+        y solo se desplazan; los demás (pocos) se vuelven a medir contra la ruta truncada.
+        Ningún peaje fuera de este conjunto puede quedar a menos del umbral de la ruta
+        truncada, porque ésta es parte de la ruta original.
+        """
+        route = self.route
+        truncated = route.truncate(distance_m)
+        if truncated is route:
+            return self
+        if len(truncated) < 2:
+            return TollMatches(truncated, self.threshold_m, [])
+        
+        segment_index, _ = route.segment_at(distance_m)
+        shift = route.cum[segment_index + 1] - truncated.cum[1]
+        
+        remeasure = [c for c in self.candidates if c[5] <= segment_index]
+        nearest = truncated.nearest([(lat, lon) for _, lat, lon, _, _, _ in remeasure])
+        remeasured = {id(c): m for c, m in zip(remeasure, nearest)}
+        
+        # Se conserva el orden original de los candidatos
+        candidates = []
+        for c in self.candidates:
+            toll, lat, lon, d_perp_m, d_accumulated_m, seg = c
+            if seg > segment_index:
+                candidates.append((toll, lat, lon, d_perp_m, d_accumulated_m - shift, seg - segment_index))
+                continue
+            d_perp_m, d_accumulated_m, seg, _ = remeasured[id(c)]
+            if d_perp_m <= self.threshold_m:
+                candidates.append((toll, lat, lon, d_perp_m, d_accumulated_m, seg))
+        
+        return TollMatches(truncated, self.threshold_m, candidates)
+
+
+def _emparejar_peajes(
+    route: PreparedRoute,
+    tolls_db: List[Dict] = None,
+    threshold_m: float = 5000.0,
+    toll_store: Optional[Tuple[TollStore, Optional[TollGridIndex]]] = None
+) -> TollMatches:
+    """
+    Busca los peajes activos con coordenadas a menos de threshold_m de la ruta
+    (sin filtros de rango ni de dirección)
     
-    # Calcular distancia total de la ruta para validación
-    route_length_m = polyline_length_m(route)
+    Args:
+        toll_store: (almacén, índice) ya construidos para tolls_db, para compartirlos
+            entre varias rutas (default: se obtienen con _get_toll_store)
+    """
+    if tolls_db is None:
+        tolls_db = TOLLS
     
-    peajes_en_ruta = []
+    # Si la ruta fue simplificada, ampliar el umbral con el desvío máximo
+    # para no perder ningún peaje de la ruta original
+    threshold_m = threshold_m + route.max_error_m
+    
+    if len(route) < 2:
+        return TollMatches(route, threshold_m, [])
+    
+    # Corredor de la ruta ampliado por el umbral: caja total y cajas por tramo (XY local)
+    (min_x, max_x, min_y, max_y), tramos = route.corridor(threshold_m)
     
-    # SOLO incluir peajes que tienen coordenadas y están cerca de la ruta
-    for toll in tolls_db:
-        # Solo considerar peajes activos
-        if toll.get('status') != 'ACTIVE':
+    # Con el índice espacial solo se consideran los peajes de las celdas que tocan los tramos;
+    # sin índice (lista de peajes externa) se revisan todos contra las cajas
+    store, index = toll_store if toll_store is not None else _get_toll_store(tolls_db)
+    if index is not None:
+        # 1 m de margen para que el redondeo al pasar a grados no deje celdas afuera
+        candidatos = index.candidates_for_boxes(
+            route.xy_box_to_latlon((t[0] - 1.0, t[1] + 1.0, t[2] - 1.0, t[3] + 1.0)) for t in tramos
+        )
+    else:
+        candidatos = range(len(store))
+    lats, lons = store.lat, store.lon
+    kx = EARTH_R * math.cos(math.radians(route.lat0))
+    
+    # SOLO conservar peajes que están cerca de la ruta (columnas ya filtradas: activos con coordenadas)
+    cercanos = []
+    for i in candidatos:
+        # Prefiltro: fuera de la caja total del corredor se descarta con cuatro comparaciones
+        px = math.radians(lons[i] - route.lon0) * kx
+        py = math.radians(lats[i] - route.lat0) * EARTH_R
+        if px < min_x or px > max_x or py < min_y or py > max_y:
             continue
         
-        # SOLO procesar peajes con coordenadas
-        if 'latitude' in toll and 'longitude' in toll:
-            try:
-                toll_lat = float(toll['latitude'])
-                toll_lon = float(toll['longitude'])
-                toll_point = (toll_lat, toll_lon)
-                
-                # Calcular distancia perpendicular y posición en la ruta
-                d_perp_m, d_accumulated_m = min_distance_point_to_polyline_m(toll_point, route)
+        # Solo los segmentos de los tramos cuya caja contiene al peaje llegan a la prueba exacta
+        rangos = [(t[4], t[5]) for t in tramos if t[0] <= px <= t[1] and t[2] <= py <= t[3]]
+        if not rangos:
+            continue
+        
+        d_perp_m, d_accumulated_m, seg, _ = route.nearest_in_segments((lats[i], lons[i]), rangos)
+        if d_perp_m <= threshold_m:
+            cercanos.append((store.records[i], lats[i], lons[i], d_perp_m, d_accumulated_m, seg))
+    
+    return TollMatches(route, threshold_m, cercanos)
+
+
+def _filtrar_peajes(
+    matches: TollMatches,
+    origin_latlon: Optional[Tuple[float, float]] = None,
+    dest_latlon: Optional[Tuple[float, float]] = None
+) -> Dict:
+    """
+    Aplica a los peajes emparejados los filtros de rango de la ruta y de dirección
+    origen -> destino, y arma el resultado ordenado por posición en la ruta
+    
+    Returns:
+        dict con 'peajes_en_ruta', 'costo_total_cop', 'count'
+    """
+    # Distancia total de la ruta para validación (ya medida al preparar la ruta)
+    route_length_m = matches.route.length_m
+    
+    peajes_en_ruta = []
+    
+    for toll, toll_lat, toll_lon, d_perp_m, d_accumulated_m, _ in matches.candidates:
+        try:
+            # Validar que el peaje esté dentro del rango de la ruta
+            # Solo incluir peajes que están entre el origen y el destino
+            margin_start = 1000.0  # 1km desde el origen (evita peajes en el punto de partida)
+            margin_end = 200.0  # 200m al final (ajustado para incluir La Lizama que está muy cerca del destino)
+            
+            # Validación básica: el peaje debe estar dentro del rango de la ruta
+            if margin_start <= d_accumulated_m <= route_length_m - margin_end:
+                # Validación adicional: verificar que el peaje esté en la dirección correcta
+                is_valid = True
                 
-                # Solo incluir si está cerca de la ruta (umbral más estricto)
-                if d_perp_m <= threshold_m:
-                    # Validar que el peaje esté dentro del rango de la ruta
-                    # Solo incluir peajes que están entre el origen y el destino
-                    margin_start = 1000.0  # 1km desde el origen (evita peajes en el punto de partida)
-                    margin_end = 200.0  # 200m al final (ajustado para incluir La Lizama que está muy cerca del destino)
+                if origin_latlon and dest_latlon:
+                    # Calcular distancia del peaje al origen y destino en línea recta
+                    dist_to_origin_straight = haversine_m((toll_lat, toll_lon), origin_latlon)
+                    dist_to_dest_straight = haversine_m((toll_lat, toll_lon), dest_latlon)
+                    od_distance_straight = haversine_m(origin_latlon, dest_latlon)
                     
-                    # Validación básica: el peaje debe estar dentro del rango de la ruta
-                    if margin_start <= d_accumulated_m <= route_length_m - margin_end:
-                        # Validación adicional: verificar que el peaje esté en la dirección correcta
-                        is_valid = True
-                        
-                        if origin_latlon and dest_latlon:
-                            # Calcular distancia del peaje al origen y destino en línea recta
-                            dist_to_origin_straight = haversine_m((toll_lat, toll_lon), origin_latlon)
-                            dist_to_dest_straight = haversine_m((toll_lat, toll_lon), dest_latlon)
-                            od_distance_straight = haversine_m(origin_latlon, dest_latlon)
-                            
-                            # El peaje debe estar progresando hacia el destino
-                            progress_ratio = d_accumulated_m / route_length_m if route_length_m > 0 else 0
-                            
-                            # Validación 1: El peaje debe estar al menos a 1km del origen
-                            if d_accumulated_m < margin_start:
-                                is_valid = False
-                            
-                            # Validación 2: Verificar que el peaje esté en la dirección general correcta usando producto escalar
-                            # Calcular el vector desde el origen hasta el destino y desde el origen hasta el peaje
-                            lat0, lon0 = origin_latlon
-                            latd, lond = dest_latlon
-                            
-                            # Vector OD (origen -> destino)
-                            dx_od = lond - lon0
-                            dy_od = latd - lat0
-                            
-                            # Vector origen -> peaje
-                            dx_toll = toll_lon - lon0
-                            dy_toll = toll_lat - lat0
-                            
-                            # Producto escalar para verificar dirección
-                            dot_product = dx_od * dx_toll + dy_od * dy_toll
-                            
-                            # Si el producto escalar es negativo, el peaje está en dirección opuesta
-                            if dot_product <= 0:
-                                is_valid = False
-                            
-                            # Validación 3: El peaje debe estar progresando hacia el destino
-                            # Calcular el ratio de progreso en la ruta
-                            progress_ratio = d_accumulated_m / route_length_m if route_length_m > 0 else 0
-                            
-                            # Si el peaje está muy cerca del origen (< 7km) pero está después del 8% de la ruta,
-                            # probablemente está en otra carretera (como Los Curos que está en dirección San Gil)
-                            if dist_to_origin_straight < 7000.0 and progress_ratio > 0.08:
-                                # El peaje está muy cerca del origen pero avanzado en la ruta = otra carretera
-                                is_valid = False
-                            
-                            # Si está después del 20% de la ruta, debe estar más cerca del destino que del origen
-                            # (ajustado para permitir peajes como Lebrija que están al inicio pero en la dirección correcta)
-                            if progress_ratio > 0.20:
-                                if dist_to_dest_straight >= dist_to_origin_straight:
-                                    # Si el peaje está más cerca del origen que del destino después del 20%, está en dirección opuesta
-                                    is_valid = False
-                            
-                            # Validación 4: El peaje debe estar dentro del 99.9% de la ruta (ajustado para incluir peajes cerca del destino como La Lizama)
-                            # Esta validación es redundante con el margen final, pero la mantenemos como seguridad adicional
-                            if d_accumulated_m > route_length_m * 0.999:
-                                is_valid = False
-                        
-                        if is_valid:
-                            peajes_en_ruta.append({
-                                'id': toll.get('id'),
-                                'name': toll.get('name'),
-                                'fare_cop': toll.get('fare_cop', 0),
-                                'department': toll.get('department'),
-                                'operator': toll.get('operator'),
-                                'latitude': toll_lat,
-                                'longitude': toll_lon,
-                                'distance_from_route_km': round(d_perp_m / 1000.0, 3),  # Distancia perpendicular
-                                'position_along_route_km': round(d_accumulated_m / 1000.0, 3)  # Posición en la ruta
-                            })
-            except (ValueError, TypeError, KeyError) as e:
-                # Si hay error procesando este peaje, continuar con el siguiente
-                continue
+                    # El peaje debe estar progresando hacia el destino
+                    progress_ratio = d_accumulated_m / route_length_m if route_length_m > 0 else 0
+                    
+                    # Validación 1: El peaje debe estar al menos a 1km del origen
+                    if d_accumulated_m < margin_start:
+                        is_valid = False
+                    
+                    # Validación 2: Verificar que el peaje esté en la dirección general correcta usando producto escalar
+                    # Calcular el vector desde el origen hasta el destino y desde el origen hasta el peaje
+                    lat0, lon0 = origin_latlon
+                    latd, lond = dest_latlon
+                    
+                    # Vector OD (origen -> destino)
+                    dx_od = lond - lon0
+                    dy_od = latd - lat0
+                    
+                    # Vector origen -> peaje
+                    dx_toll = toll_lon - lon0
+                    dy_toll = toll_lat - lat0
+                    
+                    # Producto escalar para verificar dirección
+                    dot_product = dx_od * dx_toll + dy_od * dy_toll
+                    
+                    # Si el producto escalar es negativo, el peaje está en dirección opuesta
+                    if dot_product <= 0:
+                        is_valid = False
+                    
+                    # Validación 3: El peaje debe estar progresando hacia el destino
+                    # Calcular el ratio de progreso en la ruta
+                    progress_ratio = d_accumulated_m / route_length_m if route_length_m > 0 else 0
+                    
+                    # Si el peaje está muy cerca del origen (< 7km) pero está después del 8% de la ruta,
+                    # probablemente está en otra carretera (como Los Curos que está en dirección San Gil)
+                    if dist_to_origin_straight < 7000.0 and progress_ratio > 0.08:
+                        # El peaje está muy cerca del origen pero avanzado en la ruta = otra carretera
+                        is_valid = False
+                    
+                    # Si está después del 20% de la ruta, debe estar más cerca del destino que del origen
+                    # (ajustado para permitir peajes como Lebrija que están al inicio pero en la dirección correcta)
+                    if progress_ratio > 0.20:
+                        if dist_to_dest_straight >= dist_to_origin_straight:
+                            # Si el peaje está más cerca del origen que del destino después del 20%, está en dirección opuesta
+                            is_valid = False
+                    
+                    # Validación 4: El peaje debe estar dentro del 99.9% de la ruta (ajustado para incluir peajes cerca del destino como La Lizama)
+                    # Esta validación es redundante con el margen final, pero la mantenemos como seguridad adicional
+                    if d_accumulated_m > route_length_m * 0.999:
+                        is_valid = False
+                
+                if is_valid:
+                    peajes_en_ruta.append({
+                        'id': toll.id,
+                        'name': toll.name,
+                        'fare_cop': toll.fare_cop,
+                        'department': toll.department,
+                        'operator': toll.operator,
+                        'latitude': toll_lat,
+                        'longitude': toll_lon,
+                        'distance_from_route_km': round(d_perp_m / 1000.0, 3),  # Distancia perpendicular
+                        'position_along_route_km': round(d_accumulated_m / 1000.0, 3)  # Posición en la ruta
+                    })
+        except (ValueError, TypeError, KeyError) as e:
+            # Si hay error procesando este peaje, continuar con el siguiente
+            continue
     
     # Ordenar por posición en la ruta (distancia acumulada desde el origen)
     peajes_en_ruta.sort(key=lambda x: x['position_along_route_km'])
     
     costo_total = sum(p['fare_cop'] for p in peajes_en_ruta)
     
-    return {
+    resultado = {
         'peajes_en_ruta': peajes_en_ruta,
         'costo_total_cop': int(costo_total),
         'count': len(peajes_en_ruta)
     }
+    
+    simplificacion = matches.route.simplification_stats()
+    if simplificacion:
+        resultado['simplificacion'] = simplificacion
+    
+    return resultado
 
 def _detectar_departamentos_en_ruta(ruta_coords: List[List[float]], max_points: int = 10) -> Set[str]:
     """
@@ -408,16 +1206,16 @@ def _detectar_departamentos_en_ruta(ruta_coords: List[List[float]], max_points:
     for lat, lon in points_to_check[:max_points]:
         try:
             # Geocoding inverso usando Nominatim
-            url = "https://nominatim.openstreetmap.org/reverse"
             params = {
                 'lat': lat,
                 'lon': lon,
                 'format': 'json',
                 'addressdetails': 1
             }
-            headers = {'User-Agent': 'BiaTrack/1.0'}
             
-            response = requests.get(url, params=params, headers=headers, timeout=5)
+            # Rate limiting de Nominatim compartido con el geocoding (prioridad de cálculo de ruta)
+            NOMINATIM_LIMITER.acquire(PRIORITY_HIGH)
+            response = http_client.get('nominatim', '/reverse', params=params, timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 address = data.get('address', {})
@@ -435,8 +1233,6 @@ def _detectar_departamentos_en_ruta(ruta_coords: List[List[float]], max_points:
                     dept_normalized = _normalizar_departamento(dept)
                     if dept_normalized:
                         departments.add(dept_normalized)
-            
-            time.sleep(1)  # Rate limiting de Nominatim
         except Exception:
             continue
     
@@ -0,0 +1,57 @@
+"""
+Índice espacial de peajes
+Grilla uniforme sobre lat/lon para descartar peajes lejanos a una ruta
+antes de la prueba exacta de distancia
+"""
+
+import math
+from typing import Dict, Iterable, List, Tuple
+
+DEFAULT_CELL_DEG = 0.05  # ~5.5 km por celda en Colombia
+
+
+class TollGridIndex:
+    """
+    Grilla uniforme (celdas de cell_deg x cell_deg grados) con los peajes
+    activos que tienen coordenadas. Se construye una vez al cargar los peajes
+    y por cada ruta solo devuelve los peajes de las celdas que tocan las cajas
+    del corredor de la ruta (ya ampliadas por el umbral).
+    """
+
+    def __init__(self, points: Iterable[Tuple[int, float, float]], cell_deg: float = DEFAULT_CELL_DEG):
+        """
+        Args:
+            points: Iterable de (indice_en_tolls_db, lat, lon)
+            cell_deg: Tamaño de celda en grados
+        """
+        self.cell_deg = cell_deg
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.size = 0
+        for idx, lat, lon in points:
+            self.cells.setdefault(self._cell(lat, lon), []).append(idx)
+            self.size += 1
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg)))
+
+    def candidates_for_boxes(self, boxes: Iterable[Tuple[float, float, float, float]]) -> List[int]:
+        """
+        Devuelve los índices (ordenados) de los peajes en las celdas que tocan las cajas
+        (min_lat, max_lat, min_lon, max_lon), p. ej. los tramos ya ampliados del corredor de una ruta
+        """
+        cell = self.cell_deg
+        visited = set()
+        found = []
+        for min_lat, max_lat, min_lon, max_lon in boxes:
+            for i in range(int(math.floor(min_lat / cell)), int(math.floor(max_lat / cell)) + 1):
+                for j in range(int(math.floor(min_lon / cell)), int(math.floor(max_lon / cell)) + 1):
+                    key = (i, j)
+                    if key in visited:
+                        continue
+                    visited.add(key)
+                    bucket = self.cells.get(key)
+                    if bucket:
+                        found.extend(bucket)
+        found.sort()
+        return found
+